@@ -1,42 +1,280 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, has_app_context
 import os
 import requests
 import grpc
 import jwt
 import post_service_pb2
 import post_service_pb2_grpc
+import io
 import json
-from datetime import datetime
+import math
+import zlib
+from urllib.parse import unquote_to_bytes
+from profile_cache import ProfileCache
+from grpc_pool import ChannelPool
+from deadline import Deadline, DeadlineExceeded, request_budget
+from hedging import Hedger
+from rate_limit import RateLimiter, RateLimited, create_bucket_store
+from etags import post_etag, listing_etag
+from singleflight import SingleFlight
+from serializers import POST_FIELDS, dumps, post_json, listing_json, batch_json, follows_json
+from google.protobuf.field_mask_pb2 import FieldMask
+from compression import COMPRESSIBLE_TYPES, choose_encoding, compress
+from http_pool import HOP_BY_HOP_HEADERS, create_upstream_session, request_body, iter_response
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'default_secret_key')
+# Токены инвалидации от User Service: своя аудитория и короткий срок жизни. Для входа они не годятся:
+# jwt.decode без audience отклоняет любой токен с aud
+PROFILE_INVALIDATION_AUDIENCE = 'api_gateway:profile-cache'
 
 SERVICES = {
     "user": os.environ.get("USER_SERVICE_URL", "http://user_service:5001"),
     "post": os.environ.get("POST_SERVICE_URL", "post_service:50051")
 }
 
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "10"))
+REQUEST_TIMEOUT_MAX = float(os.environ.get("REQUEST_TIMEOUT_MAX", "30"))
+HEDGING_ENABLED = os.environ.get("POST_SERVICE_HEDGING", "false").lower() in ("1", "true", "yes")
+HEDGE_DELAY = float(os.environ.get("POST_SERVICE_HEDGE_DELAY", "0.05"))
+
+PROXY_CHUNK_SIZE = int(os.environ.get("PROXY_CHUNK_SIZE", "65536"))
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+
+upstream_session = create_upstream_session(
+    pool_maxsize=int(os.environ.get("UPSTREAM_POOL_MAXSIZE", "50"))
+)
+
+TOTAL_MODES = {
+    'exact': post_service_pb2.TOTAL_EXACT,
+    'estimated': post_service_pb2.TOTAL_ESTIMATED,
+    'none': post_service_pb2.TOTAL_NONE
+}
+
+TAG_MATCHES = {
+    'any': post_service_pb2.TAG_MATCH_ANY,
+    'all': post_service_pb2.TAG_MATCH_ALL
+}
+
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "20"))
+BATCH_DEADLINE = float(os.environ.get("BATCH_DEADLINE", "5"))
+
+# Общий ограниченный пул: один батч не может занять больше потоков, чем в нём есть
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("BATCH_MAX_WORKERS", "32")),
+    thread_name_prefix="batch"
+)
+
+rate_limiter = RateLimiter(
+    create_bucket_store(os.environ.get("RATE_LIMIT_STORE", "memory")),
+    user_rate=float(os.environ.get("RATE_LIMIT_USER_RATE", "20")),
+    user_burst=float(os.environ.get("RATE_LIMIT_USER_BURST", "40")),
+    route_rate=float(os.environ.get("RATE_LIMIT_ROUTE_RATE", "1000")),
+    route_burst=float(os.environ.get("RATE_LIMIT_ROUTE_BURST", "2000")),
+    max_queue_depth=int(os.environ.get("POST_SERVICE_MAX_QUEUE_DEPTH", "200")),
+    user_concurrency=int(os.environ.get("RATE_LIMIT_USER_CONCURRENCY", "2"))
+)
+
+profile_cache = ProfileCache(
+    maxsize=int(os.environ.get("PROFILE_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("PROFILE_CACHE_TTL", "60"))
+)
+
+post_service_pool = None
+post_service_pool_lock = threading.Lock()
+
+def get_post_service_pool():
+    global post_service_pool
+    if post_service_pool is None:
+        with post_service_pool_lock:
+            if post_service_pool is None:
+                pool = ChannelPool(
+                    [address.strip() for address in SERVICES["post"].split(',') if address.strip()],
+                    post_service_pb2_grpc.PostServiceStub,
+                    policy=os.environ.get("POST_SERVICE_LB_POLICY", "round_robin"),
+                    service_name="post.PostService",
+                    health_check_interval=float(os.environ.get("POST_SERVICE_HEALTH_CHECK_INTERVAL", "5"))
+                )
+                pool.start_health_checks()
+                post_service_pool = pool
+    return post_service_pool
+
 def get_post_service_stub():
-    channel = grpc.insecure_channel(SERVICES["post"])
-    return post_service_pb2_grpc.PostServiceStub(channel)
+    return get_post_service_pool().stub()
+
+hedger = None
+
+def get_hedger():
+    global hedger
+    if hedger is None:
+        with post_service_pool_lock:
+            if hedger is None:
+                hedger = Hedger(get_post_service_pool(), default_delay=HEDGE_DELAY)
+    return hedger
+
+@app.before_request
+def start_deadline():
+    g.deadline = Deadline(request_budget(
+        request.headers.get('X-Request-Timeout'),
+        REQUEST_TIMEOUT,
+        REQUEST_TIMEOUT_MAX
+    ))
+
+def request_timeout():
+    deadline = g.get('deadline') if has_app_context() else None
+    if deadline is None:
+        return REQUEST_TIMEOUT
+    return deadline.timeout()
+
+@app.before_request
+def admission_control():
+    if request.url_rule is None or request.path.startswith('/internal/') or 'user_data' in g:
+        return
+    rate_limiter.check_rejected(request.headers.get('Authorization'))
+    if post_service_pool is not None:
+        rate_limiter.check_queue_depth(post_service_pool.outstanding())
+    rate_limiter.check_route(f'{request.method} {request.url_rule.rule}')
+
+@app.errorhandler(RateLimited)
+def handle_rate_limited(e):
+    response = jsonify({'error': e.reason})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response
+
+@app.errorhandler(DeadlineExceeded)
+@app.errorhandler(requests.Timeout)
+def handle_deadline_exceeded(e):
+    return jsonify({'error': 'Request deadline exceeded'}), 504
+
+def read_post_service(stub, method_name, grpc_request):
+    # Идемпотентные чтения можно дублировать на другой бэкенд, если ответ задерживается дольше p95
+    if HEDGING_ENABLED:
+        return get_hedger().call(method_name, grpc_request, request_timeout())
+    return getattr(stub, method_name)(grpc_request, timeout=request_timeout())
+
+post_reads = SingleFlight()
+
+def rpc_code(error):
+    # У ошибок grpc код доступен через code(), у созданных вручную - в _code
+    code = getattr(error, 'code', None)
+    return code() if callable(code) else getattr(error, '_code', None)
+
+def post_read_key(grpc_request):
+    # Ответы с разными масками полей различаются: схлопываются только одинаковые запросы
+    return grpc_request.post_id, tuple(grpc_request.read_mask.paths)
+
+# Исход общего чтения, который зависит от того, кто его выполнял, а не от поста
+CALLER_BOUND_CODES = (grpc.StatusCode.PERMISSION_DENIED, grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.CANCELLED)
+
+def caller_bound(post):
+    # Отказ получен для другого пользователя, а этот может оказаться автором поста.
+    # Дедлайн ведущего задаёт любой клиент через X-Request-Timeout: его истечение
+    # или отмена не значат, что у этого клиента кончился собственный бюджет
+    if isinstance(post, DeadlineExceeded):
+        return True
+    return isinstance(post, grpc.RpcError) and rpc_code(post) in CALLER_BOUND_CODES
+
+def fetch_post(stub, grpc_request):
+    def load():
+        try:
+            return read_post_service(stub, 'GetPost', grpc_request)
+        except (grpc.RpcError, DeadlineExceeded) as e:
+            return e
+
+    # Одновременные чтения одного поста схлопываются в один вызов GetPost
+    try:
+        post, shared = post_reads.do(post_read_key(grpc_request), load, timeout=request_timeout())
+    except TimeoutError:
+        raise DeadlineExceeded()
+
+    if shared and caller_bound(post):
+        # Повтор со своим бюджетом
+        post = read_post_service(stub, 'GetPost', grpc_request)
+    if isinstance(post, (grpc.RpcError, DeadlineExceeded)):
+        raise post
+    if shared and post.is_private and post.creator_id != grpc_request.user_id:
+        return None
+    return post
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # Ответ зависит от пользователя: кэшировать только на клиенте и всегда перепроверять
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag):
+    return with_etag(Response(status=304), etag)
+
+def json_response(body, status=200):
+    return Response(body, status=status, mimetype='application/json')
+
+@app.after_request
+def compress_response(response):
+    # Подзапросы /batch читаются самим шлюзом, а проксируемые ответы уже идут потоком
+    if 'user_data' in g or response.direct_passthrough or response.is_streamed:
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if response.content_length is None or response.content_length < COMPRESSION_MIN_SIZE:
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # Сжатое представление не побайтно равно исходному
+        response.set_etag(etag, weak=True)
+    return response
+
+def admit_user(user_data, token):
+    rate_limiter.check_user(user_data['id'], credential=token)
+    if 'user_slot' not in g and rate_limiter.enter_user(user_data['id']):
+        g.user_slot = user_data['id']
+
+@app.teardown_request
+def release_user_slot(exc):
+    user_id = g.pop('user_slot', None)
+    if user_id is not None:
+        rate_limiter.leave_user(user_id)
 
 def authenticate_user(request):
+    if 'user_data' in g:
+        # Подзапрос /batch: пользователь уже аутентифицирован
+        return g.user_data, None, None
+
     token = request.headers.get('Authorization')
     if not token:
         return None, {'error': 'Authentication token is missing'}, 401
     
     try:
         payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+
+        subject = payload.get('username')
+        user_data = profile_cache.get(subject)
+        if user_data is not None:
+            admit_user(user_data, token)
+            return user_data, None, None
         
-        user_response = requests.get(
+        user_response = upstream_session.get(
             f"{SERVICES['user']}/profile",
-            headers={"Authorization": token}
+            headers={"Authorization": token},
+            timeout=request_timeout()
         )
         
         if user_response.status_code != 200:
             return None, {'error': 'Failed to validate user'}, 401
         
         user_data = user_response.json()
+        profile_cache.set(subject, user_data)
+        admit_user(user_data, token)
         return user_data, None, None
     
     except jwt.ExpiredSignatureError:
@@ -44,29 +282,69 @@ def authenticate_user(request):
     except jwt.InvalidTokenError:
         return None, {'error': 'Invalid token'}, 401
 
+@app.route('/internal/profile-cache/invalidate', methods=['POST'])
+def invalidate_profile_cache():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({'error': 'Authentication token is missing'}), 401
+
+    try:
+        payload = jwt.decode(
+            token, app.config['SECRET_KEY'], algorithms=['HS256'],
+            audience=PROFILE_INVALIDATION_AUDIENCE, options={'require': ['exp', 'aud']}
+        )
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Invalid token'}), 401
+
+    if payload.get('action') != 'invalidate_profile' or not payload.get('username'):
+        return jsonify({'error': 'Invalid invalidation request'}), 400
+
+    invalidated = profile_cache.invalidate(payload['username'])
+    return jsonify({'invalidated': invalidated}), 200
+
+@app.route('/internal/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        'profile_cache': profile_cache.stats(),
+        'post_reads': post_reads.stats(),
+        'hedging': hedger.stats() if hedger is not None else None,
+        'rate_limit': rate_limiter.stats(),
+        'post_service': post_service_pool.stats() if post_service_pool is not None else None
+    }), 200
+
 @app.route('/user/<path:path>', methods=['POST', 'GET', 'PUT', 'DELETE', 'PATCH'])
 def proxy_user_service(path):
     url = f'{SERVICES["user"]}/{path}'
-    headers = {key: value for key, value in request.headers if key.lower() != 'host'}
+    headers = {key: value for key, value in request.headers if key.lower() not in HOP_BY_HOP_HEADERS}
 
-    json_data = None
-    if request.method in ['POST', 'PUT', 'PATCH'] and request.is_json:
-        json_data = request.get_json()
-    
-    response = requests.request(
+    body = request_body(
+        request.stream,
+        request.content_length,
+        request.headers.get('Transfer-Encoding', '').lower() == 'chunked',
+        PROXY_CHUNK_SIZE
+    )
+
+    response = upstream_session.request(
         method=request.method,
         url=url,
         headers=headers,
-        json=json_data,
-        params=request.args
+        data=body,
+        params=list(request.args.items(multi=True)),
+        stream=True,
+        timeout=request_timeout()
     )
 
     resp_headers = {
         key: value for key, value in response.headers.items()
         if key.lower() in ['content-type', 'content-length', 'content-encoding']
     }
-    
-    return response.content, response.status_code, resp_headers
+
+    return Response(
+        iter_response(response, PROXY_CHUNK_SIZE),
+        status=response.status_code,
+        headers=resp_headers,
+        direct_passthrough=True
+    )
 
 @app.route('/posts', methods=['POST'])
 def create_post():
@@ -91,25 +369,15 @@ def create_post():
             tags=data.get('tags', [])
         )
         
-        response = stub.CreatePost(grpc_request)
-        
-        post_data = {
-            'id': response.id,
-            'title': response.title,
-            'description': response.description,
-            'creator_id': response.creator_id,
-            'created_at': response.created_at,
-            'updated_at': response.updated_at,
-            'is_private': response.is_private,
-            'tags': list(response.tags)
-        }
-        
-        return jsonify(post_data), 201
+        response = stub.CreatePost(grpc_request, timeout=request_timeout())
+        return json_response(post_json(response), 201)
     
     except grpc.RpcError as e:
         status_code = e.code()
         
-        if status_code == grpc.StatusCode.INTERNAL:
+        if status_code == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
+        elif status_code == grpc.StatusCode.INTERNAL:
             return jsonify({'error': 'Internal server error'}), 500
         elif status_code == grpc.StatusCode.INVALID_ARGUMENT:
             return jsonify({'error': str(e.details())}), 400
@@ -122,36 +390,40 @@ def get_post(post_id):
     user_data, error, status_code = authenticate_user(request)
     if error:
         return jsonify(error), status_code
+
+    fields = parse_fields(request.args.getlist('fields'))
+    if fields is None:
+        return jsonify({'error': FIELDS_ERROR}), 400
     
     try:
         stub = get_post_service_stub()
         grpc_request = post_service_pb2.GetPostRequest(
             post_id=post_id,
-            user_id=user_data['id']
+            user_id=user_data['id'],
+            # updated_at нужен для ETag, даже если клиент его не просил
+            read_mask=read_mask(fields, 'updated_at')
         )
+
+        if request.if_none_match:
+            version = stub.GetPostVersion(grpc_request, timeout=request_timeout())
+            etag = post_etag(version.post_id, version.updated_at)
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag)
         
-        response = stub.GetPost(grpc_request)
-        
-        post_data = {
-            'id': response.id,
-            'title': response.title,
-            'description': response.description,
-            'creator_id': response.creator_id,
-            'created_at': response.created_at,
-            'updated_at': response.updated_at,
-            'is_private': response.is_private,
-            'tags': list(response.tags)
-        }
-        
-        return jsonify(post_data), 200
+        response = fetch_post(stub, grpc_request)
+        if response is None:
+            return jsonify({'error': 'You do not have permission to view this post'}), 403
+        return with_etag(json_response(post_json(response, fields)), post_etag(response.id, response.updated_at))
     
     except grpc.RpcError as e:
-        status_code = e._code
+        status_code = rpc_code(e)
         
         if status_code == grpc.StatusCode.NOT_FOUND:
             return jsonify({'error': 'Post not found'}), 404
         elif status_code == grpc.StatusCode.PERMISSION_DENIED:
             return jsonify({'error': 'You do not have permission to view this post'}), 403
+        elif status_code == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
         else:
             error_details = str(e)
             return jsonify({'error': error_details}), 500
@@ -175,20 +447,8 @@ def update_post(post_id):
             tags=data.get('tags', [])
         )
         
-        response = stub.UpdatePost(grpc_request)
-        
-        post_data = {
-            'id': response.id,
-            'title': response.title,
-            'description': response.description,
-            'creator_id': response.creator_id,
-            'created_at': response.created_at,
-            'updated_at': response.updated_at,
-            'is_private': response.is_private,
-            'tags': list(response.tags)
-        }
-        
-        return jsonify(post_data), 200
+        response = stub.UpdatePost(grpc_request, timeout=request_timeout())
+        return json_response(post_json(response))
     
     except grpc.RpcError as e:
         status_code = e.code()
@@ -197,6 +457,8 @@ def update_post(post_id):
             return jsonify({'error': 'Post not found'}), 404
         elif status_code == grpc.StatusCode.PERMISSION_DENIED:
             return jsonify({'error': 'You do not have permission to update this post'}), 403
+        elif status_code == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
         else:
             return jsonify({'error': str(e.details())}), 500
 
@@ -214,7 +476,7 @@ def delete_post(post_id):
             user_id=user_data['id']
         )
 
-        response = stub.DeletePost(grpc_request)
+        response = stub.DeletePost(grpc_request, timeout=request_timeout())
 
         return jsonify({
             'success': response.success,
@@ -228,6 +490,8 @@ def delete_post(post_id):
             return jsonify({'error': 'Post not found'}), 404
         elif status_code == grpc.StatusCode.PERMISSION_DENIED:
             return jsonify({'error': 'You do not have permission to delete this post'}), 403
+        elif status_code == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
         else:
             return jsonify({'error': str(e.details())}), 500
 
@@ -238,42 +502,381 @@ def list_posts():
     if error:
         return jsonify(error), status_code
 
+    fields = parse_fields(request.args.getlist('fields'))
+    if fields is None:
+        return jsonify({'error': FIELDS_ERROR}), 400
+
+    ids = request.args.getlist('ids')
+    if ids:
+        return batch_get_posts(user_data, ids, fields)
+
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
+    page_token = request.args.get('page_token', '')
+    tags = request.args.getlist('tag')
+    if tags:
+        return list_posts_by_tag(user_data, tags, per_page, page_token, fields)
+
+    total_mode = TOTAL_MODES.get(request.args.get('total', 'exact'))
+    if total_mode is None:
+        return jsonify({'error': f"total must be one of: {', '.join(TOTAL_MODES)}"}), 400
     
     try:
         stub = get_post_service_stub()
         grpc_request = post_service_pb2.ListPostsRequest(
             page=page,
             per_page=per_page,
-            user_id=user_data['id']
+            user_id=user_data['id'],
+            page_token=page_token,
+            total_mode=total_mode,
+            read_mask=read_mask(fields)
         )
 
-        response = stub.ListPosts(grpc_request)
-
-        posts = []
-        for post in response.posts:
-            posts.append({
-                'id': post.id,
-                'title': post.title,
-                'description': post.description,
-                'creator_id': post.creator_id,
-                'created_at': post.created_at,
-                'updated_at': post.updated_at,
-                'is_private': post.is_private,
-                'tags': list(post.tags)
-            })
-        
-        return jsonify({
-            'posts': posts,
-            'total': response.total,
-            'page': response.page,
-            'per_page': response.per_page
-        }), 200
+        if request.if_none_match:
+            version = stub.GetListingVersion(grpc_request, timeout=request_timeout())
+            etag = listing_etag(user_data['id'], page_token or page, per_page, version.version)
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag)
+
+        response = read_post_service(stub, 'ListPosts', grpc_request)
+
+        if not response.version:
+            # Без total сервис не читает счётчики и версии списка не знает
+            return json_response(listing_json(response, fields))
+        return with_etag(json_response(listing_json(response, fields)),
+                         listing_etag(user_data['id'], page_token or page, per_page, response.version))
     
     except grpc.RpcError as e:
+        if rpc_code(e) == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
+        if rpc_code(e) == grpc.StatusCode.INVALID_ARGUMENT:
+            return jsonify({'error': str(e.details())}), 400
+        return jsonify({'error': str(e.details())}), 500
+
+
+def list_posts_by_tag(user_data, tags, per_page, page_token, fields=None):
+    # Маска только сокращает JSON: ListPostsByTag читает посты целиком
+    match = TAG_MATCHES.get(request.args.get('match', 'any'))
+    if match is None:
+        return jsonify({'error': f"match must be one of: {', '.join(TAG_MATCHES)}"}), 400
+
+    try:
+        stub = get_post_service_stub()
+        grpc_request = post_service_pb2.ListPostsByTagRequest(
+            tags=tags,
+            match=match,
+            per_page=per_page,
+            user_id=user_data['id'],
+            page_token=page_token
+        )
+
+        response = read_post_service(stub, 'ListPostsByTag', grpc_request)
+
+        return json_response(listing_json(response, fields))
+
+    except grpc.RpcError as e:
+        if rpc_code(e) == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
+        if rpc_code(e) == grpc.StatusCode.INVALID_ARGUMENT:
+            return jsonify({'error': str(e.details())}), 400
         return jsonify({'error': str(e.details())}), 500
 
 
+def parse_fields(values):
+    # fields=title,tags и fields=title&fields=tags равнозначны; без параметра - все поля.
+    # None - неизвестное поле
+    fields = sorted({value.strip() for part in values for value in part.split(',') if value.strip()})
+    if any(field not in POST_FIELDS for field in fields):
+        return None
+    return fields
+
+
+def read_mask(fields, *required):
+    # Пустая маска - все поля
+    if not fields:
+        return None
+    return FieldMask(paths=sorted(set(fields) | set(required)))
+
+
+FIELDS_ERROR = f"fields must be a comma-separated list of: {', '.join(POST_FIELDS)}"
+
+
+def parse_post_ids(values):
+    # ids=1,2,3 и ids=1&ids=2 равнозначны
+    try:
+        return [int(value) for part in values for value in part.split(',') if value.strip()]
+    except ValueError:
+        return None
+
+
+def batch_get_posts(user_data, ids, fields=None):
+    post_ids = parse_post_ids(ids)
+    if not post_ids:
+        return jsonify({'error': 'ids must be a comma-separated list of post ids'}), 400
+
+    try:
+        stub = get_post_service_stub()
+        grpc_request = post_service_pb2.BatchGetPostsRequest(
+            post_ids=post_ids,
+            user_id=user_data['id']
+        )
+
+        response = read_post_service(stub, 'BatchGetPosts', grpc_request)
+
+        return json_response(batch_json(response, fields))
+
+    except grpc.RpcError as e:
+        if rpc_code(e) == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
+        if rpc_code(e) == grpc.StatusCode.INVALID_ARGUMENT:
+            return jsonify({'error': str(e.details())}), 400
+        return jsonify({'error': str(e.details())}), 500
+
+
+@app.route('/posts/search', methods=['GET'])
+def search_posts():
+    user_data, error, status_code = authenticate_user(request)
+    if error:
+        return jsonify(error), status_code
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+
+    try:
+        stub = get_post_service_stub()
+        grpc_request = post_service_pb2.SearchPostsRequest(
+            query=query,
+            per_page=request.args.get('per_page', 10, type=int),
+            user_id=user_data['id'],
+            page_token=request.args.get('page_token', '')
+        )
+
+        response = read_post_service(stub, 'SearchPosts', grpc_request)
+
+        return json_response(listing_json(response))
+
+    except grpc.RpcError as e:
+        if rpc_code(e) == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
+        if rpc_code(e) == grpc.StatusCode.INVALID_ARGUMENT:
+            return jsonify({'error': str(e.details())}), 400
+        return jsonify({'error': str(e.details())}), 500
+
+
+@app.route('/timeline', methods=['GET'])
+def home_timeline():
+    user_data, error, status_code = authenticate_user(request)
+    if error:
+        return jsonify(error), status_code
+
+    fields = parse_fields(request.args.getlist('fields'))
+    if fields is None:
+        return jsonify({'error': FIELDS_ERROR}), 400
+
+    try:
+        stub = get_post_service_stub()
+        grpc_request = post_service_pb2.HomeTimelineRequest(
+            user_id=user_data['id'],
+            per_page=request.args.get('per_page', 10, type=int),
+            page_token=request.args.get('page_token', ''),
+            read_mask=read_mask(fields)
+        )
+
+        response = read_post_service(stub, 'HomeTimeline', grpc_request)
+
+        return json_response(listing_json(response, fields))
+
+    except grpc.RpcError as e:
+        if rpc_code(e) == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
+        if rpc_code(e) == grpc.StatusCode.INVALID_ARGUMENT:
+            return jsonify({'error': str(e.details())}), 400
+        return jsonify({'error': str(e.details())}), 500
+
+
+@app.route('/following/<int:user_id>', methods=['PUT', 'DELETE'])
+def change_follow(user_id):
+    user_data, error, status_code = authenticate_user(request)
+    if error:
+        return jsonify(error), status_code
+
+    # PUT и DELETE идемпотентны: повторный вызов возвращает тот же ответ с changed=false
+    following = request.method == 'PUT'
+    try:
+        stub = get_post_service_stub()
+        grpc_request = post_service_pb2.FollowRequest(follower_id=user_data['id'], followee_id=user_id)
+
+        method = stub.Follow if following else stub.Unfollow
+        response = method(grpc_request, timeout=request_timeout())
+
+        return jsonify({'user_id': user_id, 'following': following, 'changed': response.changed}), 200
+
+    except grpc.RpcError as e:
+        if rpc_code(e) == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
+        if rpc_code(e) == grpc.StatusCode.INVALID_ARGUMENT:
+            return jsonify({'error': str(e.details())}), 400
+        return jsonify({'error': str(e.details())}), 500
+
+
+@app.route('/following', methods=['GET'])
+def list_following():
+    return list_follows('ListFollowing')
+
+
+@app.route('/followers', methods=['GET'])
+def list_followers():
+    return list_follows('ListFollowers')
+
+
+def list_follows(method_name):
+    # Свои подписки по умолчанию, чужие - через user_id
+    user_data, error, status_code = authenticate_user(request)
+    if error:
+        return jsonify(error), status_code
+
+    try:
+        stub = get_post_service_stub()
+        grpc_request = post_service_pb2.ListFollowsRequest(
+            user_id=request.args.get('user_id', user_data['id'], type=int),
+            per_page=request.args.get('per_page', 20, type=int),
+            page_token=request.args.get('page_token', '')
+        )
+
+        response = read_post_service(stub, method_name, grpc_request)
+
+        return json_response(follows_json(response))
+
+    except grpc.RpcError as e:
+        if rpc_code(e) == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify({'error': 'Request deadline exceeded'}), 504
+        if rpc_code(e) == grpc.StatusCode.INVALID_ARGUMENT:
+            return jsonify({'error': str(e.details())}), 400
+        return jsonify({'error': str(e.details())}), 500
+
+
+# Ключи окружения WSGI, которые подзапрос /batch берёт у исходного запроса
+BATCH_ENVIRON_KEYS = (
+    'SERVER_NAME', 'SERVER_PORT', 'SERVER_PROTOCOL', 'SCRIPT_NAME', 'REMOTE_ADDR', 'REMOTE_PORT', 'HTTP_HOST',
+    'wsgi.version', 'wsgi.url_scheme', 'wsgi.errors', 'wsgi.multithread', 'wsgi.multiprocess', 'wsgi.run_once'
+)
+
+
+def parse_batch(data):
+    items = data.get('requests') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, 'requests must be a non-empty list'
+    if len(items) > BATCH_MAX_ITEMS:
+        return None, f'A batch can contain at most {BATCH_MAX_ITEMS} requests'
+    if not all(isinstance(item, dict) for item in items):
+        return None, 'Each request must be an object'
+    return items, None
+
+
+def batch_path_error(path):
+    if not isinstance(path, str) or not path.startswith('/'):
+        return 'Path must start with /'
+    if path.startswith('/batch') or path.startswith('/internal/'):
+        return f'Path {path} is not allowed in a batch'
+    return None
+
+
+def batch_body(data, mimetype, encoding=None):
+    # Ответ User Service проксируется как есть и может прийти сжатым
+    if encoding in ('gzip', 'deflate'):
+        data = zlib.decompress(data, zlib.MAX_WBITS | 32)
+    if mimetype == 'application/json':
+        try:
+            return json.loads(data)
+        except ValueError:
+            pass
+    return data.decode('utf-8', 'replace')
+
+
+def batch_environ(base, method, path, body, headers):
+    path, _, query = path.partition('?')
+    data = b'' if body is None else dumps(body)
+    environ = {key: base[key] for key in BATCH_ENVIRON_KEYS if key in base}
+    environ.update({
+        'REQUEST_METHOD': method,
+        # PATH_INFO в WSGI - байты пути, прочитанные как latin-1
+        'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json' if body is not None else '',
+        'CONTENT_LENGTH': str(len(data)),
+        'wsgi.input': io.BytesIO(data)
+    })
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+def run_batch_item(item, user_data, headers, base_environ):
+    item_id = item.get('id')
+    method = str(item.get('method', 'GET')).upper()
+    path = item.get('path')
+
+    error = batch_path_error(path)
+    if error:
+        return {'id': item_id, 'status': 400, 'body': {'error': error}}
+
+    try:
+        # Подзапрос проходит через тот же диспетчер Flask, что и обычный запрос, со своим окружением WSGI
+        with app.request_context(batch_environ(base_environ, method, path, item.get('body'), headers)):
+            g.user_data = user_data
+            response = app.full_dispatch_request()
+            try:
+                # Ответ прокси идёт потоком в direct_passthrough, get_data его не читает
+                if response.direct_passthrough or response.is_streamed:
+                    data = b''.join(response.response)
+                else:
+                    data = response.get_data()
+                body = batch_body(data, response.mimetype, response.headers.get('Content-Encoding'))
+                return {'id': item_id, 'status': response.status_code, 'body': body}
+            finally:
+                response.close()
+    except Exception as e:
+        return {'id': item_id, 'status': 500, 'body': {'error': str(e)}}
+
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    user_data, error, status_code = authenticate_user(request)
+    if error:
+        return jsonify(error), status_code
+
+    items, error = parse_batch(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+
+    # Первый токен уже списан при аутентификации, остальные подзапросы оплачиваются здесь
+    if len(items) > 1:
+        rate_limiter.check_user(user_data['id'], cost=len(items) - 1)
+
+    # Подзапросы получают остаток бюджета батча как собственный дедлайн
+    budget = min(BATCH_DEADLINE, g.deadline.remaining())
+    headers = {
+        'Authorization': request.headers.get('Authorization', ''),
+        'X-Request-Timeout': str(budget)
+    }
+    futures = [batch_executor.submit(run_batch_item, item, user_data, headers, dict(request.environ)) for item in items]
+    done, _ = wait(futures, timeout=budget)
+
+    responses = []
+    for item, future in zip(items, futures):
+        if future in done:
+            responses.append(future.result())
+        else:
+            future.cancel()
+            responses.append({'id': item.get('id'), 'status': 504, 'body': {'error': 'Batch deadline exceeded'}})
+
+    return jsonify({'responses': responses}), 200
+
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    if os.environ.get('GATEWAY_MODE', 'sync') == 'async':
+        import async_app
+        async_app.main()
+    else:
+        app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,801 @@
+import asyncio
+import functools
+import math
+import os
+import aiohttp
+import grpc
+import grpc.aio
+import jwt
+from aiohttp import StreamReader, web
+from aiohttp.test_utils import make_mocked_request
+from aiohttp.helpers import ETag
+import post_service_pb2
+import post_service_pb2_grpc
+from app import (
+    SERVICES, PROXY_CHUNK_SIZE, COMPRESSION_MIN_SIZE, REQUEST_TIMEOUT, REQUEST_TIMEOUT_MAX, HEDGING_ENABLED, HEDGE_DELAY,
+    TOTAL_MODES, TAG_MATCHES, FIELDS_ERROR, parse_post_ids, parse_fields, read_mask, post_read_key, caller_bound, profile_cache,
+    rate_limiter, PROFILE_INVALIDATION_AUDIENCE, BATCH_DEADLINE, parse_batch, batch_path_error, batch_body,
+    app as flask_app
+)
+from deadline import Deadline, DeadlineExceeded, request_budget
+from hedging import Hedger
+from rate_limit import RateLimited
+from etags import post_etag, listing_etag
+from grpc_pool import ChannelPool
+from singleflight import AsyncSingleFlight
+from http_pool import HOP_BY_HOP_HEADERS
+from serializers import dumps, post_json, listing_json, batch_json, follows_json
+from compression import COMPRESSIBLE_TYPES, choose_encoding, compress
+
+SECRET_KEY = flask_app.config['SECRET_KEY']
+
+http_session_key = web.AppKey('http_session', aiohttp.ClientSession)
+post_service_pool_key = web.AppKey('post_service_pool', ChannelPool)
+hedger_key = web.AppKey('hedger', Hedger)
+
+
+def get_post_service_stub(request):
+    return request.app[post_service_pool_key].stub()
+
+
+@web.middleware
+async def deadline_middleware(request, handler):
+    request['deadline'] = Deadline(request_budget(
+        request.headers.get('X-Request-Timeout'),
+        REQUEST_TIMEOUT,
+        REQUEST_TIMEOUT_MAX
+    ))
+    try:
+        return await handler(request)
+    except (DeadlineExceeded, asyncio.TimeoutError):
+        return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+
+
+@web.middleware
+async def admission_control_middleware(request, handler):
+    route = request.match_info.route.resource
+    # Подзапросы /batch уже оплачены самим батчем
+    if route is None or request.path.startswith('/internal/') or 'user_data' in request:
+        return await handler(request)
+    try:
+        rate_limiter.check_rejected(request.headers.get('Authorization'))
+        rate_limiter.check_queue_depth(request.app[post_service_pool_key].outstanding())
+        rate_limiter.check_route(f'{request.method} {route.canonical}')
+        return await handler(request)
+    except RateLimited as e:
+        return web.json_response(
+            {'error': e.reason},
+            status=e.status,
+            headers={'Retry-After': str(max(1, math.ceil(e.retry_after)))}
+        )
+    finally:
+        # Слот, занятый в authenticate_user
+        if 'user_slot' in request:
+            rate_limiter.leave_user(request['user_slot'])
+
+
+@web.middleware
+async def compression_middleware(request, handler):
+    response = await handler(request)
+    # Подзапросы /batch читает сам батч
+    if 'user_data' in request:
+        return response
+    if not isinstance(response, web.Response) or response.content_type not in COMPRESSIBLE_TYPES:
+        return response
+    if 'Content-Encoding' in response.headers or response.body is None:
+        return response
+
+    response.headers.add('Vary', 'Accept-Encoding')
+    if len(response.body) < COMPRESSION_MIN_SIZE:
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+
+    response.body = compress(response.body, encoding)
+    response.headers['Content-Encoding'] = encoding
+    etag = response.etag
+    if etag is not None and not etag.is_weak:
+        response.etag = ETag(value=etag.value, is_weak=True)
+    return response
+
+
+def request_timeout(request):
+    return request['deadline'].timeout()
+
+
+async def read_post_service(request, stub, method_name, grpc_request):
+    if HEDGING_ENABLED:
+        return await request.app[hedger_key].call_async(method_name, grpc_request, request_timeout(request))
+    return await getattr(stub, method_name)(grpc_request, timeout=request_timeout(request))
+
+
+post_reads = AsyncSingleFlight()
+
+
+async def fetch_post(request, stub, grpc_request):
+    async def load():
+        try:
+            return await read_post_service(request, stub, 'GetPost', grpc_request)
+        except (grpc.RpcError, DeadlineExceeded, asyncio.TimeoutError) as e:
+            return e
+
+    # Общий вызов идёт отдельной задачей: wait_for по дедлайну этого клиента отменяет только его ожидание
+    post, shared = await asyncio.wait_for(
+        post_reads.do(post_read_key(grpc_request), load),
+        timeout=request_timeout(request)
+    )
+
+    if shared and (caller_bound(post) or isinstance(post, asyncio.TimeoutError)):
+        # Чужой отказ, дедлайн или отмена: повтор со своим бюджетом
+        post = await read_post_service(request, stub, 'GetPost', grpc_request)
+    if isinstance(post, (grpc.RpcError, DeadlineExceeded, asyncio.TimeoutError)):
+        raise post
+    if shared and post.is_private and post.creator_id != grpc_request.user_id:
+        return None
+    return post
+
+
+def json_response(body, status=200):
+    return web.Response(body=body, status=status, content_type='application/json')
+
+
+def etag_matches(request, etag):
+    return any(tag.value in (etag, '*') for tag in request.if_none_match or ())
+
+
+def with_etag(response, etag):
+    response.etag = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(etag):
+    return with_etag(web.Response(status=304), etag)
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text='Failed to decode JSON object')
+
+
+def admit_user(request, user_data, token):
+    rate_limiter.check_user(user_data['id'], credential=token)
+    if 'user_slot' not in request and rate_limiter.enter_user(user_data['id']):
+        request['user_slot'] = user_data['id']
+
+
+async def authenticate_user(request):
+    if 'user_data' in request:
+        # Подзапрос /batch: пользователь уже аутентифицирован
+        return request['user_data'], None, None
+
+    token = request.headers.get('Authorization')
+    if not token:
+        return None, {'error': 'Authentication token is missing'}, 401
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+
+        subject = payload.get('username')
+        user_data = profile_cache.get(subject)
+        if user_data is not None:
+            admit_user(request, user_data, token)
+            return user_data, None, None
+
+        async with request.app[http_session_key].get(
+            f"{SERVICES['user']}/profile",
+            headers={"Authorization": token},
+            timeout=aiohttp.ClientTimeout(total=request_timeout(request))
+        ) as user_response:
+            if user_response.status != 200:
+                return None, {'error': 'Failed to validate user'}, 401
+            user_data = await user_response.json()
+
+        profile_cache.set(subject, user_data)
+        admit_user(request, user_data, token)
+        return user_data, None, None
+
+    except jwt.ExpiredSignatureError:
+        return None, {'error': 'Token has expired'}, 401
+    except jwt.InvalidTokenError:
+        return None, {'error': 'Invalid token'}, 401
+
+
+async def invalidate_profile_cache(request):
+    token = request.headers.get('Authorization')
+    if not token:
+        return web.json_response({'error': 'Authentication token is missing'}, status=401)
+
+    try:
+        payload = jwt.decode(
+            token, SECRET_KEY, algorithms=['HS256'],
+            audience=PROFILE_INVALIDATION_AUDIENCE, options={'require': ['exp', 'aud']}
+        )
+    except jwt.InvalidTokenError:
+        return web.json_response({'error': 'Invalid token'}, status=401)
+
+    if payload.get('action') != 'invalidate_profile' or not payload.get('username'):
+        return web.json_response({'error': 'Invalid invalidation request'}, status=400)
+
+    invalidated = profile_cache.invalidate(payload['username'])
+    return web.json_response({'invalidated': invalidated}, status=200)
+
+
+async def metrics(request):
+    return web.json_response({
+        'profile_cache': profile_cache.stats(),
+        'post_reads': post_reads.stats(),
+        'hedging': request.app[hedger_key].stats() if HEDGING_ENABLED else None,
+        'rate_limit': rate_limiter.stats(),
+        'post_service': request.app[post_service_pool_key].stats()
+    }, status=200)
+
+
+async def proxy_user_service(request):
+    url = f'{SERVICES["user"]}/{request.match_info["path"]}'
+    headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
+
+    sub_request = 'user_data' in request
+    if sub_request:
+        data = await request.read() or None
+    else:
+        data = request.content if request.body_exists else None
+
+    async with request.app[http_session_key].request(
+        request.method,
+        url,
+        headers=headers,
+        params=list(request.query.items()),
+        data=data,
+        timeout=aiohttp.ClientTimeout(total=request_timeout(request))
+    ) as upstream:
+        resp_headers = {
+            key: value for key, value in upstream.headers.items()
+            if key.lower() in ['content-type', 'content-length', 'content-encoding']
+        }
+        if sub_request:
+            # Подзапрос /batch: ответ читается целиком, в соединение клиента пишет сам батч
+            return web.Response(body=await upstream.read(), status=upstream.status, headers=resp_headers)
+        response = web.StreamResponse(status=upstream.status, headers=resp_headers)
+        await response.prepare(request)
+        async for chunk in upstream.content.iter_chunked(PROXY_CHUNK_SIZE):
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+
+async def create_post(request):
+    user_data, error, status_code = await authenticate_user(request)
+    if error:
+        return web.json_response(error, status=status_code)
+
+    data = await read_json(request)
+
+    if not data.get('title'):
+        return web.json_response({'error': 'Title is required'}, status=400)
+    if not data.get('description'):
+        return web.json_response({'error': 'Description is required'}, status=400)
+
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.CreatePostRequest(
+            title=data.get('title'),
+            description=data.get('description'),
+            creator_id=user_data['id'],
+            is_private=data.get('is_private', False),
+            tags=data.get('tags', [])
+        )
+
+        response = await stub.CreatePost(grpc_request, timeout=request_timeout(request))
+
+        return json_response(post_json(response), status=201)
+
+    except grpc.RpcError as e:
+        status_code = e.code()
+
+        if status_code == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        elif status_code == grpc.StatusCode.INTERNAL:
+            return web.json_response({'error': 'Internal server error'}, status=500)
+        elif status_code == grpc.StatusCode.INVALID_ARGUMENT:
+            return web.json_response({'error': str(e.details())}, status=400)
+        else:
+            return web.json_response({'error': str(e.details())}, status=500)
+
+
+async def get_post(request):
+    user_data, error, status_code = await authenticate_user(request)
+    if error:
+        return web.json_response(error, status=status_code)
+
+    fields = parse_fields(request.query.getall('fields', []))
+    if fields is None:
+        return web.json_response({'error': FIELDS_ERROR}, status=400)
+
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.GetPostRequest(
+            post_id=int(request.match_info['post_id']),
+            user_id=user_data['id'],
+            read_mask=read_mask(fields, 'updated_at')
+        )
+
+        if request.if_none_match:
+            version = await stub.GetPostVersion(grpc_request, timeout=request_timeout(request))
+            etag = post_etag(version.post_id, version.updated_at)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
+        response = await fetch_post(request, stub, grpc_request)
+        if response is None:
+            return web.json_response({'error': 'You do not have permission to view this post'}, status=403)
+
+        return with_etag(
+            json_response(post_json(response, fields)),
+            post_etag(response.id, response.updated_at)
+        )
+
+    except grpc.RpcError as e:
+        status_code = e.code()
+
+        if status_code == grpc.StatusCode.NOT_FOUND:
+            return web.json_response({'error': 'Post not found'}, status=404)
+        elif status_code == grpc.StatusCode.PERMISSION_DENIED:
+            return web.json_response({'error': 'You do not have permission to view this post'}, status=403)
+        elif status_code == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        else:
+            return web.json_response({'error': str(e)}, status=500)
+
+
+async def update_post(request):
+    user_data, error, status_code = await authenticate_user(request)
+    if error:
+        return web.json_response(error, status=status_code)
+
+    data = await read_json(request)
+
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.UpdatePostRequest(
+            post_id=int(request.match_info['post_id']),
+            title=data.get('title', ''),
+            description=data.get('description', ''),
+            user_id=user_data['id'],
+            is_private=data.get('is_private', False),
+            tags=data.get('tags', [])
+        )
+
+        response = await stub.UpdatePost(grpc_request, timeout=request_timeout(request))
+
+        return json_response(post_json(response))
+
+    except grpc.RpcError as e:
+        status_code = e.code()
+
+        if status_code == grpc.StatusCode.NOT_FOUND:
+            return web.json_response({'error': 'Post not found'}, status=404)
+        elif status_code == grpc.StatusCode.PERMISSION_DENIED:
+            return web.json_response({'error': 'You do not have permission to update this post'}, status=403)
+        elif status_code == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        else:
+            return web.json_response({'error': str(e.details())}, status=500)
+
+
+async def delete_post(request):
+    user_data, error, status_code = await authenticate_user(request)
+    if error:
+        return web.json_response(error, status=status_code)
+
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.DeletePostRequest(
+            post_id=int(request.match_info['post_id']),
+            user_id=user_data['id']
+        )
+
+        response = await stub.DeletePost(grpc_request, timeout=request_timeout(request))
+
+        return web.json_response({
+            'success': response.success,
+            'message': response.message
+        }, status=200 if response.success else 400)
+
+    except grpc.RpcError as e:
+        status_code = e.code()
+
+        if status_code == grpc.StatusCode.NOT_FOUND:
+            return web.json_response({'error': 'Post not found'}, status=404)
+        elif status_code == grpc.StatusCode.PERMISSION_DENIED:
+            return web.json_response({'error': 'You do not have permission to delete this post'}, status=403)
+        elif status_code == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        else:
+            return web.json_response({'error': str(e.details())}, status=500)
+
+
+async def list_posts(request):
+    user_data, error, status_code = await authenticate_user(request)
+    if error:
+        return web.json_response(error, status=status_code)
+
+    fields = parse_fields(request.query.getall('fields', []))
+    if fields is None:
+        return web.json_response({'error': FIELDS_ERROR}, status=400)
+
+    ids = request.query.getall('ids', [])
+    if ids:
+        return await batch_get_posts(request, user_data, ids, fields)
+
+    try:
+        page = int(request.query.get('page', 1))
+    except ValueError:
+        page = 1
+    try:
+        per_page = int(request.query.get('per_page', 10))
+    except ValueError:
+        per_page = 10
+    page_token = request.query.get('page_token', '')
+    tags = request.query.getall('tag', [])
+    if tags:
+        return await list_posts_by_tag(request, user_data, tags, per_page, page_token, fields)
+
+    total_mode = TOTAL_MODES.get(request.query.get('total', 'exact'))
+    if total_mode is None:
+        return web.json_response({'error': f"total must be one of: {', '.join(TOTAL_MODES)}"}, status=400)
+
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.ListPostsRequest(
+            page=page,
+            per_page=per_page,
+            user_id=user_data['id'],
+            page_token=page_token,
+            total_mode=total_mode,
+            read_mask=read_mask(fields)
+        )
+
+        if request.if_none_match:
+            version = await stub.GetListingVersion(grpc_request, timeout=request_timeout(request))
+            etag = listing_etag(user_data['id'], page_token or page, per_page, version.version)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
+        response = await read_post_service(request, stub, 'ListPosts', grpc_request)
+
+        if not response.version:
+            return json_response(listing_json(response, fields))
+        return with_etag(json_response(listing_json(response, fields)),
+                         listing_etag(user_data['id'], page_token or page, per_page, response.version))
+
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+            return web.json_response({'error': str(e.details())}, status=400)
+        return web.json_response({'error': str(e.details())}, status=500)
+
+
+async def list_posts_by_tag(request, user_data, tags, per_page, page_token, fields=None):
+    match = TAG_MATCHES.get(request.query.get('match', 'any'))
+    if match is None:
+        return web.json_response({'error': f"match must be one of: {', '.join(TAG_MATCHES)}"}, status=400)
+
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.ListPostsByTagRequest(
+            tags=tags,
+            match=match,
+            per_page=per_page,
+            user_id=user_data['id'],
+            page_token=page_token
+        )
+
+        response = await read_post_service(request, stub, 'ListPostsByTag', grpc_request)
+
+        return json_response(listing_json(response, fields))
+
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+            return web.json_response({'error': str(e.details())}, status=400)
+        return web.json_response({'error': str(e.details())}, status=500)
+
+
+async def batch_get_posts(request, user_data, ids, fields=None):
+    post_ids = parse_post_ids(ids)
+    if not post_ids:
+        return web.json_response({'error': 'ids must be a comma-separated list of post ids'}, status=400)
+
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.BatchGetPostsRequest(
+            post_ids=post_ids,
+            user_id=user_data['id']
+        )
+
+        response = await read_post_service(request, stub, 'BatchGetPosts', grpc_request)
+
+        return json_response(batch_json(response, fields))
+
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+            return web.json_response({'error': str(e.details())}, status=400)
+        return web.json_response({'error': str(e.details())}, status=500)
+
+
+async def search_posts(request):
+    user_data, error, status_code = await authenticate_user(request)
+    if error:
+        return web.json_response(error, status=status_code)
+
+    query = request.query.get('q', '').strip()
+    if not query:
+        return web.json_response({'error': 'Query parameter q is required'}, status=400)
+    try:
+        per_page = int(request.query.get('per_page', 10))
+    except ValueError:
+        per_page = 10
+
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.SearchPostsRequest(
+            query=query,
+            per_page=per_page,
+            user_id=user_data['id'],
+            page_token=request.query.get('page_token', '')
+        )
+
+        response = await read_post_service(request, stub, 'SearchPosts', grpc_request)
+
+        return json_response(listing_json(response))
+
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+            return web.json_response({'error': str(e.details())}, status=400)
+        return web.json_response({'error': str(e.details())}, status=500)
+
+
+def query_int(request, name, default):
+    try:
+        return int(request.query.get(name, default))
+    except ValueError:
+        return default
+
+
+async def home_timeline(request):
+    user_data, error, status_code = await authenticate_user(request)
+    if error:
+        return web.json_response(error, status=status_code)
+
+    fields = parse_fields(request.query.getall('fields', []))
+    if fields is None:
+        return web.json_response({'error': FIELDS_ERROR}, status=400)
+
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.HomeTimelineRequest(
+            user_id=user_data['id'],
+            per_page=query_int(request, 'per_page', 10),
+            page_token=request.query.get('page_token', ''),
+            read_mask=read_mask(fields)
+        )
+
+        response = await read_post_service(request, stub, 'HomeTimeline', grpc_request)
+
+        return json_response(listing_json(response, fields))
+
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+            return web.json_response({'error': str(e.details())}, status=400)
+        return web.json_response({'error': str(e.details())}, status=500)
+
+
+async def change_follow(request):
+    user_data, error, status_code = await authenticate_user(request)
+    if error:
+        return web.json_response(error, status=status_code)
+
+    user_id = int(request.match_info['user_id'])
+    following = request.method == 'PUT'
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.FollowRequest(follower_id=user_data['id'], followee_id=user_id)
+
+        method = stub.Follow if following else stub.Unfollow
+        response = await method(grpc_request, timeout=request_timeout(request))
+
+        return web.json_response({'user_id': user_id, 'following': following, 'changed': response.changed})
+
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+            return web.json_response({'error': str(e.details())}, status=400)
+        return web.json_response({'error': str(e.details())}, status=500)
+
+
+async def list_follows(request, method_name):
+    user_data, error, status_code = await authenticate_user(request)
+    if error:
+        return web.json_response(error, status=status_code)
+
+    try:
+        stub = get_post_service_stub(request)
+        grpc_request = post_service_pb2.ListFollowsRequest(
+            user_id=query_int(request, 'user_id', user_data['id']),
+            per_page=query_int(request, 'per_page', 20),
+            page_token=request.query.get('page_token', '')
+        )
+
+        response = await read_post_service(request, stub, method_name, grpc_request)
+
+        return json_response(follows_json(response))
+
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return web.json_response({'error': 'Request deadline exceeded'}, status=504)
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+            return web.json_response({'error': str(e.details())}, status=400)
+        return web.json_response({'error': str(e.details())}, status=500)
+
+
+async def list_following(request):
+    return await list_follows(request, 'ListFollowing')
+
+
+async def list_followers(request):
+    return await list_follows(request, 'ListFollowers')
+
+
+async def dispatch_sub_request(template, method, path, body, headers, user_data):
+    # Подзапрос /batch проходит тот же маршрутизатор и те же middleware, что и обычный запрос.
+    # Маршрут ищется по копии запроса, а сам подзапрос собирается make_mocked_request: только так
+    # через публичный API aiohttp можно задать и тело, и параметры найденного маршрута
+    app = template.app
+    match_info = await app.router.resolve(template.clone(method=method, rel_url=path, headers=headers))
+
+    data = b'' if body is None else dumps(body)
+    payload = StreamReader(template.protocol, len(data) + 1, loop=asyncio.get_running_loop())
+    payload.feed_data(data)
+    payload.feed_eof()
+    sub_request = make_mocked_request(method, path, headers=headers, match_info=dict(match_info), app=app, payload=payload)
+    sub_request['user_data'] = user_data
+
+    handler = match_info.handler
+    for middleware in reversed(app.middlewares):
+        handler = functools.partial(middleware, handler=handler)
+    return await handler(sub_request)
+
+
+async def run_batch_item(template, item, user_data, headers):
+    item_id = item.get('id')
+    method = str(item.get('method', 'GET')).upper()
+    path = item.get('path')
+
+    error = batch_path_error(path)
+    if error:
+        return {'id': item_id, 'status': 400, 'body': {'error': error}}
+
+    body = item.get('body')
+    if body is not None:
+        headers = dict(headers, **{'Content-Type': 'application/json'})
+    try:
+        response = await dispatch_sub_request(template, method, path, body, headers, user_data)
+    except web.HTTPException as e:
+        return {'id': item_id, 'status': e.status, 'body': {'error': e.reason}}
+    except Exception as e:
+        return {'id': item_id, 'status': 500, 'body': {'error': str(e)}}
+
+    data = response.body if isinstance(response, web.Response) and isinstance(response.body, bytes) else b''
+    return {
+        'id': item_id,
+        'status': response.status,
+        'body': batch_body(data, response.content_type, response.headers.get('Content-Encoding'))
+    }
+
+
+async def batch(request):
+    # Копия до чтения тела: aiohttp не клонирует запрос, тело которого уже прочитано
+    template = request.clone()
+    user_data, error, status_code = await authenticate_user(request)
+    if error:
+        return web.json_response(error, status=status_code)
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    items, error = parse_batch(data)
+    if error:
+        return web.json_response({'error': error}, status=400)
+
+    # Первый токен уже списан при аутентификации, остальные подзапросы оплачиваются здесь
+    if len(items) > 1:
+        rate_limiter.check_user(user_data['id'], cost=len(items) - 1)
+
+    budget = min(BATCH_DEADLINE, request['deadline'].remaining())
+    headers = {
+        'Authorization': request.headers.get('Authorization', ''),
+        'X-Request-Timeout': str(budget)
+    }
+    tasks = [asyncio.ensure_future(run_batch_item(template, item, user_data, headers)) for item in items]
+    done, _ = await asyncio.wait(tasks, timeout=budget)
+
+    responses = []
+    for item, task in zip(items, tasks):
+        if task in done:
+            responses.append(task.result())
+        else:
+            task.cancel()
+            responses.append({'id': item.get('id'), 'status': 504, 'body': {'error': 'Batch deadline exceeded'}})
+
+    return web.json_response({'responses': responses}, status=200)
+
+
+async def on_startup(application):
+    application[http_session_key] = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=int(os.environ.get("UPSTREAM_POOL_MAXSIZE", "50")) * 4,
+            limit_per_host=int(os.environ.get("UPSTREAM_POOL_MAXSIZE", "50"))
+        ),
+        auto_decompress=False
+    )
+    pool = ChannelPool(
+        [address.strip() for address in SERVICES["post"].split(',') if address.strip()],
+        post_service_pb2_grpc.PostServiceStub,
+        policy=os.environ.get("POST_SERVICE_LB_POLICY", "round_robin"),
+        service_name="post.PostService",
+        health_check_interval=float(os.environ.get("POST_SERVICE_HEALTH_CHECK_INTERVAL", "5")),
+        channel_factory=grpc.aio.insecure_channel
+    )
+    pool.start_health_checks_async()
+    application[post_service_pool_key] = pool
+    application[hedger_key] = Hedger(pool, default_delay=HEDGE_DELAY)
+
+
+async def on_cleanup(application):
+    await application[http_session_key].close()
+    await application[post_service_pool_key].close_async()
+
+
+def create_app():
+    application = web.Application(middlewares=[compression_middleware, deadline_middleware, admission_control_middleware])
+    application.router.add_post('/internal/profile-cache/invalidate', invalidate_profile_cache)
+    application.router.add_get('/internal/metrics', metrics)
+    for method in ['POST', 'GET', 'PUT', 'DELETE', 'PATCH']:
+        application.router.add_route(method, '/user/{path:.+}', proxy_user_service)
+    application.router.add_post('/posts', create_post)
+    application.router.add_get('/posts', list_posts)
+    application.router.add_get('/posts/search', search_posts)
+    application.router.add_get(r'/posts/{post_id:\d+}', get_post)
+    application.router.add_put(r'/posts/{post_id:\d+}', update_post)
+    application.router.add_delete(r'/posts/{post_id:\d+}', delete_post)
+    application.router.add_get('/timeline', home_timeline)
+    application.router.add_get('/following', list_following)
+    application.router.add_get('/followers', list_followers)
+    application.router.add_put(r'/following/{user_id:\d+}', change_follow)
+    application.router.add_delete(r'/following/{user_id:\d+}', change_follow)
+    application.router.add_post('/batch', batch)
+    application.on_startup.append(on_startup)
+    application.on_cleanup.append(on_cleanup)
+    return application
+
+
+def main():
+    web.run_app(create_app(), host='0.0.0.0', port=int(os.environ.get('PORT', '5000')))
+
+
+if __name__ == '__main__':
+    main()
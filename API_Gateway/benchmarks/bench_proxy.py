@@ -0,0 +1,92 @@
+# Запуск из каталога API_Gateway после генерации gRPC-кода:
+#   python benchmarks/bench_proxy.py
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from werkzeug.serving import make_server
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHUNK = b'x' * 65536
+PAYLOAD_SIZES_MB = [1, 16, 64, 256]
+REQUESTS_PER_SIZE = 5
+
+
+class StubUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubUpstreamHandler.lock:
+            StubUpstreamHandler.connections += 1
+
+    def do_GET(self):
+        size = int(self.path.rsplit('/', 1)[-1]) * 1024 * 1024
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        sent = 0
+        while sent < size:
+            part = CHUNK[:min(len(CHUNK), size - sent)]
+            self.wfile.write(part)
+            sent += len(part)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_in_thread(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), StubUpstreamHandler)
+    start_in_thread(upstream)
+    os.environ['USER_SERVICE_URL'] = f'http://127.0.0.1:{upstream.server_address[1]}'
+
+    import app
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    gateway = make_server('127.0.0.1', 0, app.app, threaded=True)
+    start_in_thread(gateway)
+    gateway_url = f'http://127.0.0.1:{gateway.server_port}'
+
+    client = requests.Session()
+    print(f"{'payload':>10} {'requests':>9} {'MB/s':>9} {'upstream conns':>15} {'peak RSS MB':>12}")
+    for size_mb in PAYLOAD_SIZES_MB:
+        start = time.perf_counter()
+        for _ in range(REQUESTS_PER_SIZE):
+            with client.get(f'{gateway_url}/user/blob/{size_mb}', stream=True) as response:
+                received = sum(len(chunk) for chunk in response.iter_content(65536))
+                assert received == size_mb * 1024 * 1024
+        elapsed = time.perf_counter() - start
+        print(f"{size_mb:>8}MB {REQUESTS_PER_SIZE:>9} "
+              f"{size_mb * REQUESTS_PER_SIZE / elapsed:>9.1f} "
+              f"{StubUpstreamHandler.connections:>15} {peak_rss_mb():>12.1f}")
+
+    # Для сравнения: буферизация всего тела, как делал прежний proxy_user_service
+    for size_mb in PAYLOAD_SIZES_MB:
+        body = requests.get(f"{os.environ['USER_SERVICE_URL']}/blob/{size_mb}").content
+        del body
+        print(f"buffered {size_mb:>4}MB: peak RSS {peak_rss_mb():.1f} MB")
+
+    gateway.shutdown()
+    upstream.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+# Запуск из каталога API_Gateway после генерации gRPC-кода:
+#   python benchmarks/bench_rate_limit.py
+# Шлюз, post_service и злоупотребляющий клиент работают в отдельных процессах: общий GIL с генератором
+# нагрузки искажал бы задержки. Шлюз ходит в post_service через настоящий ChannelPool, поэтому работает
+# и сброс по глубине очереди. Лимиты - значения по умолчанию из app.py, кроме сценария без лимитов.
+# Процесс злоупотребляющего клиента работает с пониженным приоритетом: в проде он на другой машине
+# и не отнимает у шлюза процессор, а на одноядерном стенде без этого p50 мерил бы загрузку клиентом
+import itertools
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent import futures
+
+import grpc
+import jwt
+import requests
+from grpc_health.v1 import health, health_pb2, health_pb2_grpc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import post_service_pb2
+import post_service_pb2_grpc
+
+DURATION = float(os.environ.get('BENCH_DURATION', '10'))
+ABUSIVE_THREADS = 16
+PROTECTED_USERS = 4
+PROTECTED_RATE = 10
+UPSTREAM_CONCURRENCY = 2
+UPSTREAM_LATENCY = 0.02
+SECRET_KEY = 'bench-secret-key-of-thirty-two-bytes'
+NO_LIMITS = {
+    'RATE_LIMIT_USER_RATE': '0', 'RATE_LIMIT_ROUTE_RATE': '0', 'POST_SERVICE_MAX_QUEUE_DEPTH': '0',
+    'RATE_LIMIT_USER_CONCURRENCY': '0'
+}
+
+
+class FakePostService(post_service_pb2_grpc.PostServiceServicer):
+    # post_service с ограниченной пропускной способностью: 2 запроса одновременно по 20 мс
+    def __init__(self):
+        self.slots = threading.Semaphore(UPSTREAM_CONCURRENCY)
+
+    def GetPost(self, request, context):
+        with self.slots:
+            time.sleep(UPSTREAM_LATENCY)
+        return post_service_pb2.Post(id=request.post_id, title="bench", creator_id=1, updated_at="2024-01-01T00:00:00")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve_post_service(port, ready):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=64))
+    post_service_pb2_grpc.add_PostServiceServicer_to_server(FakePostService(), server)
+    health_servicer = health.HealthServicer()
+    health_servicer.set('post.PostService', health_pb2.HealthCheckResponse.SERVING)
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    server.add_insecure_port(f'127.0.0.1:{port}')
+    server.start()
+    ready.set()
+    server.wait_for_termination()
+
+
+def serve_gateway(port, post_service_port, env, ready):
+    # Настройки читаются при импорте app, поэтому импорт - уже в процессе шлюза
+    os.environ.update(env, SECRET_KEY=SECRET_KEY, POST_SERVICE_URL=f'127.0.0.1:{post_service_port}')
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    from werkzeug.serving import make_server
+    import app
+    app.profile_cache.set('abuser', {'id': 666, 'username': 'abuser'})
+    for i in range(PROTECTED_USERS):
+        app.profile_cache.set(f'user{i}', {'id': i + 1, 'username': f'user{i}'})
+    server = make_server('127.0.0.1', port, app.app, threaded=True)
+    ready.set()
+    server.serve_forever()
+
+
+def token_for(username):
+    return jwt.encode({'username': username}, SECRET_KEY, algorithm='HS256')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else float('nan')
+
+
+def abuse(gateway_url, threads, duration, results):
+    os.nice(19)
+    stop = threading.Event()
+    statuses = {}
+    lock = threading.Lock()
+    # Нечётные id у злоупотребляющего, чётные у остальных: чтения не склеиваются в один GetPost
+    post_ids = itertools.count(1, 2)
+
+    def loop():
+        session = requests.Session()
+        headers = {'Authorization': token_for('abuser')}
+        while not stop.is_set():
+            status = session.get(f'{gateway_url}/posts/{next(post_ids)}', headers=headers).status_code
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    time.sleep(duration)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    results.update(statuses)
+
+
+def protected(gateway_url, duration):
+    stop = threading.Event()
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    post_ids = itertools.count(2, 2)
+
+    def loop(user_index):
+        session = requests.Session()
+        headers = {'Authorization': token_for(f'user{user_index}')}
+        while not stop.is_set():
+            start = time.perf_counter()
+            status = session.get(f'{gateway_url}/posts/{next(post_ids)}', headers=headers).status_code
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+            time.sleep(max(0.0, 1 / PROTECTED_RATE - elapsed))
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(PROTECTED_USERS)]
+    for worker in workers:
+        worker.start()
+    time.sleep(duration)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return latencies, statuses
+
+
+def start(target, *args):
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=target, args=args + (ready,), daemon=True)
+    process.start()
+    ready.wait(30)
+    return process
+
+
+def run(post_service_port, env, abusive_threads):
+    port = free_port()
+    gateway = start(serve_gateway, port, post_service_port, env)
+    gateway_url = f'http://127.0.0.1:{port}'
+    # Прогрев: канал к post_service и первые запросы
+    for i in range(PROTECTED_USERS):
+        requests.get(f'{gateway_url}/posts/0', headers={'Authorization': token_for(f'user{i}')})
+
+    manager = multiprocessing.Manager()
+    abusive_status = manager.dict()
+    abuser = None
+    if abusive_threads:
+        abuser = multiprocessing.Process(target=abuse, args=(gateway_url, abusive_threads, DURATION, abusive_status))
+        abuser.start()
+    latencies, statuses = protected(gateway_url, DURATION)
+    if abuser is not None:
+        abuser.join()
+    gateway.terminate()
+    gateway.join()
+    abusive_status = dict(abusive_status)
+    manager.shutdown()
+    return latencies, statuses, abusive_status
+
+
+def main():
+    post_service_port = free_port()
+    post_service = start(serve_post_service, post_service_port)
+
+    scenarios = [
+        ('no abuse', {}, 0),
+        ('no limits', NO_LIMITS, ABUSIVE_THREADS),
+        ('admission control', {}, ABUSIVE_THREADS),
+    ]
+    print(f"{DURATION:.0f}s per scenario, {PROTECTED_USERS} users at {PROTECTED_RATE} req/s, "
+          f"abuser: {ABUSIVE_THREADS} threads without pauses")
+    print(f"{'scenario':>18} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'non-200':>8} "
+          f"{'abusive 200':>12} {'abusive 429':>12} {'abusive 503':>12}")
+    for name, env, abusive_threads in scenarios:
+        latencies, statuses, abusive_status = run(post_service_port, env, abusive_threads)
+        failed = sum(count for status, count in statuses.items() if status != 200)
+        print(f"{name:>18} {percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f} "
+              f"{max(latencies) * 1000:>8.1f} {failed:>8} {abusive_status.get(200, 0):>12} "
+              f"{abusive_status.get(429, 0):>12} {abusive_status.get(503, 0):>12}")
+
+    post_service.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Запуск из каталога API_Gateway после генерации gRPC-кода:
+#   python benchmarks/bench_serialization.py
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import post_service_pb2
+import serializers
+from compression import compress
+from flask import jsonify
+
+
+def make_listing(count):
+    return post_service_pb2.ListPostsResponse(
+        posts=[
+            post_service_pb2.Post(
+                id=i,
+                title=f"Post {i}",
+                description="Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+                creator_id=i % 50,
+                created_at="2024-05-01T12:00:00.000000",
+                updated_at="2024-05-02T12:00:00.000000",
+                is_private=i % 7 == 0,
+                tags=["python", "grpc", "bench"]
+            )
+            for i in range(count)
+        ],
+        total=count, page=1, per_page=count
+    )
+
+
+def old_path(response):
+    # Прежний путь: dict вручную по полям и jsonify
+    posts = []
+    for post in response.posts:
+        posts.append({
+            'id': post.id,
+            'title': post.title,
+            'description': post.description,
+            'creator_id': post.creator_id,
+            'created_at': post.created_at,
+            'updated_at': post.updated_at,
+            'is_private': post.is_private,
+            'tags': list(post.tags)
+        })
+    return jsonify({
+        'posts': posts,
+        'total': response.total,
+        'page': response.page,
+        'per_page': response.per_page
+    }).get_data()
+
+
+def new_path(response):
+    return app.json_response(serializers.listing_json(response)).get_data()
+
+
+def main():
+    encoder = 'orjson' if serializers.orjson is not None else 'json'
+    print(f"encoder: {encoder}")
+    print(f"{'posts':>6} {'old us':>10} {'new us':>10} {'speedup':>8} {'bytes':>9} {'gzip':>8} {'gzip us':>9}")
+    with app.app.app_context():
+        for count in (10, 100, 1000):
+            response = make_listing(count)
+            number = max(10, 20000 // count)
+            old = min(timeit.repeat(lambda: old_path(response), number=number, repeat=5)) / number
+            new = min(timeit.repeat(lambda: new_path(response), number=number, repeat=5)) / number
+            body = new_path(response)
+            compressed = compress(body, 'gzip')
+            gzip_time = min(timeit.repeat(lambda: compress(body, 'gzip'), number=number, repeat=3)) / number
+            print(f"{count:>6} {old * 1e6:>10.1f} {new * 1e6:>10.1f} {old / new:>7.1f}x "
+                  f"{len(body):>9} {len(compressed):>8} {gzip_time * 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import time
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def request_budget(value, default, maximum):
+    # Клиент может сократить бюджет заголовком X-Request-Timeout (в секундах), но не превысить maximum
+    try:
+        budget = float(value) if value is not None else default
+    except ValueError:
+        budget = default
+    if budget <= 0:
+        budget = default
+    return min(budget, maximum)
+
+
+class Deadline:
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self):
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return remaining
@@ -0,0 +1,14 @@
+import hashlib
+
+
+def make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def post_etag(post_id, updated_at):
+    return make_etag('post', post_id, updated_at)
+
+
+def listing_etag(user_id, page, per_page, version):
+    # Состав списка зависит от пользователя (приватные посты) и от страницы
+    return make_etag('posts', user_id, page, per_page, version)
@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import threading
+import grpc
+import grpc.aio
+from grpc_health.v1 import health_pb2, health_pb2_grpc
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+
+DEFAULT_CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 30000),
+    ('grpc.keepalive_timeout_ms', 10000),
+    ('grpc.keepalive_permit_without_calls', 1),
+]
+
+
+class Backend:
+    def __init__(self, address, channel, stub_class):
+        self.address = address
+        self.channel = channel
+        self.stub = stub_class(channel)
+        self.health_stub = health_pb2_grpc.HealthStub(channel)
+        self.healthy = True
+        self.outstanding = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.outstanding += 1
+
+    def release(self):
+        with self._lock:
+            self.outstanding -= 1
+
+
+class _TrackedMethod:
+    def __init__(self, backend, method):
+        self._backend = backend
+        self._method = method
+
+    def __call__(self, *args, **kwargs):
+        self._backend.acquire()
+        try:
+            result = self._method(*args, **kwargs)
+        except Exception:
+            self._backend.release()
+            raise
+        if isinstance(result, grpc.aio.Call):
+            # grpc.aio возвращает вызов до его завершения
+            result.add_done_callback(lambda _: self._backend.release())
+        else:
+            self._backend.release()
+        return result
+
+    def with_call(self, *args, **kwargs):
+        self._backend.acquire()
+        try:
+            return self._method.with_call(*args, **kwargs)
+        finally:
+            self._backend.release()
+
+    def future(self, *args, **kwargs):
+        self._backend.acquire()
+        try:
+            future = self._method.future(*args, **kwargs)
+        except Exception:
+            self._backend.release()
+            raise
+        future.add_done_callback(lambda _: self._backend.release())
+        return future
+
+
+class TrackedStub:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        return _TrackedMethod(self.backend, getattr(self.backend.stub, name))
+
+
+class ChannelPool:
+    def __init__(self, addresses, stub_class, policy=ROUND_ROBIN, service_name='',
+                 health_check_interval=5.0, health_check_timeout=1.0,
+                 channel_factory=grpc.insecure_channel, options=None):
+        if not addresses:
+            raise ValueError("At least one backend address is required")
+        if policy not in (ROUND_ROBIN, LEAST_OUTSTANDING):
+            raise ValueError(f"Unknown load balancing policy: {policy}")
+
+        if options is None:
+            options = DEFAULT_CHANNEL_OPTIONS
+        self.policy = policy
+        self.service_name = service_name
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.backends = [
+            Backend(address, channel_factory(address, options=options), stub_class)
+            for address in addresses
+        ]
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+        self._health_thread = None
+        self._health_task = None
+
+    def pick(self, exclude=None):
+        candidates = [b for b in self.backends if b.healthy and b is not exclude]
+        if not candidates:
+            # Все бэкенды помечены нездоровыми: пробуем любой, пусть gRPC вернёт ошибку
+            candidates = [b for b in self.backends if b is not exclude] or self.backends
+
+        offset = next(self._counter)
+        if self.policy == LEAST_OUTSTANDING:
+            rotated = candidates[offset % len(candidates):] + candidates[:offset % len(candidates)]
+            return min(rotated, key=lambda b: b.outstanding)
+        return candidates[offset % len(candidates)]
+
+    def stub(self, exclude=None):
+        return TrackedStub(self.pick(exclude))
+
+    def check_health(self):
+        for backend in self.backends:
+            try:
+                response = backend.health_stub.Check(
+                    health_pb2.HealthCheckRequest(service=self.service_name),
+                    timeout=self.health_check_timeout
+                )
+                backend.healthy = response.status == health_pb2.HealthCheckResponse.SERVING
+            except grpc.RpcError as e:
+                # Бэкенд без health-сервиса считаем здоровым
+                backend.healthy = e.code() == grpc.StatusCode.UNIMPLEMENTED
+
+    async def check_health_async(self):
+        for backend in self.backends:
+            try:
+                response = await backend.health_stub.Check(
+                    health_pb2.HealthCheckRequest(service=self.service_name),
+                    timeout=self.health_check_timeout
+                )
+                backend.healthy = response.status == health_pb2.HealthCheckResponse.SERVING
+            except grpc.RpcError as e:
+                backend.healthy = e.code() == grpc.StatusCode.UNIMPLEMENTED
+
+    def start_health_checks(self):
+        if self._health_thread is not None or self.health_check_interval <= 0:
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop.is_set():
+            self.check_health()
+            self._stop.wait(self.health_check_interval)
+
+    def start_health_checks_async(self):
+        if self._health_task is not None or self.health_check_interval <= 0:
+            return
+        self._health_task = asyncio.get_running_loop().create_task(self._health_loop_async())
+
+    async def _health_loop_async(self):
+        while not self._stop.is_set():
+            await self.check_health_async()
+            await asyncio.sleep(self.health_check_interval)
+
+    def outstanding(self):
+        return sum(b.outstanding for b in self.backends)
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'backends': [
+                {'address': b.address, 'healthy': b.healthy, 'outstanding': b.outstanding}
+                for b in self.backends
+            ]
+        }
+
+    def close(self):
+        self._stop.set()
+        for backend in self.backends:
+            backend.channel.close()
+
+    async def close_async(self):
+        self._stop.set()
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for backend in self.backends:
+            await backend.channel.close()
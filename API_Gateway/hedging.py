@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from collections import deque
+import grpc
+
+
+class LatencyTracker:
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * p / 100))
+        return samples[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class Hedger:
+    def __init__(self, pool, default_delay=0.05, min_delay=0.005, percentile=95, min_samples=20):
+        self.pool = pool
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.latencies = {}
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _tracker(self, method_name):
+        tracker = self.latencies.get(method_name)
+        if tracker is None:
+            tracker = self.latencies.setdefault(method_name, LatencyTracker())
+        return tracker
+
+    def delay(self, method_name):
+        tracker = self._tracker(method_name)
+        if len(tracker) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+    def call(self, method_name, request, timeout):
+        start = time.monotonic()
+        primary_stub = self.pool.stub()
+        primary = getattr(primary_stub, method_name).future(request, timeout=timeout)
+
+        try:
+            result = primary.result(timeout=min(self.delay(method_name), timeout))
+            self._tracker(method_name).observe(time.monotonic() - start)
+            return result
+        except grpc.FutureTimeoutError:
+            pass
+
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return primary.result()
+
+        # Первая попытка дольше p95: дублируем запрос на другой бэкенд и берём первый успешный ответ
+        self.hedged += 1
+        hedge = getattr(self.pool.stub(exclude=primary_stub.backend), method_name).future(request, timeout=remaining)
+
+        finished = threading.Event()
+        primary.add_done_callback(lambda _: finished.set())
+        hedge.add_done_callback(lambda _: finished.set())
+
+        attempts = [primary, hedge]
+        while True:
+            finished.wait()
+            finished.clear()
+            winner = self._winner(attempts)
+            if winner is not None:
+                return self._finish(method_name, start, attempts, winner, hedge)
+
+    async def call_async(self, method_name, request, timeout):
+        start = time.monotonic()
+        primary_stub = self.pool.stub()
+        primary = asyncio.ensure_future(getattr(primary_stub, method_name)(request, timeout=timeout))
+
+        done, _ = await asyncio.wait({primary}, timeout=min(self.delay(method_name), timeout))
+        if done:
+            result = primary.result()
+            self._tracker(method_name).observe(time.monotonic() - start)
+            return result
+
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return await primary
+
+        self.hedged += 1
+        hedge = asyncio.ensure_future(
+            getattr(self.pool.stub(exclude=primary_stub.backend), method_name)(request, timeout=remaining)
+        )
+
+        attempts = [primary, hedge]
+        while True:
+            await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+            winner = self._winner(attempts)
+            if winner is not None:
+                return self._finish(method_name, start, attempts, winner, hedge)
+
+    @staticmethod
+    def _winner(attempts):
+        done = [attempt for attempt in attempts if attempt.done()]
+        for attempt in done:
+            if attempt.exception() is None:
+                return attempt
+        # Если обе попытки завершились ошибкой, возвращаем ошибку первой
+        if len(done) == len(attempts):
+            return done[0]
+        return None
+
+    def _finish(self, method_name, start, attempts, winner, hedge):
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+        value = winner.result()
+        if winner is hedge:
+            self.hedge_wins += 1
+        self._tracker(method_name).observe(time.monotonic() - start)
+        return value
+
+    def stats(self):
+        return {
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'delays': {name: self.delay(name) for name in list(self.latencies)}
+        }
@@ -0,0 +1,53 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade', 'host'
+}
+
+
+def create_upstream_session(pool_connections=10, pool_maxsize=50, pool_block=True):
+    # pool_maxsize ограничивает число keep-alive соединений на один хост,
+    # pool_block=True заставляет ждать свободное соединение вместо открытия нового
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+        max_retries=0
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class StreamingBody:
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+
+def request_body(stream, content_length, chunked, chunk_size=65536):
+    if content_length:
+        # Известная длина: requests передаст тело как файл с Content-Length
+        return StreamingBody(stream, content_length)
+    if chunked:
+        # Тело без длины передаём дальше тоже по частям
+        return iter(lambda: stream.read(chunk_size), b'')
+    return None
+
+
+def iter_response(response, chunk_size=65536):
+    try:
+        for chunk in response.raw.stream(chunk_size, decode_content=False):
+            yield chunk
+    finally:
+        # Возвращает соединение в пул
+        response.close()
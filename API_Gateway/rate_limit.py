@@ -0,0 +1,233 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after, reason='Too many requests', status=429):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+        self.status = status
+
+
+def refill(tokens, updated_at, now, rate, capacity):
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+def consume(tokens, cost, rate):
+    # Возвращает (остаток, сколько секунд ждать, если токенов не хватило)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+def full_at(tokens, now, rate, capacity):
+    # Когда бакет снова наполнится: после этого он ничем не отличается от отсутствующего и удаляется
+    return now + (capacity - tokens) / rate
+
+
+# Как часто хранилище удаляет наполнившиеся бакеты; без этого в нём остаётся бакет на каждого пользователя
+BUCKET_SWEEP_INTERVAL = 60.0
+
+
+class MemoryBucketStore:
+    def __init__(self, sweep_interval=BUCKET_SWEEP_INTERVAL):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def take(self, key, rate, capacity, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (capacity, now, now))
+            tokens, retry_after = consume(refill(tokens, updated_at, now, rate, capacity), cost, rate)
+            self._buckets[key] = (tokens, now, full_at(tokens, now, rate, capacity))
+            if now >= self._next_sweep:
+                self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+                self._next_sweep = now + self.sweep_interval
+        return retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SqliteBucketStore:
+    # Хранилище в файле SQLite: бакеты общие для всех worker-процессов на одной машине
+    def __init__(self, path, sweep_interval=BUCKET_SWEEP_INTERVAL):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL DEFAULT 0)"
+        )
+        # Файл от прежней версии без full_at: такие бакеты удалятся при первой чистке
+        if 'full_at' not in [row[1] for row in connection.execute("PRAGMA table_info(buckets)")]:
+            try:
+                connection.execute("ALTER TABLE buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                # Колонку успел добавить другой процесс
+                pass
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_buckets_full_at ON buckets (full_at)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, rate, capacity, cost=1):
+        # CLOCK_MONOTONIC в Linux общий для всех процессов
+        now = time.monotonic()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens, retry_after = consume(refill(tokens, updated_at, now, rate, capacity), cost, rate)
+            connection.execute(
+                "INSERT INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at, "
+                "full_at = excluded.full_at",
+                (key, tokens, now, full_at(tokens, now, rate, capacity))
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        if now >= self._next_sweep:
+            # Каждый процесс чистит по своему таймеру; удалить наполнившийся бакет дважды безопасно
+            self._next_sweep = now + self.sweep_interval
+            connection.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+        return retry_after
+
+    def __len__(self):
+        return self._connection().execute("SELECT count(*) FROM buckets").fetchone()[0]
+
+
+def create_bucket_store(url):
+    if url.startswith('sqlite:///'):
+        path = url[len('sqlite:///'):]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return SqliteBucketStore(path)
+    if url == 'memory':
+        return MemoryBucketStore()
+    raise ValueError(f"Unknown rate limit store: {url}")
+
+
+class RejectionCache:
+    # Ключ, только что получивший 429, до конца retry_after отклоняется сразу: бакет за это время
+    # всё равно не наберёт токен, а разбор JWT и обращение к хранилищу на каждый отказ отнимают
+    # процессор у остальных пользователей
+    def __init__(self, maxsize=100000, sweep_interval=BUCKET_SWEEP_INTERVAL):
+        self.maxsize = maxsize
+        self.sweep_interval = sweep_interval
+        self._until = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def reject(self, key, retry_after):
+        now = time.monotonic()
+        with self._lock:
+            self._until[key] = now + retry_after
+            if now >= self._next_sweep or len(self._until) > self.maxsize:
+                self._until = {key: until for key, until in self._until.items() if until > now}
+                self._next_sweep = now + self.sweep_interval
+
+    def retry_after(self, key):
+        until = self._until.get(key)
+        if until is None:
+            return 0.0
+        return max(0.0, until - time.monotonic())
+
+    def __len__(self):
+        return len(self._until)
+
+
+class RateLimiter:
+    def __init__(self, store, user_rate, user_burst, route_rate, route_burst, max_queue_depth=0, user_concurrency=0):
+        self.store = store
+        self.rejections = RejectionCache()
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.route_rate = route_rate
+        self.route_burst = route_burst
+        self.max_queue_depth = max_queue_depth
+        self.user_concurrency = user_concurrency
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.limited = 0
+        self.shed = 0
+
+    def check_user(self, user_id, cost=1, credential=None):
+        # credential - заголовок Authorization, по которому пользователь опознан
+        if self.user_rate <= 0:
+            return
+        retry_after = self.store.take(f'user:{user_id}', self.user_rate, self.user_burst, cost)
+        if retry_after:
+            self.limited += 1
+            # Отказ батчу (cost > 1) не значит, что не пройдёт одиночный запрос
+            if credential and cost == 1:
+                self.rejections.reject(credential, retry_after)
+            raise RateLimited(retry_after)
+
+    def enter_user(self, user_id):
+        # Бакет пропускает burst запросов разом, и они встают в очередь к post_service перед чужими.
+        # Одновременно у пользователя не больше user_concurrency запросов на процесс; False - лимит выключен
+        if self.user_concurrency <= 0:
+            return False
+        with self._lock:
+            in_flight = self._in_flight.get(user_id, 0)
+            if in_flight >= self.user_concurrency:
+                self.limited += 1
+                raise RateLimited(1.0, 'Too many concurrent requests')
+            self._in_flight[user_id] = in_flight + 1
+        return True
+
+    def leave_user(self, user_id):
+        with self._lock:
+            in_flight = self._in_flight.pop(user_id, 0) - 1
+            if in_flight > 0:
+                self._in_flight[user_id] = in_flight
+
+    def check_rejected(self, credential):
+        # До аутентификации и до бакета маршрута: отклонённые запросы не тратят его токены
+        if not credential:
+            return
+        retry_after = self.rejections.retry_after(credential)
+        if retry_after:
+            self.limited += 1
+            raise RateLimited(retry_after)
+
+    def check_route(self, route):
+        if self.route_rate <= 0:
+            return
+        retry_after = self.store.take(f'route:{route}', self.route_rate, self.route_burst)
+        if retry_after:
+            self.limited += 1
+            raise RateLimited(retry_after)
+
+    def check_queue_depth(self, depth):
+        # Сбрасываем нагрузку заранее, пока очередь к post_service не выросла до таймаутов
+        if self.max_queue_depth > 0 and depth >= self.max_queue_depth:
+            self.shed += 1
+            raise RateLimited(1.0, 'Service overloaded', status=503)
+
+    def stats(self):
+        return {
+            'limited': self.limited,
+            'shed': self.shed,
+            'user_rate': self.user_rate,
+            'route_rate': self.route_rate,
+            'max_queue_depth': self.max_queue_depth,
+            'user_concurrency': self.user_concurrency
+        }
@@ -0,0 +1,118 @@
+import json
+from google.protobuf.descriptor import FieldDescriptor
+import post_service_pb2
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def is_repeated(field):
+    # В новых версиях protobuf label убран в пользу is_repeated
+    if hasattr(field, 'is_repeated'):
+        return field.is_repeated
+    return field.label == FieldDescriptor.LABEL_REPEATED
+
+
+def compile_message(descriptor, exclude=()):
+    # Функция собирается один раз по дескриптору: на каждый вызов остаётся
+    # один литерал dict без обхода полей и без MessageToDict
+    items = []
+    for field in descriptor.fields:
+        if field.name in exclude:
+            continue
+        if field.type == FieldDescriptor.TYPE_MESSAGE:
+            raise ValueError(f"Nested message field {field.name} is not supported")
+        value = f'message.{field.name}'
+        if is_repeated(field):
+            value = f'list({value})'
+        items.append(f'{field.name!r}: {value}')
+
+    source = 'def to_dict(message):\n    return {' + ', '.join(items) + '}\n'
+    namespace = {}
+    exec(compile(source, f'<serializer {descriptor.full_name}>', 'exec'), namespace)
+    return namespace['to_dict']
+
+
+post_to_dict = compile_message(post_service_pb2.Post.DESCRIPTOR)
+
+POST_FIELDS = [field.name for field in post_service_pb2.Post.DESCRIPTOR.fields]
+_post_serializers = {}
+
+
+def post_serializer(fields=None):
+    # Под каждую маску fields= функция собирается один раз; различных масок не больше 2^8.
+    # id есть в ответе всегда
+    if not fields:
+        return post_to_dict
+    key = frozenset(fields) | {'id'}
+    to_dict = _post_serializers.get(key)
+    if to_dict is None:
+        to_dict = compile_message(post_service_pb2.Post.DESCRIPTOR, exclude=set(POST_FIELDS) - key)
+        _post_serializers[key] = to_dict
+    return to_dict
+
+
+def listing_to_dict(response, fields=None):
+    to_dict = post_serializer(fields)
+    return {
+        'posts': [to_dict(post) for post in response.posts],
+        'total': None if response.total_mode == post_service_pb2.TOTAL_NONE else response.total,
+        'page': response.page,
+        'per_page': response.per_page,
+        'next_page_token': response.next_page_token or None
+    }
+
+
+POST_STATUSES = {
+    post_service_pb2.POST_OK: 'ok',
+    post_service_pb2.POST_NOT_FOUND: 'not_found',
+    post_service_pb2.POST_PERMISSION_DENIED: 'permission_denied'
+}
+
+
+def batch_to_dict(response, fields=None):
+    to_dict = post_serializer(fields)
+    return {
+        'results': [
+            {
+                'id': result.post_id,
+                'status': POST_STATUSES[result.status],
+                'post': to_dict(result.post) if result.status == post_service_pb2.POST_OK else None
+            }
+            for result in response.results
+        ]
+    }
+
+
+follow_to_dict = compile_message(post_service_pb2.FollowEntry.DESCRIPTOR)
+
+
+def follows_to_dict(response):
+    return {
+        'users': [follow_to_dict(entry) for entry in response.follows],
+        'next_page_token': response.next_page_token or None
+    }
+
+
+def post_json(post, fields=None):
+    return dumps(post_serializer(fields)(post))
+
+
+def listing_json(response, fields=None):
+    return dumps(listing_to_dict(response, fields))
+
+
+def batch_json(response, fields=None):
+    return dumps(batch_to_dict(response, fields))
+
+
+def follows_json(response):
+    return dumps(follows_to_dict(response))
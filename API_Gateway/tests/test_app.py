@@ -4,7 +4,7 @@ import jwt
 import sys
 import os
 from unittest.mock import patch, MagicMock
-from datetime import datetime
+from datetime import datetime, timedelta
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -225,6 +225,7 @@ def test_list_posts(client, mock_authenticate_user, mock_grpc_stub):
     mock_response.total = 2
     mock_response.page = 1
     mock_response.per_page = 10
+    mock_response.next_page_token = ""
     
     mock_grpc_stub.ListPosts.return_value = mock_response
 
@@ -256,3 +257,609 @@ def test_authentication_failure(client):
     response_data = json.loads(response.data)
     assert 'error' in response_data
     assert 'Authentication token is missing' in response_data['error']
+
+@pytest.fixture
+def profile_cache():
+    app.profile_cache.clear()
+    yield app.profile_cache
+    app.profile_cache.clear()
+
+def test_authenticate_user_uses_profile_cache(client, auth_headers, mock_user_data, profile_cache):
+    user_response = MagicMock()
+    user_response.status_code = 200
+    user_response.json.return_value = mock_user_data
+
+    with patch.object(app.upstream_session, 'get', return_value=user_response) as mock_get:
+        with app.app.test_request_context('/posts', headers=auth_headers):
+            first = app.authenticate_user(app.request)
+            second = app.authenticate_user(app.request)
+
+    assert first == (mock_user_data, None, None)
+    assert second == (mock_user_data, None, None)
+    mock_get.assert_called_once()
+
+def invalidation_token(expires_in=30):
+    return jwt.encode(
+        {
+            "username": "testuser",
+            "action": "invalidate_profile",
+            "aud": app.PROFILE_INVALIDATION_AUDIENCE,
+            "exp": datetime.utcnow() + timedelta(seconds=expires_in)
+        },
+        app.app.config['SECRET_KEY'],
+        algorithm='HS256'
+    )
+
+def test_invalidate_profile_cache(client, mock_user_data, profile_cache):
+    profile_cache.set("testuser", mock_user_data)
+    token = invalidation_token()
+
+    response = client.post('/internal/profile-cache/invalidate', headers={"Authorization": token})
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['invalidated'] == True
+    assert profile_cache.get("testuser") is None
+
+def test_invalidate_profile_cache_rejects_user_token(client, auth_headers, mock_user_data, profile_cache):
+    profile_cache.set("testuser", mock_user_data)
+
+    response = client.post('/internal/profile-cache/invalidate', headers=auth_headers)
+
+    # У токена входа нет аудитории инвалидации
+    assert response.status_code == 401
+    assert profile_cache.get("testuser") == mock_user_data
+
+def test_invalidate_profile_cache_rejects_expired_token(client, mock_user_data, profile_cache):
+    profile_cache.set("testuser", mock_user_data)
+
+    response = client.post('/internal/profile-cache/invalidate', headers={"Authorization": invalidation_token(-1)})
+
+    assert response.status_code == 401
+    assert profile_cache.get("testuser") == mock_user_data
+
+def test_invalidation_token_is_not_a_login_token(client, mock_user_data, profile_cache):
+    profile_cache.set("testuser", mock_user_data)
+
+    with patch('app.upstream_session.get') as mock_get:
+        response = client.get('/posts', headers={"Authorization": invalidation_token()})
+
+    assert response.status_code == 401
+    mock_get.assert_not_called()
+
+def test_metrics_exposes_profile_cache_stats(client, profile_cache):
+    response = client.get('/internal/metrics')
+
+    assert response.status_code == 200
+    stats = json.loads(response.data)['profile_cache']
+    assert 'hits' in stats
+    assert 'misses' in stats
+
+def test_proxy_user_service_streams_body(client):
+    upstream_response = MagicMock()
+    upstream_response.status_code = 201
+    upstream_response.headers = {'Content-Type': 'application/json', 'Server': 'upstream'}
+    upstream_response.raw.stream.return_value = iter([b'{"message": ', b'"ok"}'])
+
+    with patch.object(app.upstream_session, 'request', return_value=upstream_response) as mock_request:
+        response = client.post('/user/register?ref=a&ref=b', json={"username": "testuser"})
+
+        assert response.status_code == 201
+        assert json.loads(response.data) == {"message": "ok"}
+        assert 'Server' not in response.headers
+
+    _, kwargs = mock_request.call_args
+    assert kwargs['url'].endswith('/register')
+    assert kwargs['stream'] == True
+    assert kwargs['params'] == [('ref', 'a'), ('ref', 'b')]
+    assert kwargs['data'].read() == b'{"username": "testuser"}'
+    assert 'Host' not in kwargs['headers']
+    upstream_response.close.assert_called_once()
+
+def test_batch_runs_sub_requests(client, mock_authenticate_user, mock_grpc_stub):
+    mock_post = MagicMock()
+    mock_post.id = 1
+    mock_post.title = "Test Post"
+    mock_post.description = "This is a test post"
+    mock_post.creator_id = 1
+    mock_post.created_at = datetime.now().isoformat()
+    mock_post.updated_at = datetime.now().isoformat()
+    mock_post.is_private = False
+    mock_post.tags = []
+
+    def get_post(request, **kwargs):
+        if request.post_id != 1:
+            error = grpc.RpcError()
+            error._code = grpc.StatusCode.NOT_FOUND
+            raise error
+        return mock_post
+
+    mock_grpc_stub.GetPost.side_effect = get_post
+
+    response = client.post('/batch', json={"requests": [
+        {"id": "a", "method": "GET", "path": "/posts/1"},
+        {"id": "b", "method": "GET", "path": "/posts/2"},
+        {"id": "c", "method": "POST", "path": "/batch"}
+    ]})
+
+    assert response.status_code == 200
+
+    responses = json.loads(response.data)['responses']
+    assert [item['id'] for item in responses] == ["a", "b", "c"]
+    assert responses[0]['status'] == 200
+    assert responses[0]['body']['title'] == "Test Post"
+    assert responses[1]['status'] == 404
+    assert responses[2]['status'] == 400
+
+def test_batch_reads_proxied_user_service_response(client, mock_authenticate_user):
+    upstream_response = MagicMock()
+    upstream_response.status_code = 200
+    upstream_response.headers = {'Content-Type': 'application/json'}
+    upstream_response.raw.stream.return_value = iter([b'{"username": ', b'"testuser"}'])
+
+    with patch.object(app.upstream_session, 'request', return_value=upstream_response) as mock_request:
+        response = client.post('/batch', json={"requests": [
+            {"id": "profile", "path": "/user/profile?fields=a%20b"},
+            {"id": "update", "method": "PUT", "path": "/user/profile", "body": {"phone": "123"}}
+        ]}, headers={"Authorization": "token"})
+
+    assert response.status_code == 200
+    profile, update = json.loads(response.data)['responses']
+    assert profile == {"id": "profile", "status": 200, "body": {"username": "testuser"}}
+    assert update['status'] == 200
+
+    calls = sorted(mock_request.call_args_list, key=lambda call: call.kwargs['method'])
+    assert calls[0].kwargs['url'].endswith('/profile') and calls[0].kwargs['params'] == [('fields', 'a b')]
+    assert calls[0].kwargs['headers']['Authorization'] == "token"
+    assert calls[1].kwargs['method'] == 'PUT' and calls[1].kwargs['data'].read() == b'{"phone":"123"}'
+
+def test_batch_rejects_too_many_requests(client, mock_authenticate_user, monkeypatch):
+    monkeypatch.setattr(app, "BATCH_MAX_ITEMS", 2)
+
+    response = client.post('/batch', json={"requests": [{"path": "/posts/1"}] * 3})
+
+    assert response.status_code == 400
+
+def test_batch_deadline(client, mock_authenticate_user, mock_grpc_stub, monkeypatch):
+    import threading
+    release = threading.Event()
+    monkeypatch.setattr(app, "BATCH_DEADLINE", 0.05)
+    mock_grpc_stub.GetPost.side_effect = lambda request, **kwargs: release.wait(1)
+
+    response = client.post('/batch', json={"requests": [{"id": "slow", "path": "/posts/1"}]})
+    release.set()
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['responses'][0]['status'] == 504
+
+def test_get_post_sets_etag_and_answers_304(client, mock_authenticate_user, mock_grpc_stub):
+    mock_response = MagicMock()
+    mock_response.id = 1
+    mock_response.title = "Test Post"
+    mock_response.description = "This is a test post"
+    mock_response.creator_id = 1
+    mock_response.created_at = "2024-01-01T00:00:00"
+    mock_response.updated_at = "2024-01-02T00:00:00"
+    mock_response.is_private = False
+    mock_response.tags = []
+    mock_grpc_stub.GetPost.return_value = mock_response
+
+    response = client.get('/posts/1')
+
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    mock_grpc_stub.GetPostVersion.assert_not_called()
+
+    mock_version = MagicMock()
+    mock_version.post_id = 1
+    mock_version.updated_at = "2024-01-02T00:00:00"
+    mock_grpc_stub.GetPostVersion.return_value = mock_version
+
+    response = client.get('/posts/1', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    mock_grpc_stub.GetPost.assert_called_once()
+
+def test_get_post_with_stale_etag_returns_body(client, mock_authenticate_user, mock_grpc_stub):
+    mock_response = MagicMock()
+    mock_response.id = 1
+    mock_response.title = "Test Post"
+    mock_response.description = "This is a test post"
+    mock_response.creator_id = 1
+    mock_response.created_at = "2024-01-01T00:00:00"
+    mock_response.updated_at = "2024-01-03T00:00:00"
+    mock_response.is_private = False
+    mock_response.tags = []
+    mock_grpc_stub.GetPost.return_value = mock_response
+
+    mock_version = MagicMock()
+    mock_version.post_id = 1
+    mock_version.updated_at = "2024-01-03T00:00:00"
+    mock_grpc_stub.GetPostVersion.return_value = mock_version
+
+    response = client.get('/posts/1', headers={'If-None-Match': '"stale"'})
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['title'] == "Test Post"
+
+def test_list_posts_answers_304_from_listing_version(client, mock_authenticate_user, mock_grpc_stub):
+    mock_response = MagicMock()
+    mock_response.posts = []
+    mock_response.total = 0
+    mock_response.page = 1
+    mock_response.per_page = 10
+    mock_response.next_page_token = ""
+    mock_response.version = "0-"
+    mock_grpc_stub.ListPosts.return_value = mock_response
+
+    response = client.get('/posts?page=1&per_page=10')
+    etag = response.headers['ETag']
+
+    mock_version = MagicMock()
+    mock_version.version = "0-"
+    mock_grpc_stub.GetListingVersion.return_value = mock_version
+
+    response = client.get('/posts?page=1&per_page=10', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    mock_grpc_stub.ListPosts.assert_called_once()
+
+    response = client.get('/posts?page=2&per_page=10', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+
+def test_fetch_post_applies_permissions_per_caller(monkeypatch):
+    private_post = MagicMock()
+    private_post.is_private = True
+    private_post.creator_id = 1
+    stub = MagicMock()
+
+    monkeypatch.setattr(app.post_reads, "do", lambda key, fn, timeout=None: (private_post, True))
+    assert app.fetch_post(stub, post_service_pb2.GetPostRequest(post_id=1, user_id=1)) is private_post
+    assert app.fetch_post(stub, post_service_pb2.GetPostRequest(post_id=1, user_id=2)) is None
+
+    denied = grpc.RpcError()
+    denied._code = grpc.StatusCode.PERMISSION_DENIED
+    monkeypatch.setattr(app.post_reads, "do", lambda key, fn, timeout=None: (denied, True))
+    stub.GetPost.return_value = private_post
+    assert app.fetch_post(stub, post_service_pb2.GetPostRequest(post_id=1, user_id=1)) is private_post
+    stub.GetPost.assert_called_once()
+
+def test_fetch_post_retries_shared_deadline_with_own_budget(monkeypatch):
+    post = MagicMock()
+    post.is_private = False
+    stub = MagicMock()
+    stub.GetPost.return_value = post
+
+    for code in (grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.CANCELLED):
+        expired = grpc.RpcError()
+        expired._code = code
+        monkeypatch.setattr(app.post_reads, "do", lambda key, fn, timeout=None: (expired, True))
+        assert app.fetch_post(stub, post_service_pb2.GetPostRequest(post_id=1, user_id=2)) is post
+
+    monkeypatch.setattr(app.post_reads, "do", lambda key, fn, timeout=None: (app.DeadlineExceeded(), True))
+    assert app.fetch_post(stub, post_service_pb2.GetPostRequest(post_id=1, user_id=2)) is post
+    assert stub.GetPost.call_count == 3
+
+    # Свой дедлайн ведущий не повторяет
+    monkeypatch.setattr(app.post_reads, "do", lambda key, fn, timeout=None: (expired, False))
+    with pytest.raises(grpc.RpcError):
+        app.fetch_post(stub, post_service_pb2.GetPostRequest(post_id=1, user_id=2))
+
+def test_metrics_exposes_coalesced_reads(client):
+    response = client.get('/internal/metrics')
+
+    assert 'coalesced' in json.loads(response.data)['post_reads']
+
+def test_request_deadline_is_propagated_to_grpc(client, mock_authenticate_user, mock_grpc_stub):
+    mock_response = MagicMock()
+    mock_response.success = True
+    mock_response.message = "Post deleted successfully"
+    mock_grpc_stub.DeletePost.return_value = mock_response
+
+    client.delete('/posts/1', headers={'X-Request-Timeout': '2'})
+
+    _, kwargs = mock_grpc_stub.DeletePost.call_args
+    assert 0 < kwargs['timeout'] <= 2
+
+def test_grpc_deadline_exceeded_returns_504(client, mock_authenticate_user, mock_grpc_stub):
+    error = grpc.RpcError()
+    error._code = grpc.StatusCode.DEADLINE_EXCEEDED
+    mock_grpc_stub.GetPost.side_effect = error
+
+    response = client.get('/posts/1')
+
+    assert response.status_code == 504
+
+def test_rate_limited_user_gets_429(client, auth_headers, mock_user_data, profile_cache, mock_grpc_stub, monkeypatch):
+    from rate_limit import RateLimiter, MemoryBucketStore
+    monkeypatch.setattr(app, "rate_limiter", RateLimiter(MemoryBucketStore(), user_rate=0.5, user_burst=1, route_rate=0, route_burst=0))
+    profile_cache.set("testuser", mock_user_data)
+    mock_response = MagicMock()
+    mock_response.success = True
+    mock_response.message = "Post deleted successfully"
+    mock_grpc_stub.DeletePost.return_value = mock_response
+
+    assert client.delete('/posts/1', headers=auth_headers).status_code == 200
+
+    response = client.delete('/posts/1', headers=auth_headers)
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    mock_grpc_stub.DeletePost.assert_called_once()
+
+def test_rejected_token_is_not_decoded_again(client, auth_headers, mock_user_data, profile_cache, mock_grpc_stub, monkeypatch):
+    from rate_limit import RateLimiter, MemoryBucketStore
+    monkeypatch.setattr(app, "rate_limiter", RateLimiter(MemoryBucketStore(), user_rate=0.5, user_burst=1, route_rate=0, route_burst=0))
+    profile_cache.set("testuser", mock_user_data)
+    mock_grpc_stub.GetPost.return_value = post_service_pb2.Post(id=1, title="Post", creator_id=1)
+    client.get('/posts/1', headers=auth_headers)
+    assert client.get('/posts/1', headers=auth_headers).status_code == 429
+
+    decode = MagicMock(side_effect=AssertionError("token decoded"))
+    monkeypatch.setattr(app.jwt, "decode", decode)
+    response = client.get('/posts/1', headers=auth_headers)
+
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+    decode.assert_not_called()
+
+def test_user_concurrency_slot_is_released(client, mock_authenticate_user, mock_grpc_stub, monkeypatch):
+    from rate_limit import RateLimiter, MemoryBucketStore
+    limiter = RateLimiter(MemoryBucketStore(), user_rate=0, user_burst=0, route_rate=0, route_burst=0, user_concurrency=1)
+    monkeypatch.setattr(app, "rate_limiter", limiter)
+    mock_grpc_stub.GetPost.return_value = post_service_pb2.Post(id=1, title="Post", creator_id=1)
+
+    assert client.get('/posts/1').status_code == 200
+    assert client.get('/posts/1').status_code == 200
+    assert limiter._in_flight == {}
+
+def test_load_is_shed_when_post_service_queue_is_deep(client, mock_authenticate_user, mock_grpc_stub, monkeypatch):
+    from rate_limit import RateLimiter, MemoryBucketStore
+    monkeypatch.setattr(app, "rate_limiter", RateLimiter(MemoryBucketStore(), user_rate=0, user_burst=0, route_rate=0, route_burst=0, max_queue_depth=5))
+    pool = MagicMock()
+    pool.outstanding.return_value = 5
+    monkeypatch.setattr(app, "post_service_pool", pool)
+
+    response = client.get('/posts/1')
+
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    mock_grpc_stub.GetPost.assert_not_called()
+
+def make_listing(count):
+    return post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=i, title=f"Post {i}", description="Description " * 10, creator_id=1)
+               for i in range(1, count + 1)],
+        total=count, page=1, per_page=count, version=f"{count}-v"
+    )
+
+def test_large_listing_is_gzipped(client, mock_authenticate_user, mock_grpc_stub):
+    import gzip
+    mock_grpc_stub.ListPosts.return_value = make_listing(50)
+
+    response = client.get('/posts?per_page=50', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.headers['ETag'].startswith('W/')
+    data = json.loads(gzip.decompress(response.data))
+    assert len(data['posts']) == 50
+
+def test_small_or_unnegotiated_responses_are_not_compressed(client, mock_authenticate_user, mock_grpc_stub):
+    mock_grpc_stub.ListPosts.return_value = make_listing(1)
+    small = client.get('/posts', headers={'Accept-Encoding': 'gzip'})
+
+    mock_grpc_stub.ListPosts.return_value = make_listing(50)
+    identity = client.get('/posts?per_page=50')
+
+    assert 'Content-Encoding' not in small.headers
+    assert 'Content-Encoding' not in identity.headers
+    assert len(json.loads(identity.data)['posts']) == 50
+
+def test_list_posts_passes_page_token(client, mock_authenticate_user, mock_grpc_stub):
+    mock_grpc_stub.ListPosts.return_value = post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=5, title="Post 5")], per_page=1, next_page_token="next"
+    )
+
+    response = client.get('/posts?per_page=1&page_token=abc')
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['next_page_token'] == "next"
+    args, _ = mock_grpc_stub.ListPosts.call_args
+    assert args[0].page_token == "abc"
+
+def test_list_posts_invalid_page_token(client, mock_authenticate_user, mock_grpc_stub):
+    error = grpc.RpcError()
+    error._code = grpc.StatusCode.INVALID_ARGUMENT
+    error.details = lambda: "Invalid page token"
+    mock_grpc_stub.ListPosts.side_effect = error
+
+    response = client.get('/posts?page_token=broken')
+
+    assert response.status_code == 400
+
+def test_list_posts_without_total(client, mock_authenticate_user, mock_grpc_stub):
+    mock_grpc_stub.ListPosts.return_value = post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=1)], total_mode=post_service_pb2.TOTAL_NONE
+    )
+
+    response = client.get('/posts?total=none')
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['total'] is None
+    assert 'ETag' not in response.headers
+    args, _ = mock_grpc_stub.ListPosts.call_args
+    assert args[0].total_mode == post_service_pb2.TOTAL_NONE
+
+def test_list_posts_rejects_unknown_total_mode(client, mock_authenticate_user, mock_grpc_stub):
+    response = client.get('/posts?total=approximate')
+
+    assert response.status_code == 400
+    mock_grpc_stub.ListPosts.assert_not_called()
+
+def test_list_posts_by_tag(client, mock_authenticate_user, mock_grpc_stub):
+    mock_grpc_stub.ListPostsByTag.return_value = post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=3, tags=["python", "grpc"])],
+        per_page=10,
+        next_page_token="next",
+        total_mode=post_service_pb2.TOTAL_NONE
+    )
+
+    response = client.get('/posts?tag=python&tag=grpc&match=all&page_token=abc')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [post['id'] for post in data['posts']] == [3]
+    assert data['total'] is None
+    assert data['next_page_token'] == "next"
+    args, _ = mock_grpc_stub.ListPostsByTag.call_args
+    assert list(args[0].tags) == ["python", "grpc"]
+    assert args[0].match == post_service_pb2.TAG_MATCH_ALL
+    assert args[0].page_token == "abc"
+    mock_grpc_stub.ListPosts.assert_not_called()
+
+def test_list_posts_by_tag_rejects_unknown_match(client, mock_authenticate_user, mock_grpc_stub):
+    response = client.get('/posts?tag=python&match=some')
+
+    assert response.status_code == 400
+    mock_grpc_stub.ListPostsByTag.assert_not_called()
+
+def test_search_posts(client, mock_authenticate_user, mock_grpc_stub):
+    mock_grpc_stub.SearchPosts.return_value = post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=4, title="Python tips")],
+        per_page=5,
+        next_page_token="next",
+        total_mode=post_service_pb2.TOTAL_NONE
+    )
+
+    response = client.get('/posts/search?q=python%20tips&per_page=5')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [post['title'] for post in data['posts']] == ["Python tips"]
+    assert data['next_page_token'] == "next"
+    args, _ = mock_grpc_stub.SearchPosts.call_args
+    assert args[0].query == "python tips"
+    assert args[0].per_page == 5
+    assert args[0].user_id == 1
+
+def test_search_posts_requires_query(client, mock_authenticate_user, mock_grpc_stub):
+    response = client.get('/posts/search?q=%20')
+
+    assert response.status_code == 400
+    mock_grpc_stub.SearchPosts.assert_not_called()
+
+def test_batch_get_posts(client, mock_authenticate_user, mock_grpc_stub):
+    mock_grpc_stub.BatchGetPosts.return_value = post_service_pb2.BatchGetPostsResponse(results=[
+        post_service_pb2.BatchGetPostsResult(post_id=2, status=post_service_pb2.POST_OK,
+                                             post=post_service_pb2.Post(id=2, title="Visible")),
+        post_service_pb2.BatchGetPostsResult(post_id=3, status=post_service_pb2.POST_PERMISSION_DENIED),
+        post_service_pb2.BatchGetPostsResult(post_id=4, status=post_service_pb2.POST_NOT_FOUND)
+    ])
+
+    response = client.get('/posts?ids=2,3&ids=4')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [(result['id'], result['status']) for result in data['results']] == [
+        (2, 'ok'), (3, 'permission_denied'), (4, 'not_found')
+    ]
+    assert data['results'][0]['post']['title'] == "Visible"
+    assert data['results'][1]['post'] is None
+    args, _ = mock_grpc_stub.BatchGetPosts.call_args
+    assert list(args[0].post_ids) == [2, 3, 4]
+    assert args[0].user_id == 1
+    mock_grpc_stub.ListPosts.assert_not_called()
+
+def test_batch_get_posts_invalid_ids(client, mock_authenticate_user, mock_grpc_stub):
+    response = client.get('/posts?ids=1,abc')
+
+    assert response.status_code == 400
+    mock_grpc_stub.BatchGetPosts.assert_not_called()
+
+def test_list_posts_with_fields(client, mock_authenticate_user, mock_grpc_stub):
+    import post_service_pb2
+    mock_grpc_stub.ListPosts.return_value = post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=1, title="Post 1", creator_id=1)],
+        per_page=10,
+        total_mode=post_service_pb2.TOTAL_NONE
+    )
+
+    response = client.get('/posts?fields=title&fields=created_at&total=none')
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['posts'] == [{'id': 1, 'title': "Post 1", 'created_at': ""}]
+    args, _ = mock_grpc_stub.ListPosts.call_args
+    assert list(args[0].read_mask.paths) == ['created_at', 'title']
+
+def test_get_post_with_fields(client, mock_authenticate_user, mock_grpc_stub):
+    import post_service_pb2
+    mock_grpc_stub.GetPost.return_value = post_service_pb2.Post(
+        id=1, title="Post", creator_id=1, updated_at="2024-01-01T00:00:00"
+    )
+
+    response = client.get('/posts/1?fields=title')
+
+    assert response.status_code == 200
+    assert json.loads(response.data) == {'id': 1, 'title': "Post"}
+    assert response.headers['ETag']
+    args, _ = mock_grpc_stub.GetPost.call_args
+    # updated_at запрашивается ради ETag, но в JSON не попадает
+    assert list(args[0].read_mask.paths) == ['title', 'updated_at']
+
+def test_unknown_fields_rejected(client, mock_authenticate_user, mock_grpc_stub):
+    response = client.get('/posts?fields=title,password')
+
+    assert response.status_code == 400
+    assert 'fields must be' in json.loads(response.data)['error']
+    mock_grpc_stub.ListPosts.assert_not_called()
+
+
+def test_home_timeline(client, mock_authenticate_user, mock_grpc_stub):
+    import post_service_pb2
+    mock_grpc_stub.HomeTimeline.return_value = post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=2, title="Post 2", creator_id=5)],
+        per_page=10,
+        next_page_token="next",
+        total_mode=post_service_pb2.TOTAL_NONE
+    )
+
+    response = client.get('/timeline?fields=title&page_token=abc')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['posts'] == [{'id': 2, 'title': "Post 2"}]
+    assert data['next_page_token'] == "next" and data['total'] is None
+    args, _ = mock_grpc_stub.HomeTimeline.call_args
+    assert (args[0].user_id, args[0].page_token, list(args[0].read_mask.paths)) == (1, "abc", ['title'])
+
+def test_follow_and_unfollow(client, mock_authenticate_user, mock_grpc_stub):
+    import post_service_pb2
+    mock_grpc_stub.Follow.return_value = post_service_pb2.FollowResponse(changed=True)
+    mock_grpc_stub.Unfollow.return_value = post_service_pb2.FollowResponse(changed=False)
+
+    followed = client.put('/following/5')
+    unfollowed = client.delete('/following/5')
+
+    assert json.loads(followed.data) == {'user_id': 5, 'following': True, 'changed': True}
+    assert json.loads(unfollowed.data) == {'user_id': 5, 'following': False, 'changed': False}
+    args, _ = mock_grpc_stub.Follow.call_args
+    assert (args[0].follower_id, args[0].followee_id) == (1, 5)
+
+def test_list_followers_of_other_user(client, mock_authenticate_user, mock_grpc_stub):
+    import post_service_pb2
+    mock_grpc_stub.ListFollowers.return_value = post_service_pb2.ListFollowsResponse(
+        follows=[post_service_pb2.FollowEntry(user_id=3, created_at="2024-01-01T00:00:00")]
+    )
+
+    response = client.get('/followers?user_id=7')
+
+    assert json.loads(response.data) == {
+        'users': [{'user_id': 3, 'created_at': "2024-01-01T00:00:00"}],
+        'next_page_token': None
+    }
+    args, _ = mock_grpc_stub.ListFollowers.call_args
+    assert args[0].user_id == 7
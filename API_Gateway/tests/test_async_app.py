@@ -0,0 +1,364 @@
+import pytest
+import asyncio
+import json
+import sys
+import os
+from unittest.mock import AsyncMock, MagicMock
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp.test_utils import TestClient, TestServer
+import async_app
+import grpc
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code, details):
+        self._code = code
+        self._details = details
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._details
+
+def make_post(post_id=1, title="Test Post"):
+    post = MagicMock()
+    post.id = post_id
+    post.title = title
+    post.description = "This is a test post"
+    post.creator_id = 1
+    post.created_at = datetime.now().isoformat()
+    post.updated_at = datetime.now().isoformat()
+    post.is_private = False
+    post.tags = ["test", "api"]
+    return post
+
+@pytest.fixture
+def mock_grpc_stub(monkeypatch):
+    monkeypatch.setenv("POST_SERVICE_HEALTH_CHECK_INTERVAL", "0")
+    stub = MagicMock()
+    monkeypatch.setattr(async_app, "get_post_service_stub", lambda request: stub)
+    return stub
+
+@pytest.fixture
+def mock_authenticate_user(monkeypatch):
+    async def mock_auth(request):
+        return {"id": 1, "username": "testuser"}, None, None
+
+    monkeypatch.setattr(async_app, "authenticate_user", mock_auth)
+
+def run(scenario):
+    async def runner():
+        async with TestClient(TestServer(async_app.create_app())) as client:
+            return await scenario(client)
+    return asyncio.run(runner())
+
+def test_create_post_success(mock_authenticate_user, mock_grpc_stub):
+    mock_grpc_stub.CreatePost = AsyncMock(return_value=make_post())
+
+    async def scenario(client):
+        response = await client.post('/posts', json={
+            "title": "Test Post",
+            "description": "This is a test post",
+            "tags": ["test", "api"]
+        })
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 201
+    assert data['title'] == "Test Post"
+    assert data['tags'] == ["test", "api"]
+    args, _ = mock_grpc_stub.CreatePost.call_args
+    assert args[0].creator_id == 1
+    assert list(args[0].tags) == ["test", "api"]
+
+def test_create_post_missing_title(mock_authenticate_user, mock_grpc_stub):
+    async def scenario(client):
+        response = await client.post('/posts', json={"description": "This is a test post"})
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 400
+    assert 'Title is required' in data['error']
+
+def test_get_post_success(mock_authenticate_user, mock_grpc_stub):
+    mock_grpc_stub.GetPost = AsyncMock(return_value=make_post())
+
+    async def scenario(client):
+        response = await client.get('/posts/1')
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 200
+    assert data['id'] == 1
+    args, _ = mock_grpc_stub.GetPost.call_args
+    assert args[0].post_id == 1
+    assert args[0].user_id == 1
+
+def test_get_post_not_found(mock_authenticate_user, mock_grpc_stub):
+    mock_grpc_stub.GetPost = AsyncMock(side_effect=FakeRpcError(grpc.StatusCode.NOT_FOUND, "Post not found"))
+
+    async def scenario(client):
+        response = await client.get('/posts/999')
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 404
+    assert data['error'] == 'Post not found'
+
+def test_delete_post_permission_denied(mock_authenticate_user, mock_grpc_stub):
+    mock_grpc_stub.DeletePost = AsyncMock(side_effect=FakeRpcError(grpc.StatusCode.PERMISSION_DENIED, "denied"))
+
+    async def scenario(client):
+        response = await client.delete('/posts/1')
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 403
+
+def test_list_posts(mock_authenticate_user, mock_grpc_stub):
+    list_response = MagicMock()
+    list_response.posts = [make_post(1, "Post 1"), make_post(2, "Post 2")]
+    list_response.total = 2
+    list_response.page = 1
+    list_response.per_page = 10
+    list_response.next_page_token = ""
+    mock_grpc_stub.ListPosts = AsyncMock(return_value=list_response)
+
+    async def scenario(client):
+        response = await client.get('/posts?page=1&per_page=10')
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 200
+    assert [post['title'] for post in data['posts']] == ["Post 1", "Post 2"]
+    assert data['total'] == 2
+    args, _ = mock_grpc_stub.ListPosts.call_args
+    assert args[0].per_page == 10
+
+def test_authentication_failure(mock_grpc_stub):
+    async def scenario(client):
+        response = await client.get('/posts/1')
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 401
+    assert 'Authentication token is missing' in data['error']
+
+def test_get_post_answers_304(mock_authenticate_user, mock_grpc_stub):
+    post = make_post()
+    version = MagicMock()
+    version.post_id = post.id
+    version.updated_at = post.updated_at
+    mock_grpc_stub.GetPost = AsyncMock(return_value=post)
+    mock_grpc_stub.GetPostVersion = AsyncMock(return_value=version)
+
+    async def scenario(client):
+        first = await client.get('/posts/1')
+        second = await client.get('/posts/1', headers={'If-None-Match': first.headers['ETag']})
+        return first.status, second.status
+
+    assert run(scenario) == (200, 304)
+    mock_grpc_stub.GetPost.assert_called_once()
+
+def test_large_listing_is_gzipped(mock_authenticate_user, mock_grpc_stub):
+    import gzip
+    import post_service_pb2
+    list_response = post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=i, title=f"Post {i}", description="Description " * 10)
+               for i in range(1, 51)],
+        total=50, page=1, per_page=50
+    )
+    mock_grpc_stub.ListPosts = AsyncMock(return_value=list_response)
+
+    async def scenario(client):
+        response = await client.get('/posts?per_page=50', headers={'Accept-Encoding': 'gzip'}, auto_decompress=False)
+        return response.status, response.headers, await response.read()
+
+    status, headers, body = run(scenario)
+
+    assert status == 200
+    assert headers['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(body))['posts']) == 50
+
+def test_list_posts_by_tag(mock_authenticate_user, mock_grpc_stub):
+    import post_service_pb2
+    mock_grpc_stub.ListPostsByTag = AsyncMock(return_value=post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=3)], per_page=10, total_mode=post_service_pb2.TOTAL_NONE
+    ))
+
+    async def scenario(client):
+        response = await client.get('/posts?tag=python&tag=grpc')
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 200
+    assert [post['id'] for post in data['posts']] == [3]
+    args, _ = mock_grpc_stub.ListPostsByTag.call_args
+    assert list(args[0].tags) == ["python", "grpc"]
+    assert args[0].match == post_service_pb2.TAG_MATCH_ANY
+
+def test_search_posts(mock_authenticate_user, mock_grpc_stub):
+    import post_service_pb2
+    mock_grpc_stub.SearchPosts = AsyncMock(return_value=post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=4, title="Python tips")], per_page=10,
+        total_mode=post_service_pb2.TOTAL_NONE
+    ))
+
+    async def scenario(client):
+        response = await client.get('/posts/search?q=python')
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 200
+    assert [post['id'] for post in data['posts']] == [4]
+    args, _ = mock_grpc_stub.SearchPosts.call_args
+    assert args[0].query == "python"
+
+def test_batch_get_posts(mock_authenticate_user, mock_grpc_stub):
+    import post_service_pb2
+    mock_grpc_stub.BatchGetPosts = AsyncMock(return_value=post_service_pb2.BatchGetPostsResponse(results=[
+        post_service_pb2.BatchGetPostsResult(post_id=1, status=post_service_pb2.POST_OK,
+                                             post=post_service_pb2.Post(id=1)),
+        post_service_pb2.BatchGetPostsResult(post_id=9, status=post_service_pb2.POST_NOT_FOUND)
+    ]))
+
+    async def scenario(client):
+        response = await client.get('/posts?ids=1,9')
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 200
+    assert [result['status'] for result in data['results']] == ['ok', 'not_found']
+    args, _ = mock_grpc_stub.BatchGetPosts.call_args
+    assert list(args[0].post_ids) == [1, 9]
+
+def test_list_posts_with_fields(mock_authenticate_user, mock_grpc_stub):
+    import post_service_pb2
+    mock_grpc_stub.ListPosts = AsyncMock(return_value=post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=1, title="Post 1", description="Long text")],
+        total_mode=post_service_pb2.TOTAL_NONE
+    ))
+
+    async def scenario(client):
+        response = await client.get('/posts?fields=title&total=none')
+        return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 200
+    assert data['posts'] == [{'id': 1, 'title': "Post 1"}]
+    args, _ = mock_grpc_stub.ListPosts.call_args
+    assert list(args[0].read_mask.paths) == ['title']
+
+
+def test_home_timeline_and_follow(mock_authenticate_user, mock_grpc_stub):
+    import post_service_pb2
+    mock_grpc_stub.HomeTimeline = AsyncMock(return_value=post_service_pb2.ListPostsResponse(
+        posts=[post_service_pb2.Post(id=2, title="Post 2")],
+        total_mode=post_service_pb2.TOTAL_NONE
+    ))
+    mock_grpc_stub.Follow = AsyncMock(side_effect=FakeRpcError(grpc.StatusCode.INVALID_ARGUMENT, "Users cannot follow themselves"))
+
+    async def scenario(client):
+        timeline = await client.get('/timeline?per_page=5')
+        follow = await client.put('/following/1')
+        return await timeline.json(), follow.status
+
+    timeline, follow_status = run(scenario)
+
+    assert [post['id'] for post in timeline['posts']] == [2]
+    args, _ = mock_grpc_stub.HomeTimeline.call_args
+    assert (args[0].user_id, args[0].per_page) == (1, 5)
+    assert follow_status == 400
+
+def test_batch_runs_sub_requests(mock_authenticate_user, mock_grpc_stub, monkeypatch):
+    mock_grpc_stub.GetPost = AsyncMock(return_value=make_post())
+    mock_grpc_stub.CreatePost = AsyncMock(return_value=make_post(2, "New"))
+
+    async def profile(request):
+        return async_app.web.json_response({"username": "testuser", "auth": request.headers.get('Authorization')})
+
+    user_service = async_app.web.Application()
+    user_service.router.add_get('/profile', profile)
+
+    async def scenario(client):
+        async with TestServer(user_service) as server:
+            monkeypatch.setitem(async_app.SERVICES, "user", str(server.make_url('')).rstrip('/'))
+            response = await client.post('/batch', json={"requests": [
+                {"id": "post", "path": "/posts/1"},
+                {"id": "create", "method": "POST", "path": "/posts", "body": {"title": "New", "description": "Text"}},
+                {"id": "profile", "path": "/user/profile"},
+                {"id": "missing", "path": "/nothing"},
+                {"id": "nested", "method": "POST", "path": "/batch"}
+            ]}, headers={"Authorization": "token"})
+            return response.status, await response.json()
+
+    status, data = run(scenario)
+
+    assert status == 200
+    post, create, profile, missing, nested = data['responses']
+    assert post['status'] == 200 and post['body']['id'] == 1
+    assert create['status'] == 201 and create['body']['title'] == "New"
+    assert mock_grpc_stub.CreatePost.call_args.args[0].title == "New"
+    assert profile == {"id": "profile", "status": 200, "body": {"username": "testuser", "auth": "token"}}
+    assert missing['status'] == 404
+    assert nested['status'] == 400
+
+def test_coalesced_get_post_is_not_bound_by_leader_deadline(mock_authenticate_user, mock_grpc_stub):
+    async def get_post(request, timeout=None):
+        # Пост читается 0.1 с: короче этого дедлайн истекает
+        await asyncio.sleep(min(timeout, 0.1))
+        if timeout < 0.1:
+            raise FakeRpcError(grpc.StatusCode.DEADLINE_EXCEEDED, "Deadline Exceeded")
+        return make_post()
+
+    mock_grpc_stub.GetPost = AsyncMock(side_effect=get_post)
+
+    async def scenario(client):
+        leader = asyncio.ensure_future(client.get('/posts/1', headers={'X-Request-Timeout': '0.02'}))
+        await asyncio.sleep(0.005)
+        waiter = asyncio.ensure_future(client.get('/posts/1', headers={'X-Request-Timeout': '5'}))
+        leader, waiter = await asyncio.gather(leader, waiter)
+        return leader.status, waiter.status, await waiter.json()
+
+    leader_status, waiter_status, post = run(scenario)
+
+    assert leader_status == 504
+    assert waiter_status == 200 and post['id'] == 1
+
+def test_rate_limited_token_is_rejected_before_auth(mock_grpc_stub, monkeypatch):
+    import jwt
+    from rate_limit import RateLimiter, MemoryBucketStore
+    limiter = RateLimiter(MemoryBucketStore(), user_rate=0.5, user_burst=1, route_rate=0, route_burst=0, user_concurrency=1)
+    monkeypatch.setattr(async_app, "rate_limiter", limiter)
+    async_app.profile_cache.set("limited", {"id": 7, "username": "limited"})
+    headers = {'Authorization': jwt.encode({'username': 'limited'}, async_app.SECRET_KEY, algorithm='HS256')}
+    mock_grpc_stub.GetPost = AsyncMock(return_value=make_post())
+    decode = MagicMock(side_effect=AssertionError("token decoded"))
+
+    async def scenario(client):
+        first = await client.get('/posts/1', headers=headers)
+        second = await client.get('/posts/1', headers=headers)
+        monkeypatch.setattr(async_app.jwt, "decode", decode)
+        third = await client.get('/posts/1', headers=headers)
+        return first.status, second.status, third.status, third.headers.get('Retry-After')
+
+    statuses = run(scenario)
+
+    assert statuses == (200, 429, 429, '2')
+    decode.assert_not_called()
+    # Слот конкурентности освобождается после ответа
+    assert limiter._in_flight == {}
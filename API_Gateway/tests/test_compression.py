@@ -0,0 +1,30 @@
+import gzip
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compression
+
+def test_choose_encoding_prefers_brotli_when_available(monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', object())
+
+    assert compression.choose_encoding('gzip, deflate, br') == 'br'
+    assert compression.choose_encoding('gzip;q=1.0, br;q=0.5') == 'gzip'
+
+def test_choose_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+
+    assert compression.choose_encoding('br, gzip') == 'gzip'
+    assert compression.choose_encoding('br') is None
+
+def test_choose_encoding_respects_q_zero():
+    assert compression.choose_encoding('gzip;q=0') is None
+    assert compression.choose_encoding('*') is not None
+    assert compression.choose_encoding('') is None
+    assert compression.choose_encoding(None) is None
+
+def test_gzip_round_trip():
+    body = b'{"posts": []}' * 100
+
+    assert gzip.decompress(compression.compress(body, 'gzip')) == body
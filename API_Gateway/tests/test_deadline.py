@@ -0,0 +1,24 @@
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deadline import Deadline, DeadlineExceeded, request_budget
+
+def test_request_budget():
+    assert request_budget(None, 10, 30) == 10
+    assert request_budget("2.5", 10, 30) == 2.5
+    assert request_budget("120", 10, 30) == 30
+    assert request_budget("-1", 10, 30) == 10
+    assert request_budget("soon", 10, 30) == 10
+
+def test_deadline_timeout():
+    with patch('deadline.time.monotonic', return_value=100.0):
+        deadline = Deadline(2)
+    with patch('deadline.time.monotonic', return_value=101.5):
+        assert deadline.timeout() == pytest.approx(0.5)
+    with patch('deadline.time.monotonic', return_value=102.0):
+        with pytest.raises(DeadlineExceeded):
+            deadline.timeout()
@@ -0,0 +1,79 @@
+import pytest
+import grpc
+import sys
+import os
+from concurrent import futures
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grpc_health.v1 import health, health_pb2, health_pb2_grpc
+from grpc_pool import ChannelPool, LEAST_OUTSTANDING
+
+def make_pool(addresses, **kwargs):
+    return ChannelPool(
+        addresses,
+        lambda channel: MagicMock(),
+        channel_factory=lambda address, options: MagicMock(),
+        **kwargs
+    )
+
+def test_round_robin_across_backends():
+    pool = make_pool(["a:1", "b:1", "c:1"])
+
+    picked = [pool.pick().address for _ in range(6)]
+
+    assert picked == ["a:1", "b:1", "c:1", "a:1", "b:1", "c:1"]
+
+def test_least_outstanding_prefers_idle_backend():
+    pool = make_pool(["a:1", "b:1"], policy=LEAST_OUTSTANDING)
+    pool.backends[0].outstanding = 3
+
+    assert all(pool.pick().address == "b:1" for _ in range(4))
+
+def test_tracked_stub_counts_in_flight_calls():
+    pool = make_pool(["a:1"])
+    backend = pool.backends[0]
+    seen = []
+    backend.stub.GetPost.side_effect = lambda request: seen.append(backend.outstanding) or "post"
+
+    assert pool.stub().GetPost("request") == "post"
+    assert seen == [1]
+    assert backend.outstanding == 0
+
+def test_unhealthy_backend_is_skipped():
+    pool = make_pool(["a:1", "b:1"])
+    pool.backends[0].healthy = False
+
+    assert all(pool.pick().address == "b:1" for _ in range(4))
+
+    pool.backends[1].healthy = False
+    assert pool.pick().address in ("a:1", "b:1")
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        make_pool(["a:1"], policy="random")
+
+def test_check_health_uses_health_protocol():
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    health_servicer = health.HealthServicer()
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+
+    pool = ChannelPool(
+        [f'127.0.0.1:{port}'],
+        lambda channel: MagicMock(),
+        service_name='post.PostService'
+    )
+    try:
+        health_servicer.set('post.PostService', health_pb2.HealthCheckResponse.NOT_SERVING)
+        pool.check_health()
+        assert not pool.backends[0].healthy
+
+        health_servicer.set('post.PostService', health_pb2.HealthCheckResponse.SERVING)
+        pool.check_health()
+        assert pool.backends[0].healthy
+    finally:
+        pool.close()
+        server.stop(0)
@@ -0,0 +1,89 @@
+import pytest
+import asyncio
+import time
+import sys
+import os
+from concurrent import futures
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grpc
+import grpc.aio
+import post_service_pb2
+import post_service_pb2_grpc
+from grpc_pool import ChannelPool
+from hedging import Hedger, LatencyTracker
+
+class DelayedPostService(post_service_pb2_grpc.PostServiceServicer):
+    def __init__(self, delay, title):
+        self.delay = delay
+        self.title = title
+
+    def GetPost(self, request, context):
+        time.sleep(self.delay)
+        return post_service_pb2.Post(id=request.post_id, title=self.title)
+
+@pytest.fixture
+def backends():
+    servers = []
+    addresses = []
+    for delay, title in [(0.5, "slow"), (0.0, "fast")]:
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        post_service_pb2_grpc.add_PostServiceServicer_to_server(DelayedPostService(delay, title), server)
+        port = server.add_insecure_port('127.0.0.1:0')
+        server.start()
+        servers.append(server)
+        addresses.append(f'127.0.0.1:{port}')
+    yield addresses
+    for server in servers:
+        server.stop(0)
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker()
+    for value in range(1, 101):
+        tracker.observe(value / 1000)
+
+    assert tracker.percentile(95) == pytest.approx(0.096)
+
+def test_hedged_call_returns_faster_backend(backends):
+    pool = ChannelPool(backends, post_service_pb2_grpc.PostServiceStub, health_check_interval=0)
+    hedger = Hedger(pool, default_delay=0.05)
+    try:
+        start = time.monotonic()
+        response = hedger.call('GetPost', post_service_pb2.GetPostRequest(post_id=1), timeout=2)
+        elapsed = time.monotonic() - start
+
+        assert response.title == "fast"
+        assert elapsed < 0.4
+        assert hedger.hedged == 1
+        assert hedger.hedge_wins == 1
+    finally:
+        pool.close()
+
+def test_fast_primary_is_not_hedged(backends):
+    pool = ChannelPool(backends[1:], post_service_pb2_grpc.PostServiceStub, health_check_interval=0)
+    hedger = Hedger(pool, default_delay=0.2)
+    try:
+        response = hedger.call('GetPost', post_service_pb2.GetPostRequest(post_id=1), timeout=2)
+
+        assert response.title == "fast"
+        assert hedger.hedged == 0
+    finally:
+        pool.close()
+
+def test_async_hedged_call_returns_faster_backend(backends):
+    async def scenario():
+        pool = ChannelPool(
+            backends,
+            post_service_pb2_grpc.PostServiceStub,
+            health_check_interval=0,
+            channel_factory=grpc.aio.insecure_channel
+        )
+        hedger = Hedger(pool, default_delay=0.05)
+        try:
+            response = await hedger.call_async('GetPost', post_service_pb2.GetPostRequest(post_id=1), timeout=2)
+            return response.title, hedger.hedge_wins
+        finally:
+            await pool.close_async()
+
+    assert asyncio.run(scenario()) == ("fast", 1)
@@ -0,0 +1,51 @@
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profile_cache import ProfileCache
+
+def test_get_returns_cached_value():
+    cache = ProfileCache(maxsize=10, ttl=60)
+    cache.set("alice", {"id": 1})
+
+    assert cache.get("alice") == {"id": 1}
+    assert cache.get("bob") is None
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['hit_ratio'] == 0.5
+
+def test_lru_eviction():
+    cache = ProfileCache(maxsize=2, ttl=60)
+    cache.set("alice", {"id": 1})
+    cache.set("bob", {"id": 2})
+    cache.get("alice")
+    cache.set("carol", {"id": 3})
+
+    assert cache.get("bob") is None
+    assert cache.get("alice") == {"id": 1}
+    assert cache.get("carol") == {"id": 3}
+    assert cache.stats()['evictions'] == 1
+
+def test_entries_expire_after_ttl():
+    cache = ProfileCache(maxsize=10, ttl=5)
+    with patch('profile_cache.time.monotonic', return_value=100.0):
+        cache.set("alice", {"id": 1})
+    with patch('profile_cache.time.monotonic', return_value=104.0):
+        assert cache.get("alice") == {"id": 1}
+    with patch('profile_cache.time.monotonic', return_value=105.0):
+        assert cache.get("alice") is None
+
+    assert cache.stats()['size'] == 0
+
+def test_invalidate():
+    cache = ProfileCache(maxsize=10, ttl=60)
+    cache.set("alice", {"id": 1})
+
+    assert cache.invalidate("alice")
+    assert not cache.invalidate("alice")
+    assert cache.get("alice") is None
+    assert cache.stats()['invalidations'] == 1
@@ -0,0 +1,128 @@
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import MemoryBucketStore, SqliteBucketStore, RateLimiter, RateLimited, RejectionCache, create_bucket_store
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBucketStore()
+    return SqliteBucketStore(str(tmp_path / 'buckets.db'))
+
+def test_bucket_allows_burst_then_limits(store):
+    with patch('rate_limit.time.monotonic', return_value=100.0):
+        assert [store.take('user:1', rate=1, capacity=3) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert store.take('user:1', rate=1, capacity=3) == pytest.approx(1.0)
+        assert store.take('user:2', rate=1, capacity=3) == 0.0
+
+def test_bucket_refills_over_time(store):
+    with patch('rate_limit.time.monotonic', return_value=100.0):
+        store.take('user:1', rate=2, capacity=2, cost=2)
+        assert store.take('user:1', rate=2, capacity=2) == pytest.approx(0.5)
+    with patch('rate_limit.time.monotonic', return_value=100.5):
+        assert store.take('user:1', rate=2, capacity=2) == 0.0
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'buckets.db')
+    first = SqliteBucketStore(path)
+    second = SqliteBucketStore(path)
+
+    with patch('rate_limit.time.monotonic', return_value=100.0):
+        assert first.take('user:1', rate=1, capacity=1) == 0.0
+        assert second.take('user:1', rate=1, capacity=1) > 0
+
+def test_limiter_raises_with_retry_after():
+    limiter = RateLimiter(MemoryBucketStore(), user_rate=1, user_burst=1, route_rate=0, route_burst=0)
+
+    limiter.check_user(1)
+    with pytest.raises(RateLimited) as excinfo:
+        limiter.check_user(1)
+
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after > 0
+    limiter.check_route('GET /posts')
+
+def test_limiter_sheds_on_queue_depth():
+    limiter = RateLimiter(MemoryBucketStore(), user_rate=0, user_burst=0, route_rate=0, route_burst=0, max_queue_depth=10)
+
+    limiter.check_queue_depth(9)
+    with pytest.raises(RateLimited) as excinfo:
+        limiter.check_queue_depth(10)
+
+    assert excinfo.value.status == 503
+    assert limiter.stats()['shed'] == 1
+
+def test_limiter_remembers_rejected_credential():
+    limiter = RateLimiter(MemoryBucketStore(), user_rate=1, user_burst=1, route_rate=0, route_burst=0)
+
+    with patch('rate_limit.time.monotonic', return_value=100.0):
+        limiter.check_rejected('token')
+        limiter.check_user(1, credential='token')
+        with pytest.raises(RateLimited):
+            limiter.check_user(1, credential='token')
+        with pytest.raises(RateLimited) as excinfo:
+            limiter.check_rejected('token')
+        assert excinfo.value.retry_after == pytest.approx(1.0)
+        limiter.check_rejected('other')
+    with patch('rate_limit.time.monotonic', return_value=101.0):
+        limiter.check_rejected('token')
+
+def test_batch_rejection_is_not_remembered():
+    limiter = RateLimiter(MemoryBucketStore(), user_rate=1, user_burst=1, route_rate=0, route_burst=0)
+
+    with pytest.raises(RateLimited):
+        limiter.check_user(1, cost=5, credential='token')
+    limiter.check_rejected('token')
+
+def test_rejection_cache_drops_expired_keys():
+    cache = RejectionCache(maxsize=2)
+
+    with patch('rate_limit.time.monotonic', return_value=100.0):
+        cache.reject('a', 1.0)
+        cache.reject('b', 1.0)
+    with patch('rate_limit.time.monotonic', return_value=102.0):
+        cache.reject('c', 1.0)
+
+    assert len(cache) == 1
+
+def test_limiter_caps_concurrent_requests_per_user():
+    limiter = RateLimiter(MemoryBucketStore(), user_rate=0, user_burst=0, route_rate=0, route_burst=0, user_concurrency=2)
+
+    assert limiter.enter_user(1) and limiter.enter_user(1)
+    with pytest.raises(RateLimited) as excinfo:
+        limiter.enter_user(1)
+    assert excinfo.value.status == 429
+    assert limiter.enter_user(2)
+
+    limiter.leave_user(1)
+    assert limiter.enter_user(1)
+
+def test_concurrency_cap_can_be_disabled():
+    limiter = RateLimiter(MemoryBucketStore(), user_rate=0, user_burst=0, route_rate=0, route_burst=0)
+
+    assert not limiter.enter_user(1)
+
+def test_create_bucket_store(tmp_path):
+    assert isinstance(create_bucket_store('memory'), MemoryBucketStore)
+    assert isinstance(create_bucket_store(f'sqlite:///{tmp_path}/buckets.db'), SqliteBucketStore)
+    with pytest.raises(ValueError):
+        create_bucket_store('redis://localhost')
+
+def test_store_drops_buckets_that_refilled(tmp_path):
+    with patch('rate_limit.time.monotonic', return_value=100.0):
+        stores = [MemoryBucketStore(sweep_interval=10), SqliteBucketStore(str(tmp_path / 'buckets.db'), sweep_interval=10)]
+        for store in stores:
+            store.take('user:1', rate=1, capacity=2, cost=2)
+            store.take('user:2', rate=1, capacity=30, cost=30)
+
+    # К моменту чистки user:1 снова полон, user:2 ещё наполняется
+    with patch('rate_limit.time.monotonic', return_value=110.0):
+        for store in stores:
+            store.take('user:3', rate=1, capacity=1)
+            assert len(store) == 2
+            assert store.take('user:2', rate=1, capacity=30, cost=11) > 0
+            assert store.take('user:1', rate=1, capacity=2, cost=2) == 0.0
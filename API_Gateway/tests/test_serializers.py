@@ -0,0 +1,67 @@
+import json
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import post_service_pb2
+import serializers
+
+def make_post(post_id=1):
+    return post_service_pb2.Post(
+        id=post_id,
+        title="Привет",
+        description="Description",
+        creator_id=7,
+        created_at="2024-01-01T00:00:00",
+        updated_at="2024-01-02T00:00:00",
+        is_private=True,
+        tags=["a", "b"]
+    )
+
+def test_post_json_matches_message_fields():
+    data = json.loads(serializers.post_json(make_post()))
+
+    assert data == {
+        'id': 1,
+        'title': "Привет",
+        'description': "Description",
+        'creator_id': 7,
+        'created_at': "2024-01-01T00:00:00",
+        'updated_at': "2024-01-02T00:00:00",
+        'is_private': True,
+        'tags': ["a", "b"]
+    }
+
+def test_listing_json_omits_version():
+    response = post_service_pb2.ListPostsResponse(
+        posts=[make_post(1), make_post(2)], total=2, page=1, per_page=10, version="2-x"
+    )
+
+    data = json.loads(serializers.listing_json(response))
+
+    assert [post['id'] for post in data['posts']] == [1, 2]
+    assert data['total'] == 2
+    assert 'version' not in data
+
+def test_stdlib_fallback_produces_same_json(monkeypatch):
+    expected = json.loads(serializers.post_json(make_post()))
+    monkeypatch.setattr(serializers, 'orjson', None)
+
+    body = serializers.post_json(make_post())
+
+    assert isinstance(body, bytes)
+    assert json.loads(body) == expected
+
+def test_compile_message_excludes_fields():
+    to_dict = serializers.compile_message(post_service_pb2.Post.DESCRIPTOR, exclude=('description',))
+
+    assert 'description' not in to_dict(make_post())
+
+def test_post_serializer_keeps_requested_fields_and_id():
+    to_dict = serializers.post_serializer(['tags', 'title'])
+
+    assert set(to_dict(make_post())) == {'id', 'title', 'tags'}
+    # Функция под маску собирается один раз
+    assert serializers.post_serializer(['title', 'tags']) is to_dict
+    assert serializers.post_serializer([]) is serializers.post_to_dict
@@ -0,0 +1,94 @@
+import pytest
+import asyncio
+import threading
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from singleflight import SingleFlight, AsyncSingleFlight
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait(1)
+        return "post"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do(1, load)))
+    leader.start()
+    started.wait(1)
+
+    waiters = [threading.Thread(target=lambda: results.append(flight.do(1, load))) for _ in range(5)]
+    for waiter in waiters:
+        waiter.start()
+    deadline = time.monotonic() + 1
+    while flight.coalesced < 5 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join(1)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: r[1]) == [("post", False)] + [("post", True)] * 5
+    assert flight.stats() == {'calls': 1, 'coalesced': 5, 'in_flight': 0}
+
+def test_sequential_calls_are_not_coalesced():
+    flight = SingleFlight()
+
+    assert flight.do(1, lambda: "a") == ("a", False)
+    assert flight.do(1, lambda: "b") == ("b", False)
+
+def test_error_is_raised_and_key_released():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do(1, fail)
+    assert flight.do(1, lambda: "ok") == ("ok", False)
+
+def test_async_concurrent_calls_share_one_result():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "post"
+
+    async def scenario():
+        return await asyncio.gather(*[flight.do(1, load) for _ in range(10)])
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert results.count(("post", False)) == 1
+    assert results.count(("post", True)) == 9
+    assert flight.stats()['coalesced'] == 9
+
+def test_async_leader_cancellation_does_not_cancel_waiters():
+    flight = AsyncSingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.05)
+        return "post"
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do(1, load))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do(1, load))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await waiter, leader.cancelled()
+
+    assert asyncio.run(scenario()) == (("post", True), True)
+    assert flight.stats()['in_flight'] == 0
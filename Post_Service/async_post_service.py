@@ -0,0 +1,556 @@
+import asyncio
+import threading
+from datetime import datetime
+import signal
+import os
+import grpc
+import post_service_pb2
+import post_service_pb2_grpc
+from grpc_health.v1 import health, health_pb2, health_pb2_grpc
+from sqlalchemy import select, any_, bindparam, ARRAY, Integer
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from database import Post, engine, replicas, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from pagination import decode_page_token, encode_search_token, decode_search_token
+from queries import visible_posts, tags_condition, create_post, update_own_post, delete_own_post, post_owner, only_fields, home_timeline
+from search import MAX_QUERY_LENGTH, query_terms
+from post_service import (
+    MAX_FILTER_TAGS, MAX_BATCH_POSTS, STREAM_BATCH_SIZE, SHUTDOWN_GRACE, counter_cache, search_backend, post_cache,
+    update_search_index, post_message, masked_message, read_fields, page_of, stream_query, follow_error, follows_message,
+    prepare, start_background, server_options
+)
+import counters
+import timeline
+
+
+def async_url(url):
+    # Те же базы, что и у синхронного сервера, но через asyncpg
+    return url.set(drivername='postgresql+asyncpg')
+
+
+async_engine = create_async_engine(async_url(engine.url), pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+# expire_on_commit=False: после коммита атрибуты нельзя лениво догрузить, ответ строится из уже загруженных
+AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+replica_sessions = {
+    replica: async_sessionmaker(
+        create_async_engine(async_url(replica.url), pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True),
+        expire_on_commit=False
+    )
+    for replica in replicas.engines
+}
+
+
+def read_session(user_id):
+    # Реплику выбирает тот же ReplicaSet, что и в синхронном сервере
+    replica = replicas.engine_for(user_id)
+    if replica is None:
+        return AsyncSession()
+    return replica_sessions[replica]()
+
+
+async def fetch_page(session, query, per_page, fields=None):
+    return page_of((await session.execute(query)).scalars().all(), per_page, fields)
+
+
+async def load_post(post_id, user_id, fields=None, primary=False):
+    # primary - для заполнения кеша, как в синхронном сервере
+    session = AsyncSession() if primary else read_session(user_id)
+    try:
+        query = select(Post).where(Post.id == post_id)
+        if fields is not None:
+            query = query.options(only_fields(Post, fields))
+        post = (await session.execute(query)).scalars().first()
+        return post_message(post, fields) if post else None
+    finally:
+        await session.close()
+
+
+def cache_post(post_id, post):
+    if post_cache is not None:
+        post_cache.put(post_id, post)
+
+
+class AsyncPostServicer(post_service_pb2_grpc.PostServiceServicer):
+    # Тот же контракт, что у PostServicer, но ожидание PostgreSQL не занимает поток.
+    # Синхронные помощники (счётчики, поиск в PostgreSQL) выполняются через run_sync на том же соединении
+    async def CreatePost(self, request, context):
+        session = AsyncSession()
+        try:
+            new_post = (await session.execute(create_post(dict(
+                title=request.title,
+                description=request.description,
+                creator_id=request.creator_id,
+                is_private=request.is_private,
+                tags=list(request.tags)
+            )))).first()
+            await session.commit()
+            replicas.note_write(request.creator_id)
+            update_search_index(search_backend.index_post, new_post)
+            message = post_message(new_post)
+            cache_post(new_post.id, message)
+
+            return message
+        except Exception as e:
+            await session.rollback()
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error creating post: {str(e)}")
+            return post_service_pb2.Post()
+        finally:
+            await session.close()
+
+    async def GetPost(self, request, context):
+        try:
+            fields = read_fields(request.read_mask)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return post_service_pb2.Post()
+
+        try:
+            # Обращения к бэкенду кеша синхронные: с POST_CACHE=redis://... они на время запроса занимают цикл
+            if post_cache is not None:
+                post = await post_cache.get_async(request.post_id, lambda: load_post(request.post_id, request.user_id, primary=True))
+                if post and fields is not None:
+                    post = masked_message(post, fields)
+            else:
+                post = await load_post(request.post_id, request.user_id, fields)
+
+            if not post:
+                context.set_code(grpc.StatusCode.NOT_FOUND)
+                context.set_details(f"Post with ID {request.post_id} not found")
+                return post_service_pb2.Post()
+
+            if post.is_private and post.creator_id != request.user_id:
+                context.set_code(grpc.StatusCode.PERMISSION_DENIED)
+                context.set_details("You don't have permission to view this private post")
+                return post_service_pb2.Post()
+
+            return post
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error retrieving post: {str(e)}")
+            return post_service_pb2.Post()
+
+    async def UpdatePost(self, request, context):
+        session = AsyncSession()
+        try:
+            values = {'is_private': request.is_private, 'updated_at': datetime.utcnow()}
+            if request.title:
+                values['title'] = request.title
+            if request.description:
+                values['description'] = request.description
+            if request.tags:
+                values['tags'] = list(request.tags)
+
+            post = (await session.execute(update_own_post(request.post_id, request.user_id, values))).first()
+
+            if not post:
+                if (await session.execute(post_owner(request.post_id))).first() is None:
+                    context.set_code(grpc.StatusCode.NOT_FOUND)
+                    context.set_details(f"Post with ID {request.post_id} not found")
+                    return post_service_pb2.Post()
+                context.set_code(grpc.StatusCode.PERMISSION_DENIED)
+                context.set_details("You don't have permission to update this post")
+                return post_service_pb2.Post()
+
+            await session.commit()
+            replicas.note_write(request.user_id)
+            update_search_index(search_backend.index_post, post)
+            message = post_message(post)
+            cache_post(post.id, message)
+
+            return message
+        except Exception as e:
+            await session.rollback()
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error updating post: {str(e)}")
+            return post_service_pb2.Post()
+        finally:
+            await session.close()
+
+    async def DeletePost(self, request, context):
+        session = AsyncSession()
+        try:
+            post = (await session.execute(delete_own_post(request.post_id, request.user_id))).first()
+
+            if not post:
+                if (await session.execute(post_owner(request.post_id))).first() is None:
+                    context.set_code(grpc.StatusCode.NOT_FOUND)
+                    context.set_details(f"Post with ID {request.post_id} not found")
+                    return post_service_pb2.DeletePostResponse(success=False, message="Post not found")
+                context.set_code(grpc.StatusCode.PERMISSION_DENIED)
+                context.set_details("You don't have permission to delete this post")
+                return post_service_pb2.DeletePostResponse(success=False, message="Permission denied")
+
+            await session.commit()
+            replicas.note_write(request.user_id)
+            update_search_index(search_backend.remove_post, request.post_id)
+            cache_post(request.post_id, None)
+
+            return post_service_pb2.DeletePostResponse(
+                success=True,
+                message=f"Post with ID {request.post_id} deleted successfully"
+            )
+        except Exception as e:
+            await session.rollback()
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error deleting post: {str(e)}")
+            return post_service_pb2.DeletePostResponse(success=False, message=f"Database error: {str(e)}")
+        finally:
+            await session.close()
+
+    async def ListPosts(self, request, context):
+        session = read_session(request.user_id)
+        try:
+            page = max(1, request.page)
+            per_page = min(max(1, request.per_page), 100)
+
+            cursor = None
+            try:
+                fields = read_fields(request.read_mask)
+                if request.page_token:
+                    cursor = decode_page_token(request.page_token)
+            except ValueError as e:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details(str(e))
+                return post_service_pb2.ListPostsResponse()
+
+            if request.total_mode == post_service_pb2.TOTAL_NONE:
+                total, version = 0, ''
+            elif request.total_mode == post_service_pb2.TOTAL_ESTIMATED:
+                total, version = await session.run_sync(counter_cache.get, request.user_id)
+            else:
+                total, version = await session.run_sync(counters.read_visible, request.user_id)
+
+            if cursor is not None:
+                page = 0
+                query = visible_posts(request.user_id, per_page + 1, cursor=cursor, fields=fields)
+            else:
+                query = visible_posts(request.user_id, per_page + 1, offset=(page - 1) * per_page, fields=fields)
+            post_list, next_page_token = await fetch_page(session, query, per_page, fields)
+
+            return post_service_pb2.ListPostsResponse(
+                posts=post_list,
+                total=total,
+                page=page,
+                per_page=per_page,
+                version=version,
+                next_page_token=next_page_token,
+                total_mode=request.total_mode
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error listing posts: {str(e)}")
+            return post_service_pb2.ListPostsResponse()
+        finally:
+            await session.close()
+
+    async def GetPostVersion(self, request, context):
+        session = read_session(request.user_id)
+        try:
+            post = (await session.execute(
+                select(Post.id, Post.creator_id, Post.is_private, Post.updated_at).where(Post.id == request.post_id)
+            )).first()
+
+            if not post:
+                context.set_code(grpc.StatusCode.NOT_FOUND)
+                context.set_details(f"Post with ID {request.post_id} not found")
+                return post_service_pb2.PostVersion()
+
+            if post.is_private and post.creator_id != request.user_id:
+                context.set_code(grpc.StatusCode.PERMISSION_DENIED)
+                context.set_details("You don't have permission to view this private post")
+                return post_service_pb2.PostVersion()
+
+            return post_service_pb2.PostVersion(
+                post_id=post.id,
+                updated_at=post.updated_at.isoformat()
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error retrieving post version: {str(e)}")
+            return post_service_pb2.PostVersion()
+        finally:
+            await session.close()
+
+    async def GetListingVersion(self, request, context):
+        session = read_session(request.user_id)
+        try:
+            _, version = await session.run_sync(counters.read_visible, request.user_id)
+
+            return post_service_pb2.ListingVersion(version=version)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error retrieving listing version: {str(e)}")
+            return post_service_pb2.ListingVersion()
+        finally:
+            await session.close()
+
+    async def ListPostsByTag(self, request, context):
+        tags = sorted({tag for tag in request.tags if tag})
+        if not tags or len(tags) > MAX_FILTER_TAGS:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"Between 1 and {MAX_FILTER_TAGS} tags are required")
+            return post_service_pb2.ListPostsResponse()
+
+        cursor = None
+        if request.page_token:
+            try:
+                cursor = decode_page_token(request.page_token)
+            except ValueError as e:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details(str(e))
+                return post_service_pb2.ListPostsResponse()
+
+        session = read_session(request.user_id)
+        try:
+            per_page = min(max(1, request.per_page), 100)
+            query = visible_posts(
+                request.user_id,
+                per_page + 1,
+                cursor=cursor,
+                condition=tags_condition(tags, match_all=request.match == post_service_pb2.TAG_MATCH_ALL)
+            )
+            post_list, next_page_token = await fetch_page(session, query, per_page)
+
+            return post_service_pb2.ListPostsResponse(
+                posts=post_list,
+                per_page=per_page,
+                next_page_token=next_page_token,
+                total_mode=post_service_pb2.TOTAL_NONE
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error listing posts by tag: {str(e)}")
+            return post_service_pb2.ListPostsResponse()
+        finally:
+            await session.close()
+
+    async def SearchPosts(self, request, context):
+        query = request.query.strip()
+        if not query_terms(query) or len(query) > MAX_QUERY_LENGTH:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"Query must contain a word and be at most {MAX_QUERY_LENGTH} characters long")
+            return post_service_pb2.ListPostsResponse()
+
+        cursor = None
+        if request.page_token:
+            try:
+                cursor = decode_search_token(request.page_token)
+            except ValueError as e:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details(str(e))
+                return post_service_pb2.ListPostsResponse()
+
+        session = read_session(request.user_id)
+        try:
+            per_page = min(max(1, request.per_page), 100)
+            hits = await session.run_sync(search_backend.search, request.user_id, query, per_page + 1, cursor)
+
+            next_page_token = ''
+            if len(hits) > per_page:
+                hits = hits[:per_page]
+                next_page_token = encode_search_token(hits[-1][1], hits[-1][0])
+
+            ids = [post_id for post_id, _ in hits]
+            posts = {}
+            if ids:
+                posts = {post.id: post for post in (await session.execute(select(Post).where(Post.id.in_(ids)))).scalars()}
+            post_list = [
+                post_message(posts[post_id]) for post_id in ids
+                if post_id in posts and (not posts[post_id].is_private or posts[post_id].creator_id == request.user_id)
+            ]
+
+            return post_service_pb2.ListPostsResponse(
+                posts=post_list,
+                per_page=per_page,
+                next_page_token=next_page_token,
+                total_mode=post_service_pb2.TOTAL_NONE
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error searching posts: {str(e)}")
+            return post_service_pb2.ListPostsResponse()
+        finally:
+            await session.close()
+
+    async def BatchGetPosts(self, request, context):
+        post_ids = list(dict.fromkeys(request.post_ids))
+        if not post_ids or len(post_ids) > MAX_BATCH_POSTS:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"Between 1 and {MAX_BATCH_POSTS} post ids are required")
+            return post_service_pb2.BatchGetPostsResponse()
+
+        session = read_session(request.user_id)
+        try:
+            ids = bindparam('post_ids', post_ids, type_=ARRAY(Integer))
+            posts = {post.id: post for post in (await session.execute(select(Post).where(Post.id == any_(ids)))).scalars()}
+
+            results = []
+            for post_id in post_ids:
+                post = posts.get(post_id)
+                if post is None:
+                    results.append(post_service_pb2.BatchGetPostsResult(
+                        post_id=post_id, status=post_service_pb2.POST_NOT_FOUND))
+                elif post.is_private and post.creator_id != request.user_id:
+                    results.append(post_service_pb2.BatchGetPostsResult(
+                        post_id=post_id, status=post_service_pb2.POST_PERMISSION_DENIED))
+                else:
+                    results.append(post_service_pb2.BatchGetPostsResult(
+                        post_id=post_id, status=post_service_pb2.POST_OK, post=post_message(post)))
+
+            return post_service_pb2.BatchGetPostsResponse(results=results)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error retrieving posts: {str(e)}")
+            return post_service_pb2.BatchGetPostsResponse()
+        finally:
+            await session.close()
+
+    async def StreamPosts(self, request, context):
+        try:
+            query = stream_query(request)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return
+
+        session = read_session(request.user_id)
+        try:
+            # session.stream открывает серверный курсор; при отмене вызова генератор закрывается вместе с ним
+            result = await session.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for post in result.scalars():
+                yield post_message(post)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error streaming posts: {str(e)}")
+        finally:
+            await session.close()
+
+    async def GetCacheStats(self, request, context):
+        if post_cache is None:
+            return post_service_pb2.CacheStats(enabled=False)
+        return post_service_pb2.CacheStats(enabled=True, **post_cache.stats())
+
+    async def change_follow(self, request, context, action, name):
+        error = follow_error(request)
+        if error:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(error)
+            return post_service_pb2.FollowResponse()
+
+        session = AsyncSession()
+        try:
+            changed = await session.run_sync(action, request.follower_id, request.followee_id)
+            await session.commit()
+            replicas.note_write(request.follower_id)
+            return post_service_pb2.FollowResponse(changed=changed)
+        except Exception as e:
+            await session.rollback()
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error {name} user: {str(e)}")
+            return post_service_pb2.FollowResponse()
+        finally:
+            await session.close()
+
+    async def Follow(self, request, context):
+        return await self.change_follow(request, context, timeline.follow, 'following')
+
+    async def Unfollow(self, request, context):
+        return await self.change_follow(request, context, timeline.unfollow, 'unfollowing')
+
+    async def list_follows(self, request, context, followers):
+        cursor = None
+        if request.page_token:
+            try:
+                cursor = decode_page_token(request.page_token)
+            except ValueError as e:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details(str(e))
+                return post_service_pb2.ListFollowsResponse()
+
+        session = read_session(request.user_id)
+        try:
+            per_page = min(max(1, request.per_page), 100)
+            rows = (await session.execute(timeline.follows_page(request.user_id, per_page + 1, cursor, followers))).all()
+            return follows_message(rows, per_page)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error listing follows: {str(e)}")
+            return post_service_pb2.ListFollowsResponse()
+        finally:
+            await session.close()
+
+    async def ListFollowing(self, request, context):
+        return await self.list_follows(request, context, followers=False)
+
+    async def ListFollowers(self, request, context):
+        return await self.list_follows(request, context, followers=True)
+
+    async def HomeTimeline(self, request, context):
+        cursor = None
+        try:
+            fields = read_fields(request.read_mask)
+            if request.page_token:
+                cursor = decode_page_token(request.page_token)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return post_service_pb2.ListPostsResponse()
+
+        session = read_session(request.user_id)
+        try:
+            per_page = min(max(1, request.per_page), 100)
+            query = home_timeline(request.user_id, per_page + 1, cursor, fields)
+            post_list, next_page_token = await fetch_page(session, query, per_page, fields)
+
+            return post_service_pb2.ListPostsResponse(
+                posts=post_list,
+                per_page=per_page,
+                next_page_token=next_page_token,
+                total_mode=post_service_pb2.TOTAL_NONE
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error reading home timeline: {str(e)}")
+            return post_service_pb2.ListPostsResponse()
+        finally:
+            await session.close()
+
+
+async def serve(worker_index=None):
+    stop = threading.Event()
+    # Миграции, пересчёт счётчиков и фоновые проверки те же, что у синхронного сервера
+    if worker_index is None:
+        await asyncio.to_thread(prepare)
+    start_background(stop, first_worker=not worker_index)
+
+    port = os.environ.get('GRPC_PORT', '50052')
+
+    server = grpc.aio.server(options=server_options(worker_index))
+    post_service_pb2_grpc.add_PostServiceServicer_to_server(AsyncPostServicer(), server)
+    health_servicer = health.aio.HealthServicer()
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    await health_servicer.set('', health_pb2.HealthCheckResponse.SERVING)
+    await health_servicer.set('post.PostService', health_pb2.HealthCheckResponse.SERVING)
+    print(f"Post Service async gRPC server started on port {port}" + (f", worker {worker_index}" if worker_index is not None else ""))
+
+    shutdown = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, shutdown.set)
+    await shutdown.wait()
+
+    await health_servicer.enter_graceful_shutdown()
+    stop.set()
+    await server.stop(SHUTDOWN_GRACE)
+    await async_engine.dispose()
+
+
+def main(worker_index=None):
+    asyncio.run(serve(worker_index))
+
+
+if __name__ == '__main__':
+    main()
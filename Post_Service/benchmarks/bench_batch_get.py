@@ -0,0 +1,74 @@
+# Запуск из каталога Post_Service на пустой тестовой базе (таблица posts пересоздаётся):
+#   DATABASE_URL=postgresql://... python benchmarks/bench_batch_get.py
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+import post_service_pb2
+from database import Base, engine, init_db
+from post_service import PostServicer
+
+ROWS = int(os.environ.get("BENCH_ROWS", "100000"))
+BATCH_SIZES = (1, 10, 20, 50, 100)
+REPEAT = 20
+
+
+class Context:
+    def set_code(self, code):
+        raise RuntimeError(code)
+
+    def set_details(self, details):
+        pass
+
+
+def seed():
+    Base.metadata.drop_all(engine)
+    init_db()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO posts (title, description, creator_id, created_at, updated_at, is_private, tags) "
+            "SELECT 'Post ' || i, 'Description', i % 1000, now(), now(), false, ARRAY['tag'] "
+            "FROM generate_series(1, :rows) AS i"
+        ), {'rows': ROWS})
+        connection.execute(text("ANALYZE posts"))
+
+
+def median_time(fn):
+    fn()
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    seed()
+    servicer = PostServicer()
+    rng = random.Random(42)
+
+    print(f"rows: {ROWS}")
+    print(f"{'ids':>5} {'GetPost x N ms':>15} {'BatchGetPosts ms':>17} {'speedup':>8}")
+    for size in BATCH_SIZES:
+        ids = rng.sample(range(1, ROWS + 1), size)
+
+        def one_by_one():
+            for post_id in ids:
+                servicer.GetPost(post_service_pb2.GetPostRequest(post_id=post_id, user_id=1), Context())
+
+        def batch():
+            servicer.BatchGetPosts(post_service_pb2.BatchGetPostsRequest(post_ids=ids, user_id=1), Context())
+
+        single = median_time(one_by_one)
+        batched = median_time(batch)
+        print(f"{size:>5} {single * 1000:>15.2f} {batched * 1000:>17.2f} {single / batched:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
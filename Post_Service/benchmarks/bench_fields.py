@@ -0,0 +1,86 @@
+# Запуск из каталога Post_Service на пустой тестовой базе (таблица posts пересоздаётся):
+#   DATABASE_URL=postgresql://... python benchmarks/bench_fields.py
+# ListPosts по постам с длинными описаниями: полные посты против read_mask без description.
+# Описания из md5 почти не сжимаются и уходят в TOAST, как настоящие длинные тексты
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+import post_service
+import post_service_pb2
+from database import Base, Session, engine, init_db
+from post_service import PostServicer, read_fields
+from queries import visible_posts
+
+ROWS = int(os.environ.get("BENCH_ROWS", "20000"))
+DESCRIPTION_SIZES = [int(size) for size in os.environ.get("BENCH_DESCRIPTION", "200,4000,16000").split(',')]
+PER_PAGE = 50
+REPEAT = 50
+MASKS = [('full', []), ('title,created_at', ['title', 'created_at'])]
+
+
+class Context:
+    def set_code(self, code):
+        raise RuntimeError(code)
+
+    def set_details(self, details):
+        pass
+
+
+def seed(description_size):
+    Base.metadata.drop_all(engine)
+    init_db()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO posts (title, description, creator_id, created_at, updated_at, is_private, tags) "
+            "SELECT 'Post ' || i, left(body.text, :size), i % 1000, "
+            "now() - make_interval(secs => i), now() - make_interval(secs => i), i % 10 = 0, ARRAY['tag'] "
+            "FROM generate_series(1, :rows) AS i, "
+            "LATERAL (SELECT string_agg(md5(i::text || '-' || j::text), '') AS text "
+            "FROM generate_series(1, :chunks) AS j) AS body"
+        ), {'rows': ROWS, 'size': description_size, 'chunks': description_size // 32 + 1})
+        connection.execute(text("ANALYZE posts"))
+
+
+def median_time(fn):
+    fn()
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    servicer = PostServicer()
+    post_service.post_cache = None
+    print(f"rows: {ROWS}, per_page: {PER_PAGE}")
+    print(f"{'description':>11} {'fields':>17} {'query ms':>9} {'ListPosts ms':>13} {'payload KB':>11}")
+    for size in DESCRIPTION_SIZES:
+        seed(size)
+        for name, paths in MASKS:
+            request = post_service_pb2.ListPostsRequest(
+                per_page=PER_PAGE, user_id=1, total_mode=post_service_pb2.TOTAL_NONE, read_mask={'paths': paths}
+            )
+            fields = read_fields(request.read_mask)
+
+            def query():
+                session = Session()
+                try:
+                    session.execute(visible_posts(1, PER_PAGE + 1, fields=fields)).scalars().all()
+                finally:
+                    session.close()
+
+            query_time = median_time(query)
+            rpc_time = median_time(lambda: servicer.ListPosts(request, Context()))
+            payload = servicer.ListPosts(request, Context()).ByteSize()
+            print(f"{size:>11} {name:>17} {query_time * 1000:>9.2f} {rpc_time * 1000:>13.2f} {payload / 1024:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# Запуск из каталога Post_Service на пустой тестовой базе (таблицы пересоздаются):
+#   DATABASE_URL=postgresql://... python benchmarks/bench_outbox.py
+# Пропускная способность релея outbox: разбор накопленной очереди при разных размерах пачки
+# и поток 10k событий/с, который пишется параллельно с работой релея. Плюс цена записи события для CreatePost
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+import outbox
+import post_service
+import post_service_pb2
+from database import Base, engine, init_db
+from post_service import PostServicer
+
+BACKLOG = int(os.environ.get("BENCH_BACKLOG", "200000"))
+RATE = int(os.environ.get("BENCH_RATE", "10000"))
+DURATION = float(os.environ.get("BENCH_DURATION", "10"))
+BATCH_SIZES = [100, 1000, 5000]
+WRITES = 500
+
+# Событие того же размера, что пишет outbox.record_statement; t - время записи для замера задержки
+INSERT_EVENTS = text(
+    "INSERT INTO outbox_events (event_type, post_id, payload, created_at) "
+    "SELECT 'post_created', i, json_build_object('type', 'post_created', 'post_id', i, 'creator_id', i % 1000, "
+    "'is_private', false, 'tags', ARRAY['tag'], 'created_at', now(), 'updated_at', now(), "
+    "'t', extract(epoch FROM clock_timestamp()))::text, now() AT TIME ZONE 'utc' "
+    "FROM generate_series(1, :count) AS i"
+)
+
+
+class Context:
+    def set_code(self, code):
+        raise RuntimeError(code)
+
+    def set_details(self, details):
+        pass
+
+
+class LagBroker:
+    # Запоминает, через сколько после записи событие дошло до брокера
+    def __init__(self):
+        self.lags = []
+
+    def publish(self, events):
+        now = time.time()
+        self.lags.extend(now - json.loads(event.payload)['t'] for event in events)
+
+
+def reset():
+    Base.metadata.drop_all(engine)
+    init_db()
+
+
+def insert_events(count):
+    with engine.begin() as connection:
+        connection.execute(INSERT_EVENTS, {'count': count})
+
+
+def pending():
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT count(*) FROM outbox_events")).scalar()
+
+
+def drain(relay):
+    start = time.perf_counter()
+    while relay.relay_batch():
+        pass
+    return time.perf_counter() - start
+
+
+def backlog(batch_size, broker):
+    insert_events(BACKLOG)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text("VACUUM ANALYZE outbox_events"))
+    return BACKLOG / drain(outbox.OutboxRelay(broker, batch_size=batch_size))
+
+
+def produce(stop):
+    # Пачки по 1/100 секундного потока каждые 10 мс
+    chunk = RATE // 100
+    next_at = time.perf_counter()
+    while not stop.is_set():
+        insert_events(chunk)
+        next_at += 0.01
+        time.sleep(max(0, next_at - time.perf_counter()))
+
+
+def stream(interval):
+    broker = LagBroker()
+    relay = outbox.OutboxRelay(broker, batch_size=1000, interval=interval)
+    stop_producer, stop_relay = threading.Event(), threading.Event()
+    producer = threading.Thread(target=produce, args=(stop_producer,))
+    relay_thread = threading.Thread(target=relay.run, args=(stop_relay,))
+    start = time.perf_counter()
+    producer.start()
+    relay_thread.start()
+    time.sleep(DURATION)
+    stop_producer.set()
+    producer.join()
+    # Релей дорабатывает до пустой очереди: остаток не попадает в следующий замер
+    while pending():
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    stop_relay.set()
+    relay_thread.join()
+    lags = sorted(broker.lags)
+    return len(lags) / elapsed, lags[len(lags) // 2] * 1000, lags[int(len(lags) * 0.99)] * 1000
+
+
+def create_posts(servicer):
+    context = Context()
+    timings = []
+    for i in range(WRITES):
+        request = post_service_pb2.CreatePostRequest(title=f'Post {i}', description='Description', creator_id=i % 100)
+        start = time.perf_counter()
+        servicer.CreatePost(request, context)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.99)] * 1000
+
+
+def main():
+    reset()
+    print(f"backlog: {BACKLOG} events")
+    print(f"{'broker':<8} {'batch':>6} {'events/s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for batch_size in BATCH_SIZES:
+            for name, broker in (('memory', outbox.MemoryBroker()), ('file', outbox.FileBroker(os.path.join(directory, 'events.jsonl')))):
+                print(f"{name:<8} {batch_size:>6} {backlog(batch_size, broker):>10.0f}")
+
+    print(f"\nstream: {RATE} events/s for {DURATION:.0f}s, batch 1000")
+    print(f"{'poll interval s':>15} {'published/s':>12} {'lag p50 ms':>11} {'lag p99 ms':>11}")
+    for interval in (outbox.OUTBOX_POLL_INTERVAL, 0.05):
+        rate, p50, p99 = stream(interval)
+        print(f"{interval:>15} {rate:>12.0f} {p50:>11.1f} {p99:>11.1f}")
+
+    # Релей в этом замере не работает: видна только цена записи события в команде CreatePost
+    print(f"\n{'CreatePost':<22} {'p50 ms':>8} {'p99 ms':>8}")
+    post_service.post_cache = None
+    servicer = PostServicer()
+    for record in (False, True):
+        outbox.RECORD_EVENTS = record
+        create_posts(servicer)
+        p50, p99 = create_posts(servicer)
+        print(f"{'with outbox' if record else 'without outbox':<22} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
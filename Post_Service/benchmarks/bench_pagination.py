@@ -0,0 +1,112 @@
+# Запуск из каталога Post_Service на пустой тестовой базе (таблица posts пересоздаётся):
+#   DATABASE_URL=postgresql://... python benchmarks/bench_pagination.py
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text, tuple_
+import counters
+import post_service_pb2
+from database import Base, Post, Session, engine, init_db
+from pagination import encode_page_token, decode_page_token
+from post_service import PostServicer
+
+ROWS = int(os.environ.get("BENCH_ROWS", "250000"))
+PER_PAGE = 20
+PAGES = (1, 100, 1000, 10000)
+REPEAT = 20
+
+
+class Context:
+    def set_code(self, code):
+        raise RuntimeError(code)
+
+    def set_details(self, details):
+        pass
+
+
+def seed():
+    Base.metadata.drop_all(engine)
+    init_db()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO posts (title, description, creator_id, created_at, updated_at, is_private, tags) "
+            "SELECT 'Post ' || i, 'Description', i % 1000, "
+            "now() - make_interval(secs => i), now() - make_interval(secs => i), i % 10 = 0, ARRAY['bench'] "
+            "FROM generate_series(1, :rows) AS i"
+        ), {'rows': ROWS})
+        connection.execute(text("ANALYZE posts"))
+    # Строки вставлены в обход сервиса, счётчики для total пересчитываются разом
+    session = Session()
+    try:
+        counters.reconcile(session)
+    finally:
+        session.close()
+
+
+def cursor_before(page):
+    # Курсор, который клиент получил бы на предыдущей странице
+    if page == 1:
+        return ''
+    session = Session()
+    try:
+        row = session.query(Post.created_at, Post.id).filter(
+            (Post.is_private == False) | (Post.creator_id == 1)
+        ).order_by(Post.created_at.desc(), Post.id.desc()).offset((page - 1) * PER_PAGE - 1).first()
+        return encode_page_token(row.created_at, row.id)
+    finally:
+        session.close()
+
+
+def median_time(fn):
+    fn()
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def page_query(page=None, cursor=None):
+    # Только выборка страницы, без подсчёта total, который одинаков для обоих режимов
+    session = Session()
+    try:
+        query = session.query(Post).filter((Post.is_private == False) | (Post.creator_id == 1))
+        if cursor is not None:
+            query = query.filter(tuple_(Post.created_at, Post.id) < cursor)
+        query = query.order_by(Post.created_at.desc(), Post.id.desc())
+        if page is not None:
+            query = query.offset((page - 1) * PER_PAGE)
+        return query.limit(PER_PAGE + 1).all()
+    finally:
+        session.close()
+
+
+def main():
+    seed()
+    servicer = PostServicer()
+    print(f"rows: {ROWS}, per_page: {PER_PAGE}")
+    print(f"{'page':>6} {'offset rpc ms':>14} {'cursor rpc ms':>14} {'offset query ms':>16} {'cursor query ms':>16} {'same rows':>10}")
+    for page in PAGES:
+        token = cursor_before(page)
+        offset_request = post_service_pb2.ListPostsRequest(page=page, per_page=PER_PAGE, user_id=1)
+        cursor_request = post_service_pb2.ListPostsRequest(page_token=token, per_page=PER_PAGE, user_id=1)
+        cursor = decode_page_token(token) if token else None
+
+        offset_rpc = median_time(lambda: servicer.ListPosts(offset_request, Context()))
+        cursor_rpc = median_time(lambda: servicer.ListPosts(cursor_request, Context()))
+        offset_query = median_time(lambda: page_query(page=page))
+        cursor_query = median_time(lambda: page_query(cursor=cursor))
+
+        same = [p.id for p in servicer.ListPosts(offset_request, Context()).posts] == \
+            [p.id for p in servicer.ListPosts(cursor_request, Context()).posts]
+        print(f"{page:>6} {offset_rpc * 1000:>14.2f} {cursor_rpc * 1000:>14.2f} "
+              f"{offset_query * 1000:>16.2f} {cursor_query * 1000:>16.2f} {str(same):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# Запуск из каталога Post_Service на пустой тестовой базе (таблица posts пересоздаётся):
+#   DATABASE_URL=postgresql://... python benchmarks/bench_post_cache.py
+# GetPost по горячим постам (распределение Ципфа) без кеша и с кешем LRU разного размера,
+# затем одновременное чтение только что истёкшего горячего поста
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, text
+import post_service
+import post_service_pb2
+from database import Base, engine, init_db
+from post_cache import PostCache, LruBackend
+from post_service import PostServicer
+
+ROWS = int(os.environ.get("BENCH_ROWS", "100000"))
+THREADS = int(os.environ.get("BENCH_THREADS", "8"))
+DURATION = float(os.environ.get("BENCH_DURATION", "5"))
+CACHE_SIZES = [int(size) for size in os.environ.get("BENCH_CACHE_SIZES", "1000,10000").split(',')]
+STAMPEDE_CLIENTS = 50
+
+queries = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_query(*args):
+    global queries
+    queries += 1
+
+
+class Context:
+    def set_code(self, code):
+        pass
+
+    def set_details(self, details):
+        pass
+
+
+def seed():
+    Base.metadata.drop_all(engine)
+    init_db()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO posts (title, description, creator_id, created_at, updated_at, is_private, tags) "
+            "SELECT 'Post ' || i, repeat('Description ', 20), i % 1000, now(), now(), i % 10 = 0, ARRAY['tag'] "
+            "FROM generate_series(1, :rows) AS i"
+        ), {'rows': ROWS})
+        connection.execute(text("ANALYZE posts"))
+
+
+def zipf_id(rng):
+    # Плотность ~1/k: немногие посты получают большую часть чтений; иногда id за пределами таблицы
+    return int((ROWS * 1.01) ** rng.random())
+
+
+def load(servicer):
+    global queries
+    queries = 0
+    done = [0] * THREADS
+    stop_at = time.monotonic() + DURATION
+
+    def worker(index):
+        rng = random.Random(index)
+        context = Context()
+        while time.monotonic() < stop_at:
+            servicer.GetPost(post_service_pb2.GetPostRequest(post_id=zipf_id(rng), user_id=rng.randint(1, 1000)), context)
+            done[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(done), queries
+
+
+def stampede(servicer):
+    global queries
+    queries = 0
+    barrier = threading.Barrier(STAMPEDE_CLIENTS)
+
+    def client():
+        barrier.wait()
+        servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=1), Context())
+
+    threads = [threading.Thread(target=client) for _ in range(STAMPEDE_CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return queries
+
+
+def main():
+    seed()
+    servicer = PostServicer()
+    print(f"rows: {ROWS}, threads: {THREADS}, duration: {DURATION:.0f}s")
+    print(f"{'cache':>10} {'rps':>8} {'db queries':>11} {'hit ratio':>10} {'entries':>8} {'memory MB':>10}")
+    for size in [0] + CACHE_SIZES:
+        post_service.post_cache = PostCache(LruBackend(size)) if size else None
+        calls, db_queries = load(servicer)
+        stats = post_service.post_cache.stats() if size else {'hit_ratio': 0.0, 'entries': 0, 'memory_bytes': 0}
+        print(f"{size or 'none':>10} {calls / DURATION:>8.0f} {db_queries:>11} {stats['hit_ratio']:>10.2f} "
+              f"{stats['entries']:>8} {stats['memory_bytes'] / 1e6:>10.1f}")
+
+    print(f"\n{STAMPEDE_CLIENTS} concurrent GetPost of one expired post:")
+    post_service.post_cache = None
+    print(f"  without cache: {stampede(servicer)} db queries")
+    post_service.post_cache = PostCache(LruBackend(10))
+    print(f"  with cache:    {stampede(servicer)} db queries")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Запуск из каталога Post_Service, PostgreSQL не нужен:
+#   python benchmarks/bench_search.py
+# Сравнивает встроенный индекс FTS5 с перебором всех постов (как ILIKE '%слово%' без индекса)
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SqliteSearchBackend, query_terms
+
+ROWS = int(os.environ.get("BENCH_ROWS", "200000"))
+VOCABULARY = 20000
+PER_PAGE = 20
+REPEAT = 10
+QUERY_RANKS = (1, 10, 100, 1000, 10000)
+
+
+def word(rank):
+    return f"w{rank}"
+
+
+def zipf_word(rng):
+    # Плотность ~1/k, как в bench_tags
+    return word(int(VOCABULARY ** rng.random()))
+
+
+def make_posts():
+    rng = random.Random(42)
+    posts = []
+    for i in range(1, ROWS + 1):
+        posts.append(SimpleNamespace(
+            id=i,
+            title=' '.join(zipf_word(rng) for _ in range(4)),
+            description=' '.join(zipf_word(rng) for _ in range(20)),
+            creator_id=i % 1000,
+            is_private=i % 10 == 0
+        ))
+    return posts
+
+
+def scan(posts, user_id, query, limit):
+    terms = query_terms(query)
+    found = []
+    for post in posts:
+        if post.is_private and post.creator_id != user_id:
+            continue
+        words = set(post.title.split()) | set(post.description.split())
+        if all(term in words for term in terms):
+            found.append(post.id)
+    found.sort(reverse=True)
+    return found[:limit]
+
+
+def median_time(fn):
+    fn()
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    posts = make_posts()
+    backend = SqliteSearchBackend()
+    start = time.perf_counter()
+    for post in posts:
+        backend.index_post(post)
+    build = time.perf_counter() - start
+
+    print(f"rows: {ROWS}, vocabulary: {VOCABULARY}, per_page: {PER_PAGE}")
+    print(f"index build: {build:.1f} s ({build / ROWS * 1e6:.0f} us per post)")
+    print(f"{'query':>14} {'fts ms':>8} {'scan ms':>9} {'speedup':>8}")
+    queries = [word(rank) for rank in QUERY_RANKS] + [f"{word(1)} {word(100)}", f"{word(10)} {word(1000)}"]
+    for query in queries:
+        fts = median_time(lambda: backend.search(None, 1, query, PER_PAGE + 1))
+        full = median_time(lambda: scan(posts, 1, query, PER_PAGE + 1))
+        print(f"{query:>14} {fts * 1000:>8.2f} {full * 1000:>9.2f} {full / fts:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# Запуск из каталога Post_Service на пустой тестовой базе (таблица posts пересоздаётся):
+#   DATABASE_URL=postgresql://... python benchmarks/bench_stream.py
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, text
+import post_service_pb2
+from database import Base, Post, Session, engine, init_db
+from post_service import PostServicer, post_message
+
+ROWS_STEPS = [int(rows) for rows in os.environ.get("BENCH_ROWS", "50000,200000").split(',')]
+
+
+class Context:
+    def set_code(self, code):
+        raise RuntimeError(code)
+
+    def set_details(self, details):
+        pass
+
+    def is_active(self):
+        return True
+
+
+def seed(rows):
+    Base.metadata.drop_all(engine)
+    init_db()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO posts (title, description, creator_id, created_at, updated_at, is_private, tags) "
+            "SELECT 'Post ' || i, repeat('Description ', 20), i % 1000, "
+            "now() - make_interval(secs => i), now() - make_interval(secs => i), i % 10 = 0, ARRAY['tag' || (i % 100)] "
+            "FROM generate_series(1, :rows) AS i"
+        ), {'rows': rows})
+        connection.execute(text("ANALYZE posts"))
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count, calls = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, calls, elapsed, peak
+
+
+def stream(servicer):
+    count = 0
+    for _ in servicer.StreamPosts(post_service_pb2.StreamPostsRequest(user_id=1), Context()):
+        count += 1
+    return count, 1
+
+
+def paged(servicer):
+    count, calls, token = 0, 0, ''
+    while True:
+        response = servicer.ListPosts(post_service_pb2.ListPostsRequest(
+            per_page=100, user_id=1, page_token=token, total_mode=post_service_pb2.TOTAL_NONE
+        ), Context())
+        count += len(response.posts)
+        calls += 1
+        token = response.next_page_token
+        if not token:
+            return count, calls
+
+
+def load_all():
+    # Как выглядел бы потоковый RPC поверх .all(): весь результат в памяти до первого сообщения
+    session = Session()
+    try:
+        posts = [post_message(post) for post in session.execute(
+            select(Post).where((Post.is_private == False) | (Post.creator_id == 1)).order_by(Post.id)
+        ).scalars().all()]
+        return len(posts), 1
+    finally:
+        session.close()
+
+
+def main():
+    servicer = PostServicer()
+    print(f"{'rows':>8} {'method':>22} {'posts':>8} {'calls':>6} {'time s':>7} {'peak MB':>8}")
+    for rows in ROWS_STEPS:
+        seed(rows)
+        for name, fn in [('StreamPosts', lambda: stream(servicer)),
+                         ('ListPosts per_page=100', lambda: paged(servicer)),
+                         ('.all() then send', load_all)]:
+            count, calls, elapsed, peak = measure(fn)
+            print(f"{rows:>8} {name:>22} {count:>8} {calls:>6} {elapsed:>7.2f} {peak / 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Запуск из каталога Post_Service на пустой тестовой базе (таблица posts пересоздаётся):
+#   DATABASE_URL=postgresql://... python benchmarks/bench_tags.py
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+import post_service_pb2
+from database import Base, engine, init_db
+from post_service import PostServicer
+from queries import visible_posts, tags_condition
+
+ROWS = int(os.environ.get("BENCH_ROWS", "1000000"))
+VOCABULARY = 10000
+PER_PAGE = 20
+REPEAT = 10
+TAG_RANKS = (1, 10, 100, 1000, 5000)
+
+
+class Context:
+    def set_code(self, code):
+        raise RuntimeError(code)
+
+    def set_details(self, details):
+        pass
+
+
+def seed():
+    Base.metadata.drop_all(engine)
+    init_db()
+    with engine.begin() as connection:
+        # exp(random() * ln(N)) даёт плотность ~1/k: частота тега с рангом k по закону Ципфа (s = 1)
+        connection.execute(text(
+            "INSERT INTO posts (title, description, creator_id, created_at, updated_at, is_private, tags) "
+            "SELECT 'Post ' || i, 'Description', i % 10000, "
+            "now() - make_interval(secs => i), now() - make_interval(secs => i), i % 10 = 0, "
+            "ARRAY(SELECT DISTINCT 'tag' || floor(exp(random() * ln(:vocabulary)))::int "
+            "      FROM generate_series(1, 1 + (i % 4)) WHERE i > 0) "
+            "FROM generate_series(1, :rows) AS i"
+        ), {'rows': ROWS, 'vocabulary': VOCABULARY})
+        connection.execute(text("ANALYZE posts"))
+
+
+def median_time(fn):
+    fn()
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def plan_and_scan_time(tags, match_all):
+    query = visible_posts(1, PER_PAGE + 1, condition=tags_condition(tags, match_all))
+    sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+    with engine.connect() as connection:
+        plan = '\n'.join(row[0] for row in connection.execute(text(f"EXPLAIN {sql}")))
+        index = 'gin' if 'ix_posts_tags' in plan else 'feed index' if 'ix_posts_public_created_at' in plan else 'seq scan'
+
+        # Тот же запрос без индексов: так выглядела бы фильтрация перебором
+        connection.execute(text("SET enable_indexscan = off"))
+        connection.execute(text("SET enable_bitmapscan = off"))
+        scan = median_time(lambda: connection.execute(text(sql)).all())
+        connection.rollback()
+    return index, scan
+
+
+def main():
+    seed()
+    servicer = PostServicer()
+    with engine.connect() as connection:
+        matches = dict(connection.execute(text(
+            "SELECT tag, count(*) FROM posts, unnest(tags) AS tag GROUP BY tag"
+        )).all())
+
+    print(f"rows: {ROWS}, tags: {len(matches)}, per_page: {PER_PAGE}")
+    print(f"{'query':>22} {'matching':>9} {'plan':>11} {'rpc ms':>8} {'no index ms':>12}")
+    cases = [([f'tag{rank}'], False) for rank in TAG_RANKS]
+    cases += [(['tag1', 'tag2'], True), (['tag100', 'tag1000'], False), (['tag3', 'tag7'], True)]
+    for tags, match_all in cases:
+        request = post_service_pb2.ListPostsByTagRequest(
+            tags=tags,
+            match=post_service_pb2.TAG_MATCH_ALL if match_all else post_service_pb2.TAG_MATCH_ANY,
+            per_page=PER_PAGE,
+            user_id=1
+        )
+        rpc = median_time(lambda: servicer.ListPostsByTag(request, Context()))
+        index, scan = plan_and_scan_time(tags, match_all)
+        label = (' & ' if match_all else ' | ').join(tags)
+        count = '-' if len(tags) > 1 else matches.get(tags[0], 0)
+        print(f"{label:>22} {count:>9} {index:>11} {rpc * 1000:>8.2f} {scan * 1000:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# Запуск из каталога Post_Service на пустой тестовой базе (таблицы пересоздаются):
+#   DATABASE_URL=postgresql://... python benchmarks/bench_timeline.py
+# HomeTimeline и CreatePost на графе подписок со степенным распределением: у автора k около 1/k
+# от всех подписок. Гибридная рассылка сравнивается с чтением всех авторов при чтении (pull)
+# и с рассылкой постов самого популярного автора (push)
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+import post_service
+import post_service_pb2
+from database import Base, engine, init_db
+from post_service import PostServicer
+from timeline import FANOUT_MAX_FOLLOWERS
+
+USERS = int(os.environ.get("BENCH_USERS", "100000"))
+FOLLOWS_PER_USER = int(os.environ.get("BENCH_FOLLOWS_PER_USER", "10"))
+POSTS = int(os.environ.get("BENCH_POSTS", "200000"))
+READERS = 200
+WRITES = 20
+PER_PAGE = 20
+
+
+class Context:
+    def set_code(self, code):
+        raise RuntimeError(code)
+
+    def set_details(self, details):
+        pass
+
+
+def seed():
+    Base.metadata.drop_all(engine)
+    init_db()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO follows (follower_id, followee_id, created_at, pulled) "
+            "SELECT DISTINCT u, floor(power(:users + 1.0, random()))::int, now(), false "
+            "FROM generate_series(1, :users) AS u, generate_series(1, :follows) AS n "
+            "ON CONFLICT DO NOTHING"
+        ), {'users': USERS, 'follows': FOLLOWS_PER_USER})
+        connection.execute(text("DELETE FROM follows WHERE follower_id = followee_id"))
+        connection.execute(text(
+            "INSERT INTO follower_counts (user_id, count, pulled) "
+            "SELECT followee_id, count(*), count(*) >= :limit FROM follows GROUP BY followee_id"
+        ), {'limit': FANOUT_MAX_FOLLOWERS})
+        connection.execute(text(
+            "UPDATE follows f SET pulled = true FROM follower_counts c WHERE c.user_id = f.followee_id AND c.pulled"
+        ))
+        connection.execute(text(
+            "INSERT INTO posts (title, description, creator_id, created_at, updated_at, is_private, tags) "
+            "SELECT 'Post ' || i, repeat('Description ', 20), 1 + (i * 7919) % :users, "
+            "now() - make_interval(secs => i), now() - make_interval(secs => i), i % 10 = 0, ARRAY['tag'] "
+            "FROM generate_series(1, :posts) AS i"
+        ), {'users': USERS, 'posts': POSTS})
+        # Та же рассылка, что делает CreatePost, для уже существующих постов
+        connection.execute(text(
+            "INSERT INTO timeline_entries (user_id, created_at, post_id, author_id) "
+            "SELECT f.follower_id, p.created_at, p.id, p.creator_id FROM posts p "
+            "JOIN follows f ON f.followee_id = p.creator_id WHERE NOT p.is_private AND NOT f.pulled"
+        ))
+    # После массовой вставки без VACUUM index-only scan ходит в таблицу, а первые чтения ставят hint bits
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        for table in ('follows', 'follower_counts', 'posts', 'timeline_entries'):
+            connection.execute(text(f"VACUUM ANALYZE {table}"))
+
+
+def scalar(sql, **params):
+    with engine.connect() as connection:
+        return connection.execute(text(sql), params).scalar()
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.99)] * 1000
+
+
+def read(servicer, per_page):
+    rng = random.Random(1)
+    context = Context()
+    timings = []
+    # Первый проход прогревает буферы, замеряется второй
+    for user_id in [rng.randint(1, USERS) for _ in range(READERS)] * 2:
+        request = post_service_pb2.HomeTimelineRequest(user_id=user_id, per_page=per_page)
+        start = time.perf_counter()
+        servicer.HomeTimeline(request, context)
+        timings.append(time.perf_counter() - start)
+    return percentiles(timings[READERS:])
+
+
+def write(servicer, author_id):
+    context = Context()
+    timings = []
+    for _ in range(WRITES):
+        request = post_service_pb2.CreatePostRequest(title='New', description='Description', creator_id=author_id)
+        start = time.perf_counter()
+        servicer.CreatePost(request, context)
+        timings.append(time.perf_counter() - start)
+    return percentiles(timings)
+
+
+def set_pulled(authors, pulled):
+    # authors - подзапрос с id авторов; follows и follower_counts меняются вместе, как в timeline.promote
+    with engine.begin() as connection:
+        connection.execute(text(f"UPDATE follows SET pulled = :pulled WHERE followee_id IN ({authors})"), {'pulled': pulled})
+        connection.execute(text(f"UPDATE follower_counts SET pulled = :pulled WHERE user_id IN ({authors})"), {'pulled': pulled})
+        connection.execute(text("ANALYZE follows"))
+
+
+def main():
+    seed()
+    post_service.post_cache = None
+    servicer = PostServicer()
+    top = scalar("SELECT user_id FROM follower_counts ORDER BY count DESC LIMIT 1")
+    typical = scalar("SELECT user_id FROM follower_counts WHERE count < :limit ORDER BY count DESC LIMIT 1 OFFSET 100",
+                     limit=FANOUT_MAX_FOLLOWERS)
+    print(f"users: {USERS}, follows: {scalar('SELECT count(*) FROM follows')}, posts: {POSTS}, "
+          f"timeline entries: {scalar('SELECT count(*) FROM timeline_entries')}")
+    print(f"pulled authors (>= {FANOUT_MAX_FOLLOWERS} followers): "
+          f"{scalar('SELECT count(*) FROM follower_counts WHERE pulled')}, "
+          f"top author: {scalar('SELECT max(count) FROM follower_counts')} followers, "
+          f"typical author: {scalar('SELECT count FROM follower_counts WHERE user_id = :id', id=typical)}")
+
+    print(f"\n{'HomeTimeline':<22} {'per_page':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for per_page in (PER_PAGE, 100):
+        p50, p99 = read(servicer, per_page)
+        print(f"{'hybrid':<22} {per_page:>8} {p50:>8.2f} {p99:>8.2f}")
+    # Все авторы читаются при чтении, как если бы материализованных лент не было
+    set_pulled("SELECT user_id FROM follower_counts", True)
+    for per_page in (PER_PAGE, 100):
+        p50, p99 = read(servicer, per_page)
+        print(f"{'pull all authors':<22} {per_page:>8} {p50:>8.2f} {p99:>8.2f}")
+    set_pulled(f"SELECT user_id FROM follower_counts WHERE count < {FANOUT_MAX_FOLLOWERS}", False)
+
+    print(f"\n{'CreatePost':<22} {'p50 ms':>8} {'p99 ms':>8}")
+    p50, p99 = write(servicer, typical)
+    print(f"{'typical author, push':<22} {p50:>8.2f} {p99:>8.2f}")
+    p50, p99 = write(servicer, top)
+    print(f"{'top author, pulled':<22} {p50:>8.2f} {p99:>8.2f}")
+    set_pulled(str(top), False)
+    p50, p99 = write(servicer, top)
+    print(f"{'top author, push':<22} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
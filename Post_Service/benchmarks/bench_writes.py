@@ -0,0 +1,121 @@
+# Запуск из каталога Post_Service на пустой тестовой базе (таблицы пересоздаются):
+#   DATABASE_URL=postgresql://... python benchmarks/bench_writes.py
+# Сравнивает прежнюю запись постов (ORM: чтение, изменение, отдельные upsert счётчиков)
+# с командами RETURNING из queries.py. Каждая команда - отдельный проход до базы,
+# поэтому кроме времени считается число команд на операцию
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+import counters
+from database import Base, Post, PostCounter, Session, engine, init_db
+from post_service import post_message
+from queries import create_post, update_own_post, delete_own_post
+
+OPERATIONS = int(os.environ.get("BENCH_OPERATIONS", "2000"))
+
+statements = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_statement(*args):
+    global statements
+    statements += 1
+
+
+def legacy_adjust(session, scope, delta):
+    statement = insert(PostCounter).values(scope=scope, count=delta, version=1)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[PostCounter.scope],
+        set_={'count': PostCounter.count + statement.excluded.count, 'version': PostCounter.version + 1}
+    ))
+
+
+def legacy_create(session, i):
+    post = Post(title=f"Post {i}", description="Description", creator_id=i % 100, is_private=False, tags=['tag'])
+    session.add(post)
+    legacy_adjust(session, counters.PUBLIC_SCOPE, 1)
+    session.commit()
+    # После commit объект перечитывается: ещё один SELECT ради id и дат
+    return post_message(post).id, post.creator_id
+
+
+def legacy_update(session, post_id, user_id):
+    post = session.query(Post).filter(Post.id == post_id).with_for_update().first()
+    old_scope = counters.post_scope(post.is_private, post.creator_id)
+    post.title = f"Updated {post_id}"
+    post.is_private = not post.is_private
+    post.updated_at = datetime.utcnow()
+    legacy_adjust(session, old_scope, -1)
+    legacy_adjust(session, counters.post_scope(post.is_private, post.creator_id), 1)
+    session.commit()
+    post_message(post)
+
+
+def legacy_delete(session, post_id, user_id):
+    post = session.query(Post).filter(Post.id == post_id).first()
+    session.delete(post)
+    legacy_adjust(session, counters.post_scope(post.is_private, post.creator_id), -1)
+    session.commit()
+
+
+def single_create(session, i):
+    post = session.execute(create_post(dict(
+        title=f"Post {i}", description="Description", creator_id=i % 100, is_private=False, tags=['tag']
+    ))).first()
+    session.commit()
+    return post_message(post).id, post.creator_id
+
+
+def single_update(session, post_id, user_id):
+    post = session.execute(update_own_post(post_id, user_id, {
+        'title': f"Updated {post_id}", 'is_private': ~Post.is_private, 'updated_at': datetime.utcnow()
+    })).first()
+    session.commit()
+    post_message(post)
+
+
+def single_delete(session, post_id, user_id):
+    session.execute(delete_own_post(post_id, user_id)).first()
+    session.commit()
+
+
+def timed(name, phase, operations):
+    global statements
+    statements = 0
+    start = time.perf_counter()
+    count = sum(1 for _ in operations)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8} {phase:>7} {count / elapsed:>8.0f} {statements / count:>14.1f}")
+
+
+def run(name, create, update, delete):
+    Base.metadata.drop_all(engine)
+    init_db()
+    session = Session()
+    try:
+        posts = []
+        timed(name, 'create', (posts.append(create(session, i)) for i in range(OPERATIONS)))
+        timed(name, 'update', (update(session, *post) for post in posts))
+        # Удаляется половина: на оставшихся пересчёт проверяет, что счётчики сошлись
+        timed(name, 'delete', (delete(session, *post) for post in posts[::2]))
+        assert counters.reconcile(session) == 0
+        session.commit()
+    finally:
+        session.close()
+
+
+def main():
+    print(f"operations: {OPERATIONS}")
+    print(f"{'path':>8} {'op':>7} {'ops/s':>8} {'statements/op':>14}")
+    run('legacy', legacy_create, legacy_update, legacy_delete)
+    run('single', single_create, single_update, single_delete)
+
+
+if __name__ == '__main__':
+    main()
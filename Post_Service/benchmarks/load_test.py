@@ -0,0 +1,191 @@
+# Запуск из каталога Post_Service на пустой тестовой базе (таблица posts пересоздаётся):
+#   DATABASE_URL=postgresql://... BENCH_DB_LATENCY_MS=5 python benchmarks/load_test.py
+# Поднимает сервер в каждом режиме (POST_SERVICE_MODE=sync|async, BENCH_WORKERS воркеров) отдельным процессом
+# и нагружает его смесью GetPost и ListPosts с 10, 100 и 1000 одновременных клиентов.
+# BENCH_DB_LATENCY_MS добавляет задержку между сервером и PostgreSQL, как сеть между машинами:
+# на локальной базе ожидания почти нет, и оба режима упираются только в CPU
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grpc
+from grpc_health.v1 import health_pb2, health_pb2_grpc
+from sqlalchemy import text
+import post_service_pb2
+import post_service_pb2_grpc
+from database import Base, engine, init_db
+
+ROWS = int(os.environ.get("BENCH_ROWS", "100000"))
+CONCURRENCY = [int(value) for value in os.environ.get("BENCH_CONCURRENCY", "10,100,1000").split(',')]
+DURATION = float(os.environ.get("BENCH_DURATION", "10"))
+# Соединения с базой и каналы открываются до начала замера
+WARMUP = float(os.environ.get("BENCH_WARMUP", "2"))
+# Один процесс asyncio-клиента сам упирается в CPU раньше сервера
+CLIENT_PROCESSES = int(os.environ.get("BENCH_CLIENT_PROCESSES", "4"))
+LIST_SHARE = 0.2
+DB_LATENCY = float(os.environ.get("BENCH_DB_LATENCY_MS", "0")) / 1000
+DB_POOL_SIZE = os.environ.get("BENCH_DB_POOL_SIZE", "50")
+# Например 1,4: один процесс против prefork; пул делится между воркерами
+WORKERS = [int(value) for value in os.environ.get("BENCH_WORKERS", "1").split(',')]
+MODES = os.environ.get("BENCH_MODES", "sync,async").split(',')
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed():
+    Base.metadata.drop_all(engine)
+    init_db()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO posts (title, description, creator_id, created_at, updated_at, is_private, tags) "
+            "SELECT 'Post ' || i, 'Description', i % 1000, "
+            "now() - make_interval(secs => i), now() - make_interval(secs => i), i % 10 = 0, ARRAY['tag'] "
+            "FROM generate_series(1, :rows) AS i"
+        ), {'rows': ROWS})
+        connection.execute(text("ANALYZE posts"))
+
+
+async def relay(reader, writer, delay):
+    try:
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            await asyncio.sleep(delay)
+            writer.write(chunk)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def latency_proxy(port, ready):
+    url = engine.url
+    socket_dir = url.query.get('host')
+
+    async def handle(client_reader, client_writer):
+        if socket_dir and socket_dir.startswith('/'):
+            reader, writer = await asyncio.open_unix_connection(f"{socket_dir}/.s.PGSQL.{url.port or 5432}")
+        else:
+            reader, writer = await asyncio.open_connection(url.host, url.port or 5432)
+        # Половина задержки в каждую сторону: на запрос-ответ уходит BENCH_DB_LATENCY_MS
+        await asyncio.gather(relay(client_reader, writer, DB_LATENCY / 2), relay(reader, client_writer, DB_LATENCY / 2))
+
+    server = await asyncio.start_server(handle, '127.0.0.1', port)
+    ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def database_url(proxy_port):
+    if proxy_port is None:
+        return engine.url.render_as_string(hide_password=False)
+    return engine.url.set(host='127.0.0.1', port=proxy_port, query={}).render_as_string(hide_password=False)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, workers, port, database):
+    env = dict(os.environ, POST_SERVICE_MODE=mode, POST_SERVICE_WORKERS=str(workers), GRPC_PORT=str(port),
+               COUNTER_RECONCILE_INTERVAL='0', DATABASE_URL=database,
+               DB_POOL_SIZE=DB_POOL_SIZE, DB_MAX_CONNECTIONS=DB_POOL_SIZE)
+    server = subprocess.Popen([sys.executable, 'post_service.py'], cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL)
+    channel = grpc.insecure_channel(f'127.0.0.1:{port}')
+    stub = health_pb2_grpc.HealthStub(channel)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if stub.Check(health_pb2.HealthCheckRequest(service=''), timeout=1).status == health_pb2.HealthCheckResponse.SERVING:
+                channel.close()
+                return server
+        except grpc.RpcError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+async def client(port, workers, seed_value):
+    rng = random.Random(seed_value)
+    latencies, errors = [], 0
+    async with grpc.aio.insecure_channel(f'127.0.0.1:{port}') as channel:
+        stub = post_service_pb2_grpc.PostServiceStub(channel)
+        measure_from = time.monotonic() + WARMUP
+        stop_at = measure_from + DURATION
+
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < stop_at:
+                user_id = rng.randint(1, 1000)
+                start = time.monotonic()
+                try:
+                    if rng.random() < LIST_SHARE:
+                        await stub.ListPosts(post_service_pb2.ListPostsRequest(
+                            per_page=20, user_id=user_id, total_mode=post_service_pb2.TOTAL_NONE
+                        ), timeout=60)
+                    else:
+                        await stub.GetPost(post_service_pb2.GetPostRequest(post_id=rng.randint(1, ROWS), user_id=user_id), timeout=60)
+                except grpc.aio.AioRpcError as e:
+                    # Чужой приватный пост - нормальный ответ, а не сбой
+                    if e.code() != grpc.StatusCode.PERMISSION_DENIED:
+                        errors += 1
+                        continue
+                end = time.monotonic()
+                # Считаются вызовы, завершившиеся в окне замера; задержка включает ожидание в очереди сервера
+                if measure_from <= end <= stop_at:
+                    latencies.append(end - start)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    return latencies, errors
+
+
+def client_process(args):
+    port, workers, seed_value = args
+    return asyncio.run(client(port, workers, seed_value))
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+def main():
+    seed()
+    proxy_port = None
+    if DB_LATENCY:
+        proxy_port = free_port()
+        ready = multiprocessing.Event()
+        multiprocessing.Process(target=lambda: asyncio.run(latency_proxy(proxy_port, ready)), daemon=True).start()
+        ready.wait()
+    print(f"rows: {ROWS}, duration: {DURATION:.0f}s per run, GetPost {1 - LIST_SHARE:.0%} / ListPosts {LIST_SHARE:.0%}, "
+          f"db latency: {DB_LATENCY * 1000:.0f} ms, db pool: {DB_POOL_SIZE}")
+    print(f"{'mode':>6} {'workers':>8} {'clients':>8} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for mode, workers in [(mode, workers) for mode in MODES for workers in WORKERS]:
+        port = free_port()
+        server = start_server(mode, workers, port, database_url(proxy_port))
+        try:
+            for clients in CONCURRENCY:
+                processes = min(CLIENT_PROCESSES, clients)
+                jobs = [(port, clients // processes + (1 if i < clients % processes else 0), i) for i in range(processes)]
+                with multiprocessing.Pool(processes) as pool:
+                    results = pool.map(client_process, jobs)
+                latencies = sorted(latency for part, _ in results for latency in part)
+                errors = sum(part_errors for _, part_errors in results)
+                print(f"{mode:>6} {workers:>8} {clients:>8} {len(latencies) / DURATION:>8.0f} "
+                      f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} {errors:>7}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
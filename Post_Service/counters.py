@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import func, case, select, text
+from sqlalchemy.dialects.postgresql import insert
+from database import Post, PostCounter
+
+PUBLIC_SCOPE = 'public'
+# Ключ advisory-блокировки пересчёта счётчиков
+RECONCILE_LOCK = 7301
+
+
+def private_scope(creator_id):
+    return f'private:{creator_id}'
+
+
+def post_scope(is_private, creator_id):
+    return private_scope(creator_id) if is_private else PUBLIC_SCOPE
+
+
+def scope_of(is_private, creator_id):
+    # То же, что post_scope, но выражением SQL
+    return case((is_private == True, func.concat('private:', creator_id)), else_=PUBLIC_SCOPE)
+
+
+def adjust_statement(changes):
+    # changes - CTE (scope, delta) с не более чем одной строкой на scope.
+    # Вставляется CTE в запрос изменения поста: пост и счётчики меняются одной командой.
+    # version растёт при любом изменении, даже если count не поменялся.
+    # Текстом, а не insert() из диалекта postgresql: тот не кешируется в SQLAlchemy,
+    # и вся команда компилировалась бы заново при каждом вызове
+    return text(
+        f"INSERT INTO post_counters (scope, count, version) SELECT scope, delta, 1 FROM {changes.name} "
+        "ON CONFLICT (scope) DO UPDATE SET count = post_counters.count + excluded.count, "
+        "version = post_counters.version + 1"
+    ).columns().cte('adjusted')
+
+
+def read_visible(session, user_id):
+    # Пользователь видит все публичные посты и свои приватные: два чтения по первичному ключу
+    rows = session.query(PostCounter.scope, PostCounter.count, PostCounter.version).filter(
+        PostCounter.scope.in_([PUBLIC_SCOPE, private_scope(user_id)])
+    ).all()
+    counters = {scope: (count, version) for scope, count, version in rows}
+    public_count, public_version = counters.get(PUBLIC_SCOPE, (0, 0))
+    private_count, private_version = counters.get(private_scope(user_id), (0, 0))
+    return public_count + private_count, f"{public_version}.{private_version}"
+
+
+def reconcile(session):
+    # Пересчитывает счётчики по таблице posts и исправляет расхождения.
+    # Второй экземпляр сервиса в это время пропускает пересчёт, а не исправляет те же строки ещё раз
+    if not session.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {'key': RECONCILE_LOCK}).scalar():
+        session.rollback()
+        return 0
+
+    # Пересчёт и чтение счётчиков - один запрос, то есть один снимок: запись поста меняет
+    # счётчик той же командой, поэтому в снимке они расходятся только из-за настоящей ошибки.
+    # Блокировок на время GROUP BY нет, запись постов и счётчиков идёт параллельно
+    scope = scope_of(Post.is_private, Post.creator_id)
+    actual = select(scope.label('scope'), func.count(Post.id).label('count')).group_by(scope).subquery()
+    delta = func.coalesce(actual.c.count, 0) - func.coalesce(PostCounter.count, 0)
+    drift = session.execute(
+        select(func.coalesce(actual.c.scope, PostCounter.scope), delta)
+        .select_from(actual.join(PostCounter, PostCounter.scope == actual.c.scope, full=True))
+        .where(delta != 0)
+    ).all()
+
+    # Поправка прибавляется, а не записывается итоговое значение: изменения, сделанные после снимка,
+    # не затираются. Строки блокируются только на эти короткие UPDATE
+    for name, change in drift:
+        statement = insert(PostCounter).values(scope=name, count=change, version=1)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[PostCounter.scope],
+            set_={'count': PostCounter.count + statement.excluded.count, 'version': PostCounter.version + 1}
+        ))
+    session.commit()
+    return len(drift)
+
+
+class CounterCache:
+    # Для total_mode=ESTIMATED: счётчики из памяти процесса, не старше ttl секунд
+    def __init__(self, ttl, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        value = read_visible(session, user_id)
+        with self._lock:
+            self._entries[user_id] = (now, value)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
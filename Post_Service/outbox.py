@@ -0,0 +1,128 @@
+import os
+import threading
+from sqlalchemy import text
+from database import Session
+
+# none - события не записываются. memory, file:///<path> или kafka://<host:port>/<topic> (нужен пакет kafka-python)
+OUTBOX_BROKER = os.environ.get('OUTBOX_BROKER', 'none')
+RECORD_EVENTS = OUTBOX_BROKER != 'none'
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '1000'))
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '0.5'))
+
+POST_CREATED = 'post_created'
+POST_UPDATED = 'post_updated'
+POST_DELETED = 'post_deleted'
+
+# Пачка забирается и удаляется одной командой. SKIP LOCKED: второй релей (например, старый процесс
+# во время перезапуска) берёт другие строки, а не ждёт и не публикует те же
+CLAIM_EVENTS = text(
+    "WITH claimed AS (SELECT id FROM outbox_events ORDER BY id LIMIT :limit FOR UPDATE SKIP LOCKED) "
+    "DELETE FROM outbox_events o USING claimed c WHERE o.id = c.id "
+    "RETURNING o.id, o.event_type, o.post_id, o.payload"
+)
+
+
+def record_statement(posts, event_type):
+    # posts - CTE изменённых постов в команде записи, как в timeline.publish_statement.
+    # Статистике нужны id, автор и видимость: текст поста в событие не попадает
+    return text(
+        "INSERT INTO outbox_events (event_type, post_id, payload, created_at) "
+        f"SELECT '{event_type}', p.id, json_build_object("
+        f"'type', '{event_type}', 'post_id', p.id, 'creator_id', p.creator_id, 'is_private', p.is_private, "
+        "'tags', p.tags, 'created_at', p.created_at, 'updated_at', p.updated_at)::text, "
+        f"now() AT TIME ZONE 'utc' FROM {posts.name} p"
+    ).columns().cte('recorded')
+
+
+class MemoryBroker:
+    # Для тестов и бенчмарков
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def publish(self, events):
+        with self._lock:
+            self.events.extend(events)
+
+
+class FileBroker:
+    # JSON Lines, событие на строку. Пачка считается принятой после fsync
+    def __init__(self, path):
+        self.path = path
+
+    def publish(self, events):
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.writelines(f'{{"id":{event.id},"key":{event.post_id},"event":{event.payload}}}\n' for event in events)
+            file.flush()
+            os.fsync(file.fileno())
+
+
+class KafkaBroker:
+    def __init__(self, bootstrap_servers, topic):
+        # Необязательная зависимость: нужна только с Kafka
+        from kafka import KafkaProducer
+        self.producer = KafkaProducer(bootstrap_servers=bootstrap_servers, acks='all', linger_ms=5)
+        self.topic = topic
+
+    def publish(self, events):
+        futures = [
+            self.producer.send(
+                self.topic, key=str(event.post_id).encode(), value=event.payload.encode(),
+                headers=[('event_id', str(event.id).encode())]
+            )
+            for event in events
+        ]
+        self.producer.flush()
+        # Ошибка любого сообщения откатывает всю пачку
+        for future in futures:
+            future.get()
+
+
+def create_broker(url):
+    if url == 'none':
+        return None
+    if url == 'memory':
+        return MemoryBroker()
+    if url.startswith('file://'):
+        return FileBroker(url[len('file://'):])
+    if url.startswith('kafka://'):
+        servers, _, topic = url[len('kafka://'):].partition('/')
+        return KafkaBroker(servers.split(','), topic or 'post-events')
+    raise ValueError(f"Unknown outbox broker: {url}")
+
+
+class OutboxRelay:
+    def __init__(self, broker, batch_size=OUTBOX_BATCH_SIZE, interval=OUTBOX_POLL_INTERVAL, session_factory=Session):
+        self.broker = broker
+        self.batch_size = batch_size
+        self.interval = interval
+        self.session_factory = session_factory
+
+    def relay_batch(self):
+        # Удаление коммитится только после того, как брокер принял пачку; при ошибке строки
+        # возвращаются и уйдут ещё раз. Доставка at-least-once, получатель отсеивает повторы по id
+        session = self.session_factory()
+        try:
+            events = session.execute(CLAIM_EVENTS, {'limit': self.batch_size}).all()
+            if events:
+                # RETURNING не упорядочен, а события одного поста должны идти по порядку
+                events.sort(key=lambda event: event.id)
+                self.broker.publish(events)
+            session.commit()
+            return len(events)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def run(self, stop):
+        while not stop.is_set():
+            try:
+                published = self.relay_batch()
+            except Exception as e:
+                print(f"Error relaying outbox events: {str(e)}")
+                published = 0
+            # Полная пачка - очередь ещё не разобрана, следующая забирается без паузы
+            if published < self.batch_size:
+                stop.wait(self.interval)
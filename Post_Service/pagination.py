@@ -0,0 +1,35 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode(values):
+    payload = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode(token, parse):
+    # Токен непрозрачен для клиента: любая порча даёт ValueError
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        key, post_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return parse(key), int(post_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid page token: {token!r}") from e
+
+
+def encode_page_token(created_at, post_id):
+    return encode([created_at.isoformat(), post_id])
+
+
+def decode_page_token(token):
+    return decode(token, datetime.fromisoformat)
+
+
+def encode_search_token(score, post_id):
+    # Поиск упорядочен по (score, id), а не по времени
+    return encode([score, post_id])
+
+
+def decode_search_token(token):
+    return decode(token, float)
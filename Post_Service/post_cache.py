@@ -0,0 +1,301 @@
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+import post_service_pb2
+
+# Отрицательная запись: поста с таким id нет. Сериализованный настоящий пост пустым не бывает
+MISSING = b''
+# Записи, заполненные одновременно (например, после рестарта), не должны истекать все разом
+TTL_JITTER = 0.1
+
+
+class LruBackend:
+    name = 'lru'
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.evictions = 0
+
+    def _size(self, key, entry):
+        # Приблизительно: ключ, значение и кортеж записи, без накладных расходов самого словаря
+        return sys.getsizeof(key) + sys.getsizeof(entry[1]) + sys.getsizeof(entry)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= self._size(key, entry)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        if self.maxsize <= 0:
+            return
+        entry = (time.monotonic() + ttl, value)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += self._size(key, entry)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def entries(self):
+        return len(self._entries)
+
+    def memory_bytes(self):
+        return self._bytes
+
+
+class MemoryKeyValue:
+    # Заменитель внешнего хранилища в тестах: подмножество команд клиента redis
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._values.get(name)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.monotonic():
+                del self._values[name]
+                return None
+            return entry[1]
+
+    def set(self, name, value, px=None):
+        with self._lock:
+            self._values[name] = (time.monotonic() + px / 1000 if px else None, value)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._values.pop(name, None) is not None)
+
+    def dbsize(self):
+        return len(self._values)
+
+    def info(self, section=None):
+        with self._lock:
+            return {'used_memory': sum(len(name) + len(entry[1]) for name, entry in self._values.items())}
+
+
+class KeyValueBackend:
+    name = 'kv'
+
+    def __init__(self, client, prefix='post:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(f'{self.prefix}{key}')
+
+    def set(self, key, value, ttl):
+        self.client.set(f'{self.prefix}{key}', value, px=max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        self.client.delete(f'{self.prefix}{key}')
+
+    def entries(self):
+        # Всё хранилище, а не только ключи постов: отдельная база redis под кеш
+        return self.client.dbsize()
+
+    def memory_bytes(self):
+        return self.client.info('memory')['used_memory']
+
+
+class _Load:
+    def __init__(self):
+        self.done = threading.Event()
+        # Задача загрузки в get_async
+        self.future = None
+        # Запись результата загрузки и пометка stale из put() не пересекаются
+        self.lock = threading.Lock()
+        self.stale = False
+        self.result = None
+        self.error = None
+
+
+class PostCache:
+    # Значения - сериализованные сообщения Post: одинаково хранятся в памяти и во внешнем хранилище.
+    # Права на приватный пост проверяет вызывающий, кеш общий для всех пользователей
+    def __init__(self, backend, ttl=60.0, negative_ttl=5.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._loads = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _read(self, post_id):
+        # Недоступный кеш - это промах, а не ошибка запроса
+        try:
+            return self.backend.get(post_id)
+        except Exception as e:
+            print(f"Error reading post cache: {str(e)}")
+            with self._lock:
+                self.errors += 1
+            return None
+
+    def _write(self, post_id, post):
+        if post is None:
+            value, ttl = MISSING, self.negative_ttl
+        else:
+            value, ttl = post.SerializeToString(), self.ttl
+        try:
+            self.backend.set(post_id, value, ttl * (1 - random.random() * TTL_JITTER))
+        except Exception as e:
+            print(f"Error writing post cache: {str(e)}")
+            with self._lock:
+                self.errors += 1
+
+    def _hit(self, value):
+        with self._lock:
+            if value == MISSING:
+                self.negative_hits += 1
+                return None
+            self.hits += 1
+        return post_service_pb2.Post.FromString(value)
+
+    def _join(self, post_id):
+        # Истёкший горячий пост загружает один запрос, остальные ждут его результата
+        with self._lock:
+            pending = self._loads.get(post_id)
+            if pending is not None:
+                self.coalesced += 1
+                return pending, False
+            pending = self._loads[post_id] = _Load()
+            self.misses += 1
+            return pending, True
+
+    def _store(self, post_id, pending):
+        # Если пост изменили, пока шла загрузка, прочитанная строка могла устареть
+        with pending.lock:
+            if not pending.stale:
+                self._write(post_id, pending.result)
+
+    def _finish(self, post_id, pending):
+        with self._lock:
+            del self._loads[post_id]
+        pending.done.set()
+
+    def get(self, post_id, load):
+        # load() возвращает Post или None, если поста нет
+        value = self._read(post_id)
+        if value is not None:
+            return self._hit(value)
+
+        pending, leader = self._join(post_id)
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+
+        try:
+            pending.result = load()
+            self._store(post_id, pending)
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            self._finish(post_id, pending)
+        return pending.result
+
+    async def get_async(self, post_id, load):
+        # То же для asyncio: load - корутина, ожидающие не блокируют цикл
+        value = self._read(post_id)
+        if value is not None:
+            return self._hit(value)
+
+        pending, leader = self._join(post_id)
+        if leader:
+            # Загрузка идёт отдельной задачей, и начавший её запрос ждёт через shield, как остальные:
+            # его отмена (например, по дедлайну клиента) не отменяет загрузку для ожидающих
+            pending.future = asyncio.ensure_future(self._load_async(post_id, pending, load))
+            pending.future.add_done_callback(self._loaded)
+        return await asyncio.shield(pending.future)
+
+    async def _load_async(self, post_id, pending, load):
+        try:
+            pending.result = await load()
+            self._store(post_id, pending)
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            self._finish(post_id, pending)
+        return pending.result
+
+    def _loaded(self, task):
+        # Помечаем исключение как полученное, даже если ожидающих не осталось
+        if not task.cancelled():
+            task.exception()
+
+    def put(self, post_id, post):
+        # Запись через кеш после коммита: новое значение поста или отрицательная запись после удаления
+        with self._lock:
+            pending = self._loads.get(post_id)
+            self.invalidations += 1
+        if pending is not None:
+            with pending.lock:
+                pending.stale = True
+        self._write(post_id, post)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses + self.coalesced
+            stats = {
+                'backend': self.backend.name,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_ratio': (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'errors': self.errors
+            }
+        try:
+            stats['entries'] = self.backend.entries()
+            stats['memory_bytes'] = self.backend.memory_bytes()
+        except Exception as e:
+            print(f"Error reading post cache stats: {str(e)}")
+            stats['entries'] = stats['memory_bytes'] = 0
+        return stats
+
+
+def create_post_cache(url, maxsize=10000, ttl=60.0, negative_ttl=5.0):
+    if url == 'none':
+        return None
+    if url == 'lru':
+        return PostCache(LruBackend(maxsize), ttl, negative_ttl)
+    if url.startswith('redis://'):
+        # Необязательная зависимость: нужна только с внешним кешем
+        import redis
+        return PostCache(KeyValueBackend(redis.Redis.from_url(url)), ttl, negative_ttl)
+    raise ValueError(f"Unknown post cache: {url}")
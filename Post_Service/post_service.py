@@ -1,38 +1,180 @@
 import grpc
-import time
 from concurrent import futures
 import post_service_pb2
 import post_service_pb2_grpc
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ARRAY
-from sqlalchemy.orm import declarative_base, sessionmaker
+from grpc_health.v1 import health, health_pb2, health_pb2_grpc
+from sqlalchemy import Integer, ARRAY, any_, bindparam, and_
 from datetime import datetime
-from database import Post, Session, init_db
+from database import Post, Session, init_db, replicas, REPLICA_CHECK_INTERVAL
+from pagination import encode_page_token, decode_page_token, encode_search_token, decode_search_token
+from queries import visible_posts, export_posts, tags_condition, create_post, update_own_post, delete_own_post, post_owner, only_fields, home_timeline
+from search import MAX_QUERY_LENGTH, SqliteSearchBackend, create_search_backend, query_terms
+from post_cache import create_post_cache
+import counters
+import outbox
+import timeline
+import threading
+import signal
 import os
 
+COUNTER_CACHE_TTL = float(os.environ.get('COUNTER_CACHE_TTL', '5'))
+COUNTER_RECONCILE_INTERVAL = float(os.environ.get('COUNTER_RECONCILE_INTERVAL', '300'))
+
+counter_cache = counters.CounterCache(COUNTER_CACHE_TTL)
+
+MAX_FILTER_TAGS = 10
+MAX_BATCH_POSTS = 100
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', '500'))
+SHUTDOWN_GRACE = float(os.environ.get('SHUTDOWN_GRACE', '10'))
+POST_FIELDS = [field.name for field in post_service_pb2.Post.DESCRIPTOR.fields]
+# Нужны для проверки прав, поэтому возвращаются при любой маске
+REQUIRED_FIELDS = ('id', 'creator_id', 'is_private')
+
+search_backend = create_search_backend(os.environ.get('SEARCH_BACKEND', 'postgres'))
+
+# none - без кеша, redis://... - общий для всех экземпляров. lru - в памяти процесса: только когда сервис
+# работает одним процессом в одном экземпляре, иначе другие процессы до POST_CACHE_TTL отдают изменённый
+# или удалённый пост (prefork с несколькими воркерами его не примет)
+post_cache = create_post_cache(
+    os.environ.get('POST_CACHE', 'none'),
+    maxsize=int(os.environ.get('POST_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('POST_CACHE_TTL', '60')),
+    negative_ttl=float(os.environ.get('POST_CACHE_NEGATIVE_TTL', '5'))
+)
+
+def update_search_index(action, argument):
+    # Пост уже зафиксирован: сбой индекса не должен превращать успешный запрос в ошибку
+    try:
+        action(argument)
+    except Exception as e:
+        print(f"Error updating search index: {str(e)}")
+
+def read_session(user_id):
+    # Чтения уходят на реплику, если она не отстаёт и пользователь недавно ничего не писал
+    replica = replicas.engine_for(user_id)
+    if replica is None:
+        return Session()
+    return Session(bind=replica)
+
+def cache_post(post_id, post):
+    # После коммита: кеш сразу получает новое значение, None - пост удалён
+    if post_cache is not None:
+        post_cache.put(post_id, post)
+
+def cache_stats_message():
+    if post_cache is None:
+        return post_service_pb2.CacheStats(enabled=False)
+    return post_service_pb2.CacheStats(enabled=True, **post_cache.stats())
+
+def read_fields(read_mask):
+    # Пустая маска - все поля, как у клиентов, которые о ней не знают
+    if not read_mask.paths:
+        return None
+    unknown = sorted(set(read_mask.paths) - set(POST_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields in read_mask: {', '.join(unknown)}")
+    return set(read_mask.paths) | set(REQUIRED_FIELDS)
+
+def post_message(post, fields=None):
+    if fields is not None:
+        return masked_message(post, fields)
+    return post_service_pb2.Post(
+        id=post.id,
+        title=post.title,
+        description=post.description,
+        creator_id=post.creator_id,
+        created_at=post.created_at.isoformat(),
+        updated_at=post.updated_at.isoformat(),
+        is_private=post.is_private,
+        tags=post.tags
+    )
+
+def masked_message(post, fields):
+    # post - строка из базы или уже готовое сообщение из кеша
+    values = {name: getattr(post, name) for name in POST_FIELDS if name in fields}
+    for name in ('created_at', 'updated_at'):
+        if name in values and not isinstance(values[name], str):
+            values[name] = values[name].isoformat()
+    return post_service_pb2.Post(**values)
+
+def load_post(post_id, user_id, fields=None, primary=False):
+    # primary - для заполнения кеша: строка с отстающей реплики осталась бы в нём на весь TTL
+    session = Session() if primary else read_session(user_id)
+    try:
+        query = session.query(Post).filter(Post.id == post_id)
+        if fields is not None:
+            query = query.options(only_fields(Post, fields))
+        post = query.first()
+        return post_message(post, fields) if post else None
+    finally:
+        session.close()
+
+def fetch_page(session, query, per_page, fields=None):
+    return page_of(session.execute(query).scalars().all(), per_page, fields)
+
+def page_of(posts, per_page, fields=None):
+    # Запрос выбирает per_page + 1 строк: лишняя строка только сообщает, что следующая страница есть
+    next_page_token = ''
+    if len(posts) > per_page:
+        posts = posts[:per_page]
+        next_page_token = encode_page_token(posts[-1].created_at, posts[-1].id)
+    return [post_message(post, fields) for post in posts], next_page_token
+
+def follow_error(request):
+    if request.follower_id <= 0 or request.followee_id <= 0:
+        return "follower_id and followee_id are required"
+    if request.follower_id == request.followee_id:
+        return "Users cannot follow themselves"
+    return None
+
+def follows_message(rows, per_page):
+    next_page_token = ''
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_page_token = encode_page_token(rows[-1].created_at, rows[-1].user_id)
+    return post_service_pb2.ListFollowsResponse(
+        follows=[post_service_pb2.FollowEntry(user_id=row.user_id, created_at=row.created_at.isoformat()) for row in rows],
+        next_page_token=next_page_token
+    )
+
+def stream_query(request):
+    conditions = []
+    try:
+        if request.created_after:
+            conditions.append(Post.created_at >= datetime.fromisoformat(request.created_after))
+        if request.created_before:
+            conditions.append(Post.created_at < datetime.fromisoformat(request.created_before))
+    except ValueError as e:
+        raise ValueError(f"Invalid time range: {str(e)}")
+    tags = sorted({tag for tag in request.tags if tag})
+    if len(tags) > MAX_FILTER_TAGS:
+        raise ValueError(f"At most {MAX_FILTER_TAGS} tags are allowed")
+    if tags:
+        conditions.append(tags_condition(tags, match_all=request.match == post_service_pb2.TAG_MATCH_ALL))
+    if request.creator_id:
+        conditions.append(Post.creator_id == request.creator_id)
+    return export_posts(request.user_id, request.after_id, and_(*conditions) if conditions else None)
+
 class PostServicer(post_service_pb2_grpc.PostServiceServicer):
     def CreatePost(self, request, context):
         session = Session()
         try:
-            new_post = Post(
+            # INSERT ... RETURNING: ответ строится из вставленной строки, без перечитывания после коммита
+            new_post = session.execute(create_post(dict(
                 title=request.title,
                 description=request.description,
                 creator_id=request.creator_id,
                 is_private=request.is_private,
                 tags=list(request.tags)
-            )
-            session.add(new_post)
+            ))).first()
             session.commit()
+            replicas.note_write(request.creator_id)
+            update_search_index(search_backend.index_post, new_post)
+            message = post_message(new_post)
+            # Отрицательная запись для этого id могла остаться от запроса до создания
+            cache_post(new_post.id, message)
             
-            return post_service_pb2.Post(
-                id=new_post.id,
-                title=new_post.title,
-                description=new_post.description,
-                creator_id=new_post.creator_id,
-                created_at=new_post.created_at.isoformat(),
-                updated_at=new_post.updated_at.isoformat(),
-                is_private=new_post.is_private,
-                tags=new_post.tags
-            )
+            return message
         except Exception as e:
             session.rollback()
             context.set_code(grpc.StatusCode.INTERNAL)
@@ -42,9 +184,21 @@ class PostServicer(post_service_pb2_grpc.PostServiceServicer):
             session.close()
     
     def GetPost(self, request, context):
-        session = Session()
         try:
-            post = session.query(Post).filter(Post.id == request.post_id).first()
+            fields = read_fields(request.read_mask)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return post_service_pb2.Post()
+
+        try:
+            if post_cache is not None:
+                # В кеше лежат полные посты: маска применяется к готовому сообщению
+                post = post_cache.get(request.post_id, lambda: load_post(request.post_id, request.user_id, primary=True))
+                if post and fields is not None:
+                    post = masked_message(post, fields)
+            else:
+                post = load_post(request.post_id, request.user_id, fields)
             
             if not post:
                 context.set_code(grpc.StatusCode.NOT_FOUND)
@@ -56,58 +210,43 @@ class PostServicer(post_service_pb2_grpc.PostServiceServicer):
                 context.set_details("You don't have permission to view this private post")
                 return post_service_pb2.Post()
             
-            return post_service_pb2.Post(
-                id=post.id,
-                title=post.title,
-                description=post.description,
-                creator_id=post.creator_id,
-                created_at=post.created_at.isoformat(),
-                updated_at=post.updated_at.isoformat(),
-                is_private=post.is_private,
-                tags=post.tags
-            )
+            return post
         except Exception as e:
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(f"Error retrieving post: {str(e)}")
             return post_service_pb2.Post()
-        finally:
-            session.close()
     
     def UpdatePost(self, request, context):
         session = Session()
         try:
-            post = session.query(Post).filter(Post.id == request.post_id).first()
-            
-            if not post:
-                context.set_code(grpc.StatusCode.NOT_FOUND)
-                context.set_details(f"Post with ID {request.post_id} not found")
-                return post_service_pb2.Post()
+            values = {'is_private': request.is_private, 'updated_at': datetime.utcnow()}
+            if request.title:
+                values['title'] = request.title
+            if request.description:
+                values['description'] = request.description
+            if request.tags:
+                values['tags'] = list(request.tags)
+
+            # Проверка владельца - в условии UPDATE: между чтением и записью нет окна для гонки
+            post = session.execute(update_own_post(request.post_id, request.user_id, values)).first()
 
-            if post.creator_id != request.user_id:
+            if not post:
+                # Второй запрос только на промахе: поста нет или он чужой
+                if session.execute(post_owner(request.post_id)).first() is None:
+                    context.set_code(grpc.StatusCode.NOT_FOUND)
+                    context.set_details(f"Post with ID {request.post_id} not found")
+                    return post_service_pb2.Post()
                 context.set_code(grpc.StatusCode.PERMISSION_DENIED)
                 context.set_details("You don't have permission to update this post")
                 return post_service_pb2.Post()
 
-            if request.title:
-                post.title = request.title
-            if request.description:
-                post.description = request.description
-            post.is_private = request.is_private
-            if request.tags:
-                post.tags = list(request.tags)
-                
             session.commit()
+            replicas.note_write(request.user_id)
+            update_search_index(search_backend.index_post, post)
+            message = post_message(post)
+            cache_post(post.id, message)
             
-            return post_service_pb2.Post(
-                id=post.id,
-                title=post.title,
-                description=post.description,
-                creator_id=post.creator_id,
-                created_at=post.created_at.isoformat(),
-                updated_at=post.updated_at.isoformat(),
-                is_private=post.is_private,
-                tags=post.tags
-            )
+            return message
         except Exception as e:
             session.rollback()
             context.set_code(grpc.StatusCode.INTERNAL)
@@ -119,20 +258,21 @@ class PostServicer(post_service_pb2_grpc.PostServiceServicer):
     def DeletePost(self, request, context):
         session = Session()
         try:
-            post = session.query(Post).filter(Post.id == request.post_id).first()
-            
-            if not post:
-                context.set_code(grpc.StatusCode.NOT_FOUND)
-                context.set_details(f"Post with ID {request.post_id} not found")
-                return post_service_pb2.DeletePostResponse(success=False, message="Post not found")
+            post = session.execute(delete_own_post(request.post_id, request.user_id)).first()
 
-            if post.creator_id != request.user_id:
+            if not post:
+                if session.execute(post_owner(request.post_id)).first() is None:
+                    context.set_code(grpc.StatusCode.NOT_FOUND)
+                    context.set_details(f"Post with ID {request.post_id} not found")
+                    return post_service_pb2.DeletePostResponse(success=False, message="Post not found")
                 context.set_code(grpc.StatusCode.PERMISSION_DENIED)
                 context.set_details("You don't have permission to delete this post")
                 return post_service_pb2.DeletePostResponse(success=False, message="Permission denied")
-                
-            session.delete(post)
+
             session.commit()
+            replicas.note_write(request.user_id)
+            update_search_index(search_backend.remove_post, request.post_id)
+            cache_post(request.post_id, None)
             
             return post_service_pb2.DeletePostResponse(
                 success=True,
@@ -147,37 +287,45 @@ class PostServicer(post_service_pb2_grpc.PostServiceServicer):
             session.close()
     
     def ListPosts(self, request, context):
-        session = Session()
+        session = read_session(request.user_id)
         try:
             page = max(1, request.page)
             per_page = min(max(1, request.per_page), 100)
 
-            query = session.query(Post)
-
-            query = query.filter((Post.is_private == False) | (Post.creator_id == request.user_id))
+            cursor = None
+            try:
+                fields = read_fields(request.read_mask)
+                if request.page_token:
+                    cursor = decode_page_token(request.page_token)
+            except ValueError as e:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details(str(e))
+                return post_service_pb2.ListPostsResponse()
 
-            total = query.count()
+            # total и версия списка берутся из счётчиков, а не из COUNT(*) по всей выборке
+            if request.total_mode == post_service_pb2.TOTAL_NONE:
+                total, version = 0, ''
+            elif request.total_mode == post_service_pb2.TOTAL_ESTIMATED:
+                total, version = counter_cache.get(session, request.user_id)
+            else:
+                total, version = counters.read_visible(session, request.user_id)
 
-            posts = query.order_by(Post.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
+            if cursor is not None:
+                # Seek по (created_at, id) вместо OFFSET: глубокие страницы не перебирают предыдущие строки
+                page = 0
+                query = visible_posts(request.user_id, per_page + 1, cursor=cursor, fields=fields)
+            else:
+                query = visible_posts(request.user_id, per_page + 1, offset=(page - 1) * per_page, fields=fields)
+            post_list, next_page_token = fetch_page(session, query, per_page, fields)
 
-            post_list = []
-            for post in posts:
-                post_list.append(post_service_pb2.Post(
-                    id=post.id,
-                    title=post.title,
-                    description=post.description,
-                    creator_id=post.creator_id,
-                    created_at=post.created_at.isoformat(),
-                    updated_at=post.updated_at.isoformat(),
-                    is_private=post.is_private,
-                    tags=post.tags
-                ))
-                
             return post_service_pb2.ListPostsResponse(
                 posts=post_list,
                 total=total,
                 page=page,
-                per_page=per_page
+                per_page=per_page,
+                version=version,
+                next_page_token=next_page_token,
+                total_mode=request.total_mode
             )
         except Exception as e:
             context.set_code(grpc.StatusCode.INTERNAL)
@@ -186,21 +334,374 @@ class PostServicer(post_service_pb2_grpc.PostServiceServicer):
         finally:
             session.close()
 
-def serve():
+    def GetPostVersion(self, request, context):
+        session = read_session(request.user_id)
+        try:
+            post = session.query(Post.id, Post.creator_id, Post.is_private, Post.updated_at).filter(Post.id == request.post_id).first()
+
+            if not post:
+                context.set_code(grpc.StatusCode.NOT_FOUND)
+                context.set_details(f"Post with ID {request.post_id} not found")
+                return post_service_pb2.PostVersion()
+
+            if post.is_private and post.creator_id != request.user_id:
+                context.set_code(grpc.StatusCode.PERMISSION_DENIED)
+                context.set_details("You don't have permission to view this private post")
+                return post_service_pb2.PostVersion()
+
+            return post_service_pb2.PostVersion(
+                post_id=post.id,
+                updated_at=post.updated_at.isoformat()
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error retrieving post version: {str(e)}")
+            return post_service_pb2.PostVersion()
+        finally:
+            session.close()
+
+    def GetListingVersion(self, request, context):
+        session = read_session(request.user_id)
+        try:
+            _, version = counters.read_visible(session, request.user_id)
+
+            return post_service_pb2.ListingVersion(version=version)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error retrieving listing version: {str(e)}")
+            return post_service_pb2.ListingVersion()
+        finally:
+            session.close()
+
+    def ListPostsByTag(self, request, context):
+        tags = sorted({tag for tag in request.tags if tag})
+        if not tags or len(tags) > MAX_FILTER_TAGS:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"Between 1 and {MAX_FILTER_TAGS} tags are required")
+            return post_service_pb2.ListPostsResponse()
+
+        cursor = None
+        if request.page_token:
+            try:
+                cursor = decode_page_token(request.page_token)
+            except ValueError as e:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details(str(e))
+                return post_service_pb2.ListPostsResponse()
+
+        session = read_session(request.user_id)
+        try:
+            per_page = min(max(1, request.per_page), 100)
+            query = visible_posts(
+                request.user_id,
+                per_page + 1,
+                cursor=cursor,
+                condition=tags_condition(tags, match_all=request.match == post_service_pb2.TAG_MATCH_ALL)
+            )
+            post_list, next_page_token = fetch_page(session, query, per_page)
+
+            # Для выборки по тегам счётчиков нет: total не считается
+            return post_service_pb2.ListPostsResponse(
+                posts=post_list,
+                per_page=per_page,
+                next_page_token=next_page_token,
+                total_mode=post_service_pb2.TOTAL_NONE
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error listing posts by tag: {str(e)}")
+            return post_service_pb2.ListPostsResponse()
+        finally:
+            session.close()
+
+    def SearchPosts(self, request, context):
+        query = request.query.strip()
+        if not query_terms(query) or len(query) > MAX_QUERY_LENGTH:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"Query must contain a word and be at most {MAX_QUERY_LENGTH} characters long")
+            return post_service_pb2.ListPostsResponse()
+
+        cursor = None
+        if request.page_token:
+            try:
+                cursor = decode_search_token(request.page_token)
+            except ValueError as e:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details(str(e))
+                return post_service_pb2.ListPostsResponse()
+
+        session = read_session(request.user_id)
+        try:
+            per_page = min(max(1, request.per_page), 100)
+            hits = search_backend.search(session, request.user_id, query, per_page + 1, cursor)
+
+            next_page_token = ''
+            if len(hits) > per_page:
+                hits = hits[:per_page]
+                next_page_token = encode_search_token(hits[-1][1], hits[-1][0])
+
+            ids = [post_id for post_id, _ in hits]
+            posts = {post.id: post for post in session.query(Post).filter(Post.id.in_(ids)).all()} if ids else {}
+            # Встроенный индекс обновляется после коммита и может отставать: видимость проверяется ещё раз
+            post_list = [
+                post_message(posts[post_id]) for post_id in ids
+                if post_id in posts and (not posts[post_id].is_private or posts[post_id].creator_id == request.user_id)
+            ]
+
+            return post_service_pb2.ListPostsResponse(
+                posts=post_list,
+                per_page=per_page,
+                next_page_token=next_page_token,
+                total_mode=post_service_pb2.TOTAL_NONE
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error searching posts: {str(e)}")
+            return post_service_pb2.ListPostsResponse()
+        finally:
+            session.close()
+
+    def BatchGetPosts(self, request, context):
+        # Повторы схлопываются, порядок запроса сохраняется
+        post_ids = list(dict.fromkeys(request.post_ids))
+        if not post_ids or len(post_ids) > MAX_BATCH_POSTS:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"Between 1 and {MAX_BATCH_POSTS} post ids are required")
+            return post_service_pb2.BatchGetPostsResponse()
+
+        session = read_session(request.user_id)
+        try:
+            # Один параметр-массив вместо IN (...): текст запроса не зависит от числа id
+            ids = bindparam('post_ids', post_ids, type_=ARRAY(Integer))
+            posts = {post.id: post for post in session.query(Post).filter(Post.id == any_(ids)).all()}
+
+            results = []
+            for post_id in post_ids:
+                post = posts.get(post_id)
+                if post is None:
+                    results.append(post_service_pb2.BatchGetPostsResult(
+                        post_id=post_id, status=post_service_pb2.POST_NOT_FOUND))
+                elif post.is_private and post.creator_id != request.user_id:
+                    results.append(post_service_pb2.BatchGetPostsResult(
+                        post_id=post_id, status=post_service_pb2.POST_PERMISSION_DENIED))
+                else:
+                    results.append(post_service_pb2.BatchGetPostsResult(
+                        post_id=post_id, status=post_service_pb2.POST_OK, post=post_message(post)))
+
+            return post_service_pb2.BatchGetPostsResponse(results=results)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error retrieving posts: {str(e)}")
+            return post_service_pb2.BatchGetPostsResponse()
+        finally:
+            session.close()
+
+    def StreamPosts(self, request, context):
+        try:
+            query = stream_query(request)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return
+
+        session = read_session(request.user_id)
+        try:
+            # Серверный курсор и yield_per: в памяти держится одна пачка строк, а не весь результат.
+            # grpc берёт следующее сообщение, только когда клиент успевает читать (окно HTTP/2),
+            # так что медленный клиент притормаживает и чтение из базы
+            result = session.execute(query.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE))
+            for post in result.scalars():
+                if not context.is_active():
+                    break
+                yield post_message(post)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error streaming posts: {str(e)}")
+        finally:
+            session.close()
+
+    def GetCacheStats(self, request, context):
+        # Кеш свой у каждого процесса с POST_CACHE=lru: ответ только про обслуживший запрос процесс
+        return cache_stats_message()
+
+    def change_follow(self, request, context, action, name):
+        error = follow_error(request)
+        if error:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(error)
+            return post_service_pb2.FollowResponse()
+
+        session = Session()
+        try:
+            changed = action(session, request.follower_id, request.followee_id)
+            session.commit()
+            # Подписчик сразу видит свою ленту уже с новым автором
+            replicas.note_write(request.follower_id)
+            return post_service_pb2.FollowResponse(changed=changed)
+        except Exception as e:
+            session.rollback()
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error {name} user: {str(e)}")
+            return post_service_pb2.FollowResponse()
+        finally:
+            session.close()
+
+    def Follow(self, request, context):
+        return self.change_follow(request, context, timeline.follow, 'following')
+
+    def Unfollow(self, request, context):
+        return self.change_follow(request, context, timeline.unfollow, 'unfollowing')
+
+    def list_follows(self, request, context, followers):
+        cursor = None
+        if request.page_token:
+            try:
+                cursor = decode_page_token(request.page_token)
+            except ValueError as e:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details(str(e))
+                return post_service_pb2.ListFollowsResponse()
+
+        session = read_session(request.user_id)
+        try:
+            per_page = min(max(1, request.per_page), 100)
+            rows = session.execute(timeline.follows_page(request.user_id, per_page + 1, cursor, followers)).all()
+            return follows_message(rows, per_page)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error listing follows: {str(e)}")
+            return post_service_pb2.ListFollowsResponse()
+        finally:
+            session.close()
+
+    def ListFollowing(self, request, context):
+        return self.list_follows(request, context, followers=False)
+
+    def ListFollowers(self, request, context):
+        return self.list_follows(request, context, followers=True)
+
+    def HomeTimeline(self, request, context):
+        cursor = None
+        try:
+            fields = read_fields(request.read_mask)
+            if request.page_token:
+                cursor = decode_page_token(request.page_token)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return post_service_pb2.ListPostsResponse()
+
+        session = read_session(request.user_id)
+        try:
+            per_page = min(max(1, request.per_page), 100)
+            query = home_timeline(request.user_id, per_page + 1, cursor, fields)
+            post_list, next_page_token = fetch_page(session, query, per_page, fields)
+
+            return post_service_pb2.ListPostsResponse(
+                posts=post_list,
+                per_page=per_page,
+                next_page_token=next_page_token,
+                total_mode=post_service_pb2.TOTAL_NONE
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error reading home timeline: {str(e)}")
+            return post_service_pb2.ListPostsResponse()
+        finally:
+            session.close()
+
+def rebuild_search_index():
+    # Встроенному индексу после перезапуска нужно заново прочитать посты
+    if not isinstance(search_backend, SqliteSearchBackend) or not search_backend.is_empty():
+        return
+    session = Session()
+    try:
+        for post in session.query(Post).yield_per(1000):
+            search_backend.index_post(post)
+    finally:
+        session.close()
+
+def reconcile_counters():
+    session = Session()
+    try:
+        fixed = counters.reconcile(session)
+        if fixed:
+            print(f"Reconciled {fixed} post counters")
+    except Exception as e:
+        session.rollback()
+        print(f"Error reconciling post counters: {str(e)}")
+    finally:
+        session.close()
+
+def reconcile_loop(stop):
+    while not stop.wait(COUNTER_RECONCILE_INTERVAL):
+        reconcile_counters()
+
+def replica_check_loop(stop):
+    while not stop.wait(REPLICA_CHECK_INTERVAL):
+        replicas.refresh()
+
+def prepare():
     init_db()
+    # Счётчики могли разойтись, пока сервис был остановлен, или ещё не существовать
+    reconcile_counters()
+    rebuild_search_index()
+
+def start_background(stop, first_worker=True):
+    if first_worker and COUNTER_RECONCILE_INTERVAL > 0:
+        threading.Thread(target=reconcile_loop, args=(stop,), daemon=True).start()
+    # Один релей на сервис: события одного поста публикуются в порядке записи
+    if first_worker and outbox.RECORD_EVENTS:
+        relay = outbox.OutboxRelay(outbox.create_broker(outbox.OUTBOX_BROKER))
+        threading.Thread(target=relay.run, args=(stop,), daemon=True).start()
+    if replicas.engines:
+        replicas.refresh()
+        threading.Thread(target=replica_check_loop, args=(stop,), daemon=True).start()
+
+def server_options(worker_index):
+    # Воркеры prefork слушают один порт, новые соединения между ними распределяет ядро
+    if worker_index is None:
+        return []
+    return [('grpc.so_reuseport', 1)]
+
+def serve(worker_index=None):
+    stop = threading.Event()
+    # В режиме prefork миграции уже выполнил супервизор, а счётчики сверяет и события публикует только первый воркер
+    if worker_index is None:
+        prepare()
+    start_background(stop, first_worker=not worker_index)
 
     port = os.environ.get('GRPC_PORT', '50052')
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=server_options(worker_index))
     post_service_pb2_grpc.add_PostServiceServicer_to_server(PostServicer(), server)
+    health_servicer = health.HealthServicer()
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
     server.add_insecure_port(f'[::]:{port}')
     server.start()
-    print(f"Post Service gRPC server started on port {port}")
+    health_servicer.set('', health_pb2.HealthCheckResponse.SERVING)
+    health_servicer.set('post.PostService', health_pb2.HealthCheckResponse.SERVING)
+    print(f"Post Service gRPC server started on port {port}" + (f", worker {worker_index}" if worker_index is not None else ""))
+
+    shutdown = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: shutdown.set())
     try:
-        while True:
-            time.sleep(86400)
+        while not shutdown.wait(3600):
+            pass
     except KeyboardInterrupt:
-        server.stop(0)
+        pass
+    # Новые вызовы больше не принимаются, начатые дорабатывают не дольше SHUTDOWN_GRACE
+    health_servicer.enter_graceful_shutdown()
+    stop.set()
+    server.stop(SHUTDOWN_GRACE).wait()
 
 if __name__ == '__main__':
-    serve()
\ No newline at end of file
+    worker_index = os.environ.get('POST_SERVICE_WORKER_INDEX')
+    if worker_index is None and int(os.environ.get('POST_SERVICE_WORKERS', '1')) > 1:
+        import prefork
+        prefork.main()
+    elif os.environ.get('POST_SERVICE_MODE', 'sync') == 'async':
+        import async_post_service
+        async_post_service.main(int(worker_index) if worker_index is not None else None)
+    else:
+        serve(int(worker_index) if worker_index is not None else None)
@@ -0,0 +1,127 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from database import engine
+from post_service import SHUTDOWN_GRACE, prepare
+
+WORKERS = int(os.environ.get('POST_SERVICE_WORKERS', '1'))
+# Сколько соединений с одним сервером PostgreSQL сервис может занять всеми воркерами вместе
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', '90'))
+# Воркер, упавший быстрее этого, перезапускается с паузой, а не в цикле
+MIN_UPTIME = 5
+RESTART_DELAY = 1
+SERVICE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'post_service.py')
+
+
+def engines_per_server(mode):
+    # Асинхронный воркер держит к каждой базе два пула: asyncpg для запросов и синхронный
+    # для фоновых задач (сверка счётчиков, релей outbox, проверка реплик). Оба размером DB_POOL_SIZE
+    return 2 if mode == 'async' else 1
+
+
+def worker_pool_size(workers, max_connections, engines=1):
+    # Пул без overflow: сумма пулов всех движков всех воркеров не выходит за max_connections
+    pool_size = max_connections // (workers * engines)
+    if pool_size < 1:
+        raise ValueError(f"DB_MAX_CONNECTIONS={max_connections} is too small for {workers} workers with {engines} pools each")
+    return pool_size
+
+
+def check_search_backend(url, workers):
+    # Индекс в памяти у каждого воркера был бы свой и видел бы только его записи
+    if workers > 1 and url.startswith('sqlite://') and url[len('sqlite:///'):] in ('', ':memory:'):
+        raise ValueError("In-memory search index cannot be shared between workers, use sqlite:///<path> or postgres")
+
+
+def check_post_cache(url, workers):
+    # Кеш в памяти у каждого воркера свой: правку или удаление поста видит только воркер, который её сделал,
+    # остальные до POST_CACHE_TTL отдают старый пост, в том числе ставший приватным или удалённый
+    if workers > 1 and url == 'lru':
+        raise ValueError("In-process post cache cannot be shared between workers, use POST_CACHE=redis://... or none")
+
+
+def shared_writer_store(url, workers, directory):
+    # Следующее чтение автора может попасть в другой воркер: список недавно писавших должен быть общим
+    if workers > 1 and url == 'memory':
+        return f"sqlite:///{os.path.join(directory, 'recent_writers.db')}"
+    return url
+
+
+def spawn_worker(index, env):
+    return subprocess.Popen([sys.executable, SERVICE_PATH], env=dict(env, POST_SERVICE_WORKER_INDEX=str(index)))
+
+
+class Supervisor:
+    def __init__(self, workers, env, spawn=spawn_worker):
+        self.workers = workers
+        self.env = env
+        self.spawn = spawn
+        self.processes = {}
+        self.started_at = {}
+        self.stopping = False
+
+    def start_worker(self, index):
+        self.processes[index] = self.spawn(index, self.env)
+        self.started_at[index] = time.monotonic()
+
+    def start(self):
+        for index in range(self.workers):
+            self.start_worker(index)
+
+    def check(self):
+        for index, process in list(self.processes.items()):
+            code = process.poll()
+            if code is None or self.stopping:
+                continue
+            print(f"Worker {index} exited with code {code}, restarting")
+            if time.monotonic() - self.started_at[index] < MIN_UPTIME:
+                time.sleep(RESTART_DELAY)
+            self.start_worker(index)
+
+    def stop(self, grace):
+        # SIGTERM: воркер снимает health и дорабатывает начатые вызовы, после срока - SIGKILL
+        self.stopping = True
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + grace + 5
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def main():
+    check_search_backend(os.environ.get('SEARCH_BACKEND', 'postgres'), WORKERS)
+    check_post_cache(os.environ.get('POST_CACHE', 'none'), WORKERS)
+    pool_size = worker_pool_size(WORKERS, DB_MAX_CONNECTIONS, engines_per_server(os.environ.get('POST_SERVICE_MODE', 'sync')))
+
+    # Миграции и сверка счётчиков один раз до запуска воркеров; соединения супервизора им не нужны
+    prepare()
+    engine.dispose()
+
+    state_dir = tempfile.mkdtemp(prefix='post_service-')
+    writer_store = shared_writer_store(os.environ.get('READ_YOUR_WRITES_STORE', 'memory'), WORKERS, state_dir)
+    env = dict(os.environ, DB_POOL_SIZE=str(pool_size), DB_MAX_OVERFLOW='0', READ_YOUR_WRITES_STORE=writer_store)
+    supervisor = Supervisor(WORKERS, env)
+    supervisor.start()
+    print(f"Post Service supervisor started {WORKERS} workers, {pool_size} DB connections each")
+
+    shutdown = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: shutdown.set())
+    while not shutdown.wait(1):
+        supervisor.check()
+    supervisor.stop(SHUTDOWN_GRACE)
+    shutil.rmtree(state_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+from sqlalchemy import select, insert, update, delete, union, union_all, tuple_, cast, or_, case, literal, true, String, Integer
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from sqlalchemy.orm import aliased, load_only
+from database import Post, Follow, TimelineEntry
+import counters
+import outbox
+import timeline
+
+# Всё, что нужно для ответа; search_vector не возвращается
+POST_COLUMNS = [
+    Post.id, Post.title, Post.description, Post.creator_id,
+    Post.created_at, Post.updated_at, Post.is_private, Post.tags
+]
+
+# Читаются при любой маске полей: по ним проверяются права и строится курсор страницы
+KEY_COLUMNS = ('id', 'creator_id', 'is_private', 'created_at')
+
+
+def masked_columns(entity, fields):
+    return [getattr(entity, column.key) for column in POST_COLUMNS if column.key in fields or column.key in KEY_COLUMNS]
+
+
+def only_fields(entity, fields):
+    # Остальные колонки не выбираются вовсе; raiseload: случайное обращение к ним - ошибка, а не запрос на строку
+    return load_only(*masked_columns(entity, fields), raiseload=True)
+
+
+def feed_order(entity):
+    return entity.created_at.desc(), entity.id.desc()
+
+
+def visible_posts(user_id, limit, offset=0, cursor=None, condition=None, fields=None):
+    # Видимость "публичный ИЛИ свой" разбита на две непересекающиеся ветки:
+    # публичные идут по частичному индексу, свои приватные - по (creator_id, created_at).
+    # Каждая ветка отдаёт не больше offset + limit строк, итог сливается Merge Append.
+    # Ветки выбирают колонки явно: select(Post) в подзапросе потянул бы и отложенный search_vector.
+    # С маской fields - только нужные колонки
+    branches = []
+    for visibility in (Post.is_private == False, (Post.is_private == True) & (Post.creator_id == user_id)):
+        branch = select(*(POST_COLUMNS if fields is None else masked_columns(Post, fields)))
+        branch = branch.where(visibility)
+        if condition is not None:
+            branch = branch.where(condition)
+        if cursor is not None:
+            branch = branch.where(tuple_(Post.created_at, Post.id) < cursor)
+        branches.append(branch.order_by(*feed_order(Post)).limit(offset + limit))
+
+    visible = aliased(Post, union_all(*branches).subquery('visible_posts'))
+    query = select(visible).order_by(*feed_order(visible)).limit(limit)
+    if fields is not None:
+        query = query.options(only_fields(visible, fields))
+    if offset:
+        query = query.offset(offset)
+    return query
+
+
+def home_timeline(user_id, limit, cursor=None, fields=None):
+    # Материализованная лента плюс посты pulled-авторов и свои собственные, прочитанные сейчас.
+    # Каждая часть отдаёт не больше limit строк: чтение не зависит ни от размера posts,
+    # ни от числа подписок, только от страницы и числа pulled-авторов среди них
+    pushed = select(TimelineEntry.post_id.label('id'), TimelineEntry.created_at).where(TimelineEntry.user_id == user_id)
+    if cursor is not None:
+        pushed = pushed.where(tuple_(TimelineEntry.created_at, TimelineEntry.post_id) < cursor)
+    pushed = pushed.order_by(TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc()).limit(limit)
+
+    authors = union_all(
+        select(Follow.followee_id.label('author_id')).where(Follow.follower_id == user_id, Follow.pulled == True),
+        select(literal(user_id, Integer).label('author_id'))
+    ).subquery('pulled_authors')
+    recent = select(Post.id, Post.created_at).where(
+        Post.creator_id == authors.c.author_id,
+        or_(Post.is_private == False, Post.creator_id == user_id)
+    )
+    if cursor is not None:
+        recent = recent.where(tuple_(Post.created_at, Post.id) < cursor)
+    recent = recent.order_by(*feed_order(Post)).limit(limit).lateral('recent_posts')
+    pulled = select(recent.c.id, recent.c.created_at).select_from(authors.join(recent, true()))
+
+    # UNION убирает повторы: посты автора, разосланные до того, как он стал pulled
+    ids = union(pushed, pulled).subquery('timeline_ids')
+    query = select(Post).join(ids, ids.c.id == Post.id).where(
+        or_(Post.is_private == False, Post.creator_id == user_id)
+    ).order_by(*feed_order(Post)).limit(limit)
+    if fields is not None:
+        query = query.options(only_fields(Post, fields))
+    return query
+
+
+def export_posts(user_id, after_id=0, condition=None):
+    # Выгрузка идёт по первичному ключу: порядок стабилен, а продолжить можно с любого id
+    query = select(Post).where(or_(Post.is_private == False, Post.creator_id == user_id), Post.id > after_id)
+    if condition is not None:
+        query = query.where(condition)
+    return query.order_by(Post.id)
+
+
+def tags_condition(tags, match_all=False):
+    # Без явного приведения psycopg2 передаёт text[], а для varchar[] @> text[] оператора нет.
+    # И @>, и && обслуживаются GIN-индексом ix_posts_tags
+    value = cast(array(list(tags)), ARRAY(String))
+    if match_all:
+        return Post.tags.contains(value)
+    return Post.tags.overlap(value)
+
+
+def with_counters(changed, changes):
+    # Счётчики меняются в том же запросе, что и пост: одна команда вместо записи, чтения и upsert
+    changes = changes.cte('changes')
+    return select(*[changed.c[column.key] for column in POST_COLUMNS]).add_cte(
+        changes, counters.adjust_statement(changes)
+    )
+
+
+def with_event(statement, changed, event_type):
+    # Событие записывается той же командой, что и пост: нет поста без события и события без поста.
+    # Публикует его фоновый релей, RPC брокера не ждёт
+    if not outbox.RECORD_EVENTS:
+        return statement
+    return statement.add_cte(outbox.record_statement(changed, event_type))
+
+
+def create_post(values):
+    inserted = insert(Post).values(**values).returning(*POST_COLUMNS).cte('inserted')
+    changes = select(
+        counters.scope_of(inserted.c.is_private, inserted.c.creator_id).label('scope'),
+        literal(1).label('delta')
+    )
+    statement = with_counters(inserted, changes).add_cte(timeline.publish_statement(inserted, 'NOT p.is_private'))
+    return with_event(statement, inserted, outbox.POST_CREATED)
+
+
+def update_own_post(post_id, user_id, values):
+    # Прежнее is_private берётся из подзапроса FOR UPDATE: без блокировки при параллельной
+    # смене видимости он вернул бы устаревшее значение, и счётчики разошлись бы
+    old = select(Post.id, Post.is_private).where(
+        Post.id == post_id, Post.creator_id == user_id
+    ).with_for_update().subquery('old')
+    updated = update(Post).where(Post.id == old.c.id).values(**values).returning(
+        *POST_COLUMNS, old.c.is_private.label('was_private')
+    ).cte('updated')
+
+    moved = updated.c.was_private != updated.c.is_private
+    changes = union_all(
+        # Версия растёт при любом изменении; при смене видимости пост переходит между счётчиками
+        select(
+            counters.scope_of(updated.c.is_private, updated.c.creator_id).label('scope'),
+            case((moved, 1), else_=0).label('delta')
+        ),
+        select(
+            counters.scope_of(updated.c.was_private, updated.c.creator_id).label('scope'),
+            literal(-1).label('delta')
+        ).where(moved)
+    )
+    # Ставший публичным пост рассылается подписчикам, ставший приватным - убирается из лент
+    statement = with_counters(updated, changes).add_cte(
+        timeline.publish_statement(updated, 'p.was_private AND NOT p.is_private')
+    ).add_cte(
+        timeline.unpublish_statement(updated, 'p.is_private AND NOT p.was_private')
+    )
+    return with_event(statement, updated, outbox.POST_UPDATED)
+
+
+def delete_own_post(post_id, user_id):
+    deleted = delete(Post).where(Post.id == post_id, Post.creator_id == user_id).returning(*POST_COLUMNS).cte('deleted')
+    changes = select(
+        counters.scope_of(deleted.c.is_private, deleted.c.creator_id).label('scope'),
+        literal(-1).label('delta')
+    )
+    statement = with_counters(deleted, changes).add_cte(timeline.unpublish_statement(deleted, 'true'))
+    return with_event(statement, deleted, outbox.POST_DELETED)
+
+
+def post_owner(post_id):
+    # Только для промаха: отличить "нет поста" от "пост чужой"
+    return select(Post.creator_id).where(Post.id == post_id)
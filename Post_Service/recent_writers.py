@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import threading
+import time
+
+MAX_TRACKED_WRITERS = 100000
+# Как часто файл SQLite очищается от истёкших записей
+WRITER_SWEEP_INTERVAL = 60.0
+
+
+class MemoryWriterStore:
+    # Только для одного процесса: другой воркер о записи не узнает
+    def __init__(self):
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    def note(self, user_id, window):
+        now = time.monotonic()
+        with self._lock:
+            self._writers[user_id] = now + window
+            if len(self._writers) > MAX_TRACKED_WRITERS:
+                self._writers = {writer: until for writer, until in self._writers.items() if until > now}
+
+    def contains(self, user_id):
+        until = self._writers.get(user_id)
+        return until is not None and until > time.monotonic()
+
+
+class SqliteWriterStore:
+    # Файл SQLite: общий для всех воркеров на одной машине, как бакеты в API_Gateway/rate_limit.py
+    def __init__(self, path, sweep_interval=WRITER_SWEEP_INTERVAL):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._local = threading.local()
+        self._connection().execute("CREATE TABLE IF NOT EXISTS writers (user_id INTEGER PRIMARY KEY, until REAL NOT NULL)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+
+    def note(self, user_id, window):
+        # CLOCK_MONOTONIC в Linux общий для всех процессов
+        now = time.monotonic()
+        connection = self._connection()
+        connection.execute(
+            "INSERT INTO writers (user_id, until) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET until = excluded.until",
+            (user_id, now + window)
+        )
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            connection.execute("DELETE FROM writers WHERE until <= ?", (now,))
+
+    def contains(self, user_id):
+        row = self._connection().execute("SELECT until FROM writers WHERE user_id = ?", (user_id,)).fetchone()
+        return row is not None and row[0] > time.monotonic()
+
+
+class KeyValueWriterStore:
+    # Внешнее хранилище: общее для всех экземпляров сервиса, истечение - по TTL ключа
+    def __init__(self, client, prefix='writer:'):
+        self.client = client
+        self.prefix = prefix
+
+    def note(self, user_id, window):
+        self.client.set(f'{self.prefix}{user_id}', b'1', px=max(1, int(window * 1000)))
+
+    def contains(self, user_id):
+        return self.client.get(f'{self.prefix}{user_id}') is not None
+
+
+def create_writer_store(url):
+    if url == 'memory':
+        return MemoryWriterStore()
+    if url.startswith('sqlite:///'):
+        path = url[len('sqlite:///'):]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return SqliteWriterStore(path)
+    if url.startswith('redis://'):
+        # Необязательная зависимость: нужна только с внешним хранилищем
+        import redis
+        return KeyValueWriterStore(redis.Redis.from_url(url))
+    raise ValueError(f"Unknown recent writers store: {url}")
@@ -0,0 +1,106 @@
+import re
+import sqlite3
+import threading
+from sqlalchemy import func, or_, and_, literal, cast, REAL
+from database import Post, SEARCH_CONFIG
+
+MAX_QUERY_LENGTH = 200
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def query_terms(query):
+    return [term.lower() for term in TOKEN_PATTERN.findall(query)]
+
+
+def visible_to(user_id):
+    # Те же правила, что и в GetPost: публичные посты и собственные приватные
+    return or_(Post.is_private == False, Post.creator_id == user_id)
+
+
+def after_cursor(score, cursor):
+    # Порядок (score desc, id desc), курсор указывает на последнюю строку предыдущей страницы
+    if cursor is None:
+        return None
+    cursor_score, cursor_id = cursor
+    return or_(score < cursor_score, and_(score == cursor_score, Post.id < cursor_id))
+
+
+class PostgresSearchBackend:
+    # search_vector - генерируемая колонка posts с GIN-индексом:
+    # PostgreSQL обновляет её в той же транзакции, что и сам пост
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def search(self, session, user_id, query, limit, cursor=None):
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        # ts_rank возвращает real: курсор сравнивается в том же типе, иначе строка на границе страниц повторится
+        score = func.ts_rank_cd(Post.search_vector, ts_query)
+        statement = session.query(Post.id, score).filter(
+            Post.search_vector.op('@@')(ts_query),
+            visible_to(user_id)
+        )
+        if cursor is not None:
+            statement = statement.filter(after_cursor(score, (cast(literal(cursor[0]), REAL), cursor[1])))
+        return statement.order_by(score.desc(), Post.id.desc()).limit(limit).all()
+
+
+class SqliteSearchBackend:
+    # Встроенный индекс на SQLite FTS5: для тестов, бенчмарков и запуска без PostgreSQL.
+    # Хранит копию заголовка и описания, поэтому его надо обновлять при каждом изменении поста
+    def __init__(self, path=':memory:'):
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5("
+            "title, description, creator_id UNINDEXED, is_private UNINDEXED, tokenize='unicode61')"
+        )
+
+    def index_post(self, post):
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.execute("DELETE FROM posts_fts WHERE rowid = ?", (post.id,))
+            self._connection.execute(
+                "INSERT INTO posts_fts (rowid, title, description, creator_id, is_private) VALUES (?, ?, ?, ?, ?)",
+                (post.id, post.title, post.description, post.creator_id, int(bool(post.is_private)))
+            )
+            self._connection.execute("COMMIT")
+
+    def remove_post(self, post_id):
+        with self._lock:
+            self._connection.execute("DELETE FROM posts_fts WHERE rowid = ?", (post_id,))
+
+    def is_empty(self):
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM posts_fts LIMIT 1").fetchone() is None
+
+    def search(self, session, user_id, query, limit, cursor=None):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        # Каждое слово в кавычках: пользовательский ввод не разбирается как синтаксис FTS5
+        match = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        # bm25 тем меньше, чем лучше совпадение; знак меняется, чтобы порядок совпадал с PostgreSQL.
+        # Вес заголовка выше, как setweight 'A' против 'B'
+        sql = (
+            "SELECT rowid, -bm25(posts_fts, 4.0, 1.0) AS score FROM posts_fts "
+            "WHERE posts_fts MATCH ? AND (is_private = 0 OR creator_id = ?)"
+        )
+        params = [match, user_id]
+        if cursor is not None:
+            sql += " AND (score < ? OR (score = ? AND rowid < ?))"
+            params += [cursor[0], cursor[0], cursor[1]]
+        sql += " ORDER BY score DESC, rowid DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+
+def create_search_backend(url):
+    if url == 'postgres':
+        return PostgresSearchBackend()
+    if url.startswith('sqlite://'):
+        return SqliteSearchBackend(url[len('sqlite:///'):] or ':memory:')
+    raise ValueError(f"Unknown search backend: {url}")
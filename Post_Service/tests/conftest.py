@@ -0,0 +1,17 @@
+import os
+from grpc_tools import protoc
+
+# Модули post_service_pb2*.py не хранятся в git: их, как и в Dockerfile, генерирует protoc из proto/
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROTO = os.path.join(SERVICE_DIR, 'proto', 'post_service.proto')
+GENERATED = [os.path.join(SERVICE_DIR, name) for name in ('post_service_pb2.py', 'post_service_pb2_grpc.py')]
+
+if any(not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(PROTO) for path in GENERATED):
+    # Каталог _proto с google/protobuf/*.proto: его добавляет python -m grpc_tools.protoc, но не protoc.main
+    well_known = os.path.join(os.path.dirname(protoc.__file__), '_proto')
+    code = protoc.main([
+        'grpc_tools.protoc', f'-I{os.path.dirname(PROTO)}', f'-I{well_known}',
+        f'--python_out={SERVICE_DIR}', f'--grpc_python_out={SERVICE_DIR}', PROTO
+    ])
+    if code != 0:
+        raise RuntimeError(f"protoc failed for {PROTO}")
@@ -0,0 +1,175 @@
+import asyncio
+import pytest
+import grpc
+import sys
+import os
+from unittest.mock import MagicMock, AsyncMock, patch
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import post_service_pb2
+from async_post_service import AsyncPostServicer
+from post_cache import PostCache, LruBackend
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def make_post(post_id, creator_id=1, is_private=False):
+    post = MagicMock()
+    post.id = post_id
+    post.title = f"Post {post_id}"
+    post.description = "Description"
+    post.creator_id = creator_id
+    post.created_at = datetime.now()
+    post.updated_at = datetime.now()
+    post.is_private = is_private
+    post.tags = []
+    return post
+
+class TestAsyncPostServicer:
+    @pytest.fixture
+    def servicer(self):
+        return AsyncPostServicer()
+
+    @pytest.fixture
+    def mock_session(self):
+        mock_session = MagicMock()
+        for name in ('execute', 'run_sync', 'commit', 'rollback', 'close', 'delete', 'stream'):
+            setattr(mock_session, name, AsyncMock())
+        # Результаты запросов синхронные, как у Result в SQLAlchemy
+        mock_session.execute.return_value = MagicMock()
+        mock_session.stream.return_value = MagicMock()
+
+        with patch('async_post_service.AsyncSession') as mock_AsyncSession, \
+                patch('async_post_service.post_cache', PostCache(LruBackend())):
+            mock_AsyncSession.return_value = mock_session
+            yield mock_session
+
+    @pytest.fixture
+    def mock_context(self):
+        return MagicMock()
+
+    def test_create_post(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.first.return_value = make_post(1)
+        request = post_service_pb2.CreatePostRequest(title="Test Post", description="Text", creator_id=1, tags=["test"])
+
+        response = run(servicer.CreatePost(request, mock_context))
+
+        assert response.id == 1
+        assert response.title == "Post 1"
+        # Пост и счётчик записываются одной командой, без синхронного помощника
+        mock_session.execute.assert_awaited_once()
+        mock_session.run_sync.assert_not_awaited()
+        mock_session.commit.assert_awaited_once()
+        mock_session.close.assert_awaited_once()
+        mock_context.set_code.assert_not_called()
+
+    def test_get_post_not_found(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.scalars.return_value.first.return_value = None
+
+        run(servicer.GetPost(post_service_pb2.GetPostRequest(post_id=999, user_id=1), mock_context))
+
+        mock_context.set_code.assert_called_with(grpc.StatusCode.NOT_FOUND)
+        mock_session.close.assert_awaited_once()
+
+    def test_get_private_post_of_other_user(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.scalars.return_value.first.return_value = make_post(1, creator_id=2, is_private=True)
+
+        run(servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=1), mock_context))
+
+        mock_context.set_code.assert_called_with(grpc.StatusCode.PERMISSION_DENIED)
+
+    def test_list_posts(self, servicer, mock_session, mock_context):
+        mock_session.run_sync.return_value = (3, "1.0")
+        mock_session.execute.return_value.scalars.return_value.all.return_value = [make_post(3), make_post(2), make_post(1)]
+
+        response = run(servicer.ListPosts(post_service_pb2.ListPostsRequest(per_page=2, user_id=1), mock_context))
+
+        assert [post.id for post in response.posts] == [3, 2]
+        assert response.total == 3
+        assert response.version == "1.0"
+        assert response.next_page_token != ""
+        mock_context.set_code.assert_not_called()
+
+    def test_stream_posts(self, servicer, mock_session, mock_context):
+        async def rows():
+            for post_id in (1, 2, 3):
+                yield make_post(post_id)
+        mock_session.stream.return_value.scalars = MagicMock(return_value=rows())
+
+        async def collect():
+            return [post.id async for post in servicer.StreamPosts(post_service_pb2.StreamPostsRequest(user_id=1), mock_context)]
+
+        assert run(collect()) == [1, 2, 3]
+        assert mock_session.stream.call_args.args[0].get_execution_options()['yield_per'] > 0
+        mock_session.close.assert_awaited_once()
+
+    def test_delete_post_of_other_user(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.first.side_effect = [None, (2,)]
+
+        response = run(servicer.DeletePost(post_service_pb2.DeletePostRequest(post_id=1, user_id=1), mock_context))
+
+        assert response.success is False
+        mock_context.set_code.assert_called_with(grpc.StatusCode.PERMISSION_DENIED)
+        mock_session.commit.assert_not_awaited()
+
+    def test_update_post_not_found(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.first.return_value = None
+
+        run(servicer.UpdatePost(post_service_pb2.UpdatePostRequest(post_id=999, user_id=1), mock_context))
+
+        mock_context.set_code.assert_called_with(grpc.StatusCode.NOT_FOUND)
+        mock_session.commit.assert_not_awaited()
+
+    def test_concurrent_get_post_loads_once(self, servicer, mock_session, mock_context):
+        async def slow_execute(query):
+            await asyncio.sleep(0.01)
+            result = MagicMock()
+            result.scalars.return_value.first.return_value = make_post(1)
+            return result
+        mock_session.execute.side_effect = slow_execute
+
+        async def fetch():
+            return await asyncio.gather(*(
+                servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=1), mock_context) for _ in range(10)
+            ))
+
+        posts = run(fetch())
+
+        assert [post.id for post in posts] == [1] * 10
+        assert mock_session.execute.await_count == 1
+        mock_context.set_code.assert_not_called()
+
+    def test_list_posts_with_read_mask(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.scalars.return_value.all.return_value = [make_post(2), make_post(1)]
+        request = post_service_pb2.ListPostsRequest(
+            per_page=10, user_id=1, total_mode=post_service_pb2.TOTAL_NONE, read_mask={'paths': ['title']}
+        )
+
+        response = run(servicer.ListPosts(request, mock_context))
+
+        assert "description" not in str(mock_session.execute.call_args.args[0])
+        assert [(post.id, post.title, post.description) for post in response.posts] == [(2, "Post 2", ""), (1, "Post 1", "")]
+        mock_context.set_code.assert_not_called()
+
+
+    def test_follow_runs_sync_helper(self, servicer, mock_session, mock_context):
+        mock_session.run_sync.return_value = True
+
+        response = run(servicer.Follow(post_service_pb2.FollowRequest(follower_id=1, followee_id=2), mock_context))
+
+        # Несколько команд подписки выполняются через run_sync на одном соединении
+        assert mock_session.run_sync.await_args.args[1:] == (1, 2)
+        mock_session.commit.assert_awaited_once()
+        assert response.changed
+
+    def test_home_timeline(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.scalars.return_value.all.return_value = [make_post(2), make_post(1)]
+
+        response = run(servicer.HomeTimeline(post_service_pb2.HomeTimelineRequest(user_id=1, per_page=10), mock_context))
+
+        assert "timeline_entries" in str(mock_session.execute.call_args.args[0])
+        assert [post.id for post in response.posts] == [2, 1]
+        assert response.next_page_token == ""
+        mock_context.set_code.assert_not_called()
@@ -0,0 +1,107 @@
+import pytest
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import counters
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from database import Base
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+def make_session(rows):
+    session = MagicMock()
+    session.query.return_value.filter.return_value.all.return_value = rows
+    return session
+
+def test_post_scope():
+    assert counters.post_scope(False, 5) == 'public'
+    assert counters.post_scope(True, 5) == 'private:5'
+
+def test_read_visible_sums_public_and_own_private():
+    session = make_session([('public', 10, 4), ('private:1', 2, 7)])
+
+    assert counters.read_visible(session, 1) == (12, "4.7")
+
+def test_read_visible_without_counters():
+    assert counters.read_visible(make_session([]), 1) == (0, "0.0")
+
+def test_counter_cache_serves_within_ttl():
+    session = make_session([('public', 10, 4)])
+    cache = counters.CounterCache(ttl=60)
+
+    assert cache.get(session, 1) == (10, "4.0")
+    session.query.return_value.filter.return_value.all.return_value = [('public', 11, 5)]
+    assert cache.get(session, 1) == (10, "4.0")
+    assert session.query.call_count == 1
+
+def test_counter_cache_refreshes_after_ttl():
+    session = make_session([('public', 10, 4)])
+    cache = counters.CounterCache(ttl=5)
+
+    with patch('counters.time.monotonic', return_value=100.0):
+        cache.get(session, 1)
+    session.query.return_value.filter.return_value.all.return_value = [('public', 11, 5)]
+    with patch('counters.time.monotonic', return_value=106.0):
+        assert cache.get(session, 1) == (11, "5.0")
+
+def test_counter_cache_evicts_least_recent():
+    session = make_session([('public', 1, 1)])
+    cache = counters.CounterCache(ttl=60, maxsize=2)
+
+    cache.get(session, 1)
+    cache.get(session, 2)
+    cache.get(session, 1)
+    cache.get(session, 3)
+    calls = session.query.call_count
+    cache.get(session, 1)
+    cache.get(session, 2)
+
+    assert session.query.call_count == calls + 1
+
+def test_reconcile_skips_when_another_instance_runs():
+    session = MagicMock()
+    session.execute.return_value.scalar.return_value = False
+
+    assert counters.reconcile(session) == 0
+    assert session.execute.call_count == 1
+    session.commit.assert_not_called()
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+def test_reconcile_fixes_drift_without_blocking_writes():
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO posts (title, description, creator_id, created_at, updated_at, is_private, tags) "
+            "SELECT 'Post', 'Description', i % 2, now(), now(), i % 3 = 0, ARRAY[]::varchar[] FROM generate_series(1, 30) AS i"
+        ))
+        connection.execute(text(
+            "INSERT INTO post_counters (scope, count, version) VALUES ('public', 25, 3), ('private:0', 5, 1), ('private:7', 2, 1)"
+        ))
+
+    session = sessionmaker(bind=engine)()
+    commit = session.commit
+
+    def commit_after_concurrent_write():
+        # Запись счётчика из другой транзакции, пока пересчёт ещё не закончен
+        with engine.begin() as connection:
+            connection.execute(text("SET LOCAL lock_timeout = '1s'"))
+            connection.execute(text("UPDATE post_counters SET count = count + 1, version = version + 1 WHERE scope = 'private:0'"))
+        commit()
+
+    session.commit = commit_after_concurrent_write
+    try:
+        assert counters.reconcile(session) == 3
+    finally:
+        session.close()
+
+    with engine.connect() as connection:
+        stored = dict(connection.execute(text("SELECT scope, count FROM post_counters")).all())
+    assert stored == {'public': 20, 'private:0': 6, 'private:1': 5, 'private:7': 0}
+    Base.metadata.drop_all(engine)
+    engine.dispose()
@@ -0,0 +1,82 @@
+import json
+import pytest
+import sys
+import os
+import threading
+from collections import namedtuple
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import outbox
+from sqlalchemy import select, literal
+from sqlalchemy.dialects import postgresql
+
+Event = namedtuple('Event', 'id event_type post_id payload')
+
+def make_session(events):
+    session = MagicMock()
+    session.execute.return_value.all.return_value = list(events)
+    return session
+
+def test_record_statement_builds_payload_in_sql():
+    posts = select(literal(1).label('id')).cte('inserted')
+    sql = str(select(posts.c.id).add_cte(outbox.record_statement(posts, outbox.POST_CREATED)).compile(dialect=postgresql.dialect()))
+
+    assert "INSERT INTO outbox_events" in sql and "FROM inserted p" in sql
+    assert "json_build_object('type', 'post_created'" in sql and "p.description" not in sql
+
+def test_create_broker():
+    assert outbox.create_broker('none') is None
+    assert isinstance(outbox.create_broker('memory'), outbox.MemoryBroker)
+    assert outbox.create_broker('file:///tmp/events.jsonl').path == '/tmp/events.jsonl'
+    with pytest.raises(ValueError):
+        outbox.create_broker('amqp://localhost')
+
+def test_file_broker_writes_json_lines(tmp_path):
+    broker = outbox.FileBroker(str(tmp_path / 'events.jsonl'))
+    broker.publish([Event(1, 'post_created', 7, '{"type":"post_created","post_id":7}')])
+    broker.publish([Event(2, 'post_deleted', 7, '{"type":"post_deleted","post_id":7}')])
+
+    lines = [json.loads(line) for line in (tmp_path / 'events.jsonl').read_text().splitlines()]
+    assert lines == [
+        {'id': 1, 'key': 7, 'event': {'type': 'post_created', 'post_id': 7}},
+        {'id': 2, 'key': 7, 'event': {'type': 'post_deleted', 'post_id': 7}}
+    ]
+
+def test_relay_publishes_batch_in_id_order():
+    session = make_session([Event(3, 'post_updated', 1, '{}'), Event(2, 'post_created', 1, '{}')])
+    broker = outbox.MemoryBroker()
+    relay = outbox.OutboxRelay(broker, batch_size=10, session_factory=lambda: session)
+
+    assert relay.relay_batch() == 2
+
+    assert [event.id for event in broker.events] == [2, 3]
+    assert session.execute.call_args.args[1] == {'limit': 10}
+    assert "SKIP LOCKED" in str(session.execute.call_args.args[0])
+    session.commit.assert_called_once()
+    session.close.assert_called_once()
+
+def test_relay_keeps_events_when_broker_fails():
+    session = make_session([Event(1, 'post_created', 1, '{}')])
+    broker = MagicMock()
+    broker.publish.side_effect = RuntimeError("broker is down")
+    relay = outbox.OutboxRelay(broker, session_factory=lambda: session)
+
+    with pytest.raises(RuntimeError):
+        relay.relay_batch()
+
+    # Откат возвращает удалённые строки: события уйдут следующей пачкой
+    session.rollback.assert_called_once()
+    session.commit.assert_not_called()
+
+def test_relay_waits_only_after_partial_batch():
+    stop = threading.Event()
+    relay = outbox.OutboxRelay(outbox.MemoryBroker(), batch_size=2, interval=0.5)
+    published = iter([2, 2, 1])
+    relay.relay_batch = lambda: next(published)
+    stop.wait = MagicMock(side_effect=lambda timeout: stop.set())
+
+    relay.run(stop)
+
+    stop.wait.assert_called_once_with(0.5)
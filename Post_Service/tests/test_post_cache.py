@@ -0,0 +1,166 @@
+import asyncio
+import pytest
+import threading
+import time
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import post_service_pb2
+from post_cache import PostCache, LruBackend, KeyValueBackend, MemoryKeyValue, create_post_cache
+
+def make_post(post_id, title="Post"):
+    return post_service_pb2.Post(id=post_id, title=title, creator_id=1)
+
+@pytest.fixture(params=['lru', 'kv'])
+def cache(request):
+    # Внешнее хранилище заменено MemoryKeyValue: кеш ведёт себя одинаково с обоими бэкендами
+    backend = LruBackend(maxsize=10) if request.param == 'lru' else KeyValueBackend(MemoryKeyValue())
+    return PostCache(backend, ttl=60, negative_ttl=5)
+
+def test_get_loads_once_then_hits(cache):
+    load = MagicMock(return_value=make_post(1))
+
+    assert cache.get(1, load) == make_post(1)
+    assert cache.get(1, load) == make_post(1)
+
+    load.assert_called_once()
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_ratio']) == (1, 1, 0.5)
+    assert stats['entries'] == 1
+    assert stats['memory_bytes'] > 0
+
+def test_missing_post_is_cached_briefly(cache):
+    load = MagicMock(return_value=None)
+
+    assert cache.get(999, load) is None
+    assert cache.get(999, load) is None
+    load.assert_called_once()
+    assert cache.stats()['negative_hits'] == 1
+
+    # Отрицательная запись живёт negative_ttl, а не ttl
+    with patch('post_cache.time.monotonic', return_value=time.monotonic() + 6):
+        cache.get(999, load)
+    assert load.call_count == 2
+
+def test_put_replaces_cached_value(cache):
+    cache.get(1, lambda: make_post(1, "Old"))
+
+    cache.put(1, make_post(1, "New"))
+    assert cache.get(1, MagicMock()).title == "New"
+
+    cache.put(1, None)
+    assert cache.get(1, MagicMock()) is None
+    assert cache.stats()['invalidations'] == 2
+
+def test_put_overrides_negative_entry(cache):
+    cache.get(5, lambda: None)
+
+    cache.put(5, make_post(5))
+
+    assert cache.get(5, MagicMock()) == make_post(5)
+
+def test_load_errors_are_not_cached(cache):
+    with pytest.raises(RuntimeError):
+        cache.get(1, MagicMock(side_effect=RuntimeError("db down")))
+
+    assert cache.get(1, lambda: make_post(1)) == make_post(1)
+
+def test_backend_errors_fall_back_to_load():
+    backend = MagicMock(name='backend')
+    backend.get.side_effect = ConnectionError("cache down")
+    backend.set.side_effect = ConnectionError("cache down")
+    cache = PostCache(backend)
+
+    assert cache.get(1, lambda: make_post(1)) == make_post(1)
+    assert cache.stats()['errors'] == 2
+
+def test_expired_hot_post_is_loaded_once():
+    cache = PostCache(LruBackend(maxsize=10))
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait(1)
+        return make_post(1)
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get(1, load)))
+    leader.start()
+    started.wait(1)
+
+    waiters = [threading.Thread(target=lambda: results.append(cache.get(1, load))) for _ in range(5)]
+    for waiter in waiters:
+        waiter.start()
+    deadline = time.monotonic() + 1
+    while cache.coalesced < 5 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join(1)
+
+    assert len(calls) == 1
+    assert results == [make_post(1)] * 6
+    assert (cache.misses, cache.coalesced) == (1, 5)
+
+def test_async_leader_cancellation_does_not_cancel_waiters():
+    cache = PostCache(LruBackend(maxsize=10))
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return make_post(1)
+
+    async def scenario():
+        leader = asyncio.ensure_future(cache.get_async(1, load))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get_async(1, load))
+        await asyncio.sleep(0.01)
+        # Клиент, начавший загрузку, ушёл: ожидающий всё равно получает пост
+        leader.cancel()
+        return await waiter, leader.cancelled()
+
+    assert asyncio.run(scenario()) == (make_post(1), True)
+    assert len(calls) == 1
+    assert cache.get(1, MagicMock()) == make_post(1)
+
+def test_put_during_load_discards_loaded_row():
+    cache = PostCache(LruBackend(maxsize=10))
+
+    def load():
+        # Пост изменили, пока строка читалась: прочитанное значение уже устарело
+        cache.put(1, make_post(1, "New"))
+        return make_post(1, "Old")
+
+    assert cache.get(1, load).title == "Old"
+    assert cache.get(1, MagicMock()).title == "New"
+
+def test_lru_eviction_and_memory_accounting():
+    backend = LruBackend(maxsize=2)
+    backend.set(1, b'x' * 100, 60)
+    backend.set(2, b'y' * 100, 60)
+    backend.get(1)
+    backend.set(3, b'z' * 100, 60)
+
+    assert backend.get(2) is None
+    assert backend.get(1) == b'x' * 100
+    assert backend.evictions == 1
+    size = backend.memory_bytes()
+    assert size > 200
+
+    backend.delete(1)
+    backend.delete(3)
+    assert backend.entries() == 0
+    assert backend.memory_bytes() == 0
+
+def test_create_post_cache():
+    assert create_post_cache('none') is None
+    assert isinstance(create_post_cache('lru').backend, LruBackend)
+    with pytest.raises(ValueError):
+        create_post_cache('memcached://localhost')
@@ -4,13 +4,17 @@ import sys
 import os
 from unittest.mock import MagicMock, patch
 from datetime import datetime
+from sqlalchemy.dialects import postgresql
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import post_service_pb2
 import post_service_pb2_grpc
+import post_service
 from post_service import PostServicer
 from database import Post, Base
+from pagination import encode_page_token, decode_page_token
+from post_cache import PostCache, LruBackend
 
 class TestPostServicer:
     @pytest.fixture
@@ -21,7 +25,8 @@ class TestPostServicer:
     def mock_session(self, monkeypatch):
         mock_session = MagicMock()
         
-        with patch('post_service.Session') as mock_Session:
+        # Свой кеш на каждый тест: посты из прошлых тестов не должны отвечать из кеша
+        with patch('post_service.Session') as mock_Session, patch('post_service.post_cache', PostCache(LruBackend())):
             mock_Session.return_value = mock_session
             yield mock_session
     
@@ -48,21 +53,21 @@ class TestPostServicer:
         mock_post.updated_at = datetime.now()
         mock_post.is_private = False
         mock_post.tags = ["test", "unit-test"]
-        
-        def add_side_effect(post):
-            post.id = 1
-            post.created_at = mock_post.created_at
-            post.updated_at = mock_post.updated_at
-            return None
-        
-        mock_session.add.side_effect = add_side_effect
+        mock_session.execute.return_value.first.return_value = mock_post
         
         response = servicer.CreatePost(request, mock_context)
         
-        mock_session.add.assert_called_once()
+        # Пост и счётчик записываются одной командой
+        mock_session.execute.assert_called_once()
+        mock_session.add.assert_not_called()
         mock_session.commit.assert_called_once()
         mock_session.close.assert_called_once()
+        sql = str(mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        assert "INSERT INTO posts" in sql and "INSERT INTO post_counters" in sql and "RETURNING" in sql
+        # Рассылка по лентам подписчиков - в той же команде
+        assert "INSERT INTO timeline_entries" in sql
         
+        assert response.id == 1
         assert response.title == "Test Post"
         assert response.description == "This is a test post"
         assert response.creator_id == 1
@@ -151,32 +156,51 @@ class TestPostServicer:
         
         mock_post = MagicMock()
         mock_post.id = 1
-        mock_post.title = "Original Post"
-        mock_post.description = "This is the original post"
+        mock_post.title = "Updated Post"
+        mock_post.description = "This is an updated post"
         mock_post.creator_id = 1
         mock_post.created_at = datetime.now()
         mock_post.updated_at = datetime.now()
-        mock_post.is_private = False
-        mock_post.tags = ["original"]
-        
-        mock_query = MagicMock()
-        mock_query.filter.return_value.first.return_value = mock_post
-        mock_session.query.return_value = mock_query
+        mock_post.is_private = True
+        mock_post.tags = ["updated", "test"]
+        mock_session.execute.return_value.first.return_value = mock_post
         
         response = servicer.UpdatePost(request, mock_context)
         
+        mock_session.execute.assert_called_once()
         mock_session.commit.assert_called_once()
-        
-        assert mock_post.title == "Updated Post"
-        assert mock_post.description == "This is an updated post"
-        assert mock_post.is_private == True
-        assert mock_post.tags == ["updated", "test"]
+        statement = mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect())
+        # Владелец проверяется в самом UPDATE, прежняя видимость читается под FOR UPDATE
+        assert "UPDATE posts" in str(statement) and "FOR UPDATE" in str(statement)
+        assert "INSERT INTO post_counters" in str(statement)
+        # Смена видимости добавляет пост в ленты или убирает из них
+        assert "INSERT INTO timeline_entries" in str(statement) and "DELETE FROM timeline_entries" in str(statement)
+        assert statement.params['creator_id_1'] == 1
+        assert statement.params['id_1'] == 1
         
         assert response.title == "Updated Post"
         assert response.description == "This is an updated post"
         assert response.is_private == True
         assert list(response.tags) == ["updated", "test"]
     
+    def test_update_post_not_found(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.first.return_value = None
+        
+        servicer.UpdatePost(post_service_pb2.UpdatePostRequest(post_id=999, user_id=1), mock_context)
+        
+        # Вторая команда только на промахе: отличает отсутствующий пост от чужого
+        assert mock_session.execute.call_count == 2
+        mock_session.commit.assert_not_called()
+        mock_context.set_code.assert_called_with(grpc.StatusCode.NOT_FOUND)
+    
+    def test_update_post_of_other_user(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.first.side_effect = [None, (2,)]
+        
+        servicer.UpdatePost(post_service_pb2.UpdatePostRequest(post_id=1, user_id=1, title="x"), mock_context)
+        
+        mock_session.commit.assert_not_called()
+        mock_context.set_code.assert_called_with(grpc.StatusCode.PERMISSION_DENIED)
+    
     def test_delete_post_success(self, servicer, mock_session, mock_context):
         request = post_service_pb2.DeletePostRequest(
             post_id=1,
@@ -186,19 +210,55 @@ class TestPostServicer:
         mock_post = MagicMock()
         mock_post.id = 1
         mock_post.creator_id = 1
-        
-        mock_query = MagicMock()
-        mock_query.filter.return_value.first.return_value = mock_post
-        mock_session.query.return_value = mock_query
+        mock_post.is_private = False
+        mock_session.execute.return_value.first.return_value = mock_post
         
         response = servicer.DeletePost(request, mock_context)
         
-        mock_session.delete.assert_called_once_with(mock_post)
+        mock_session.execute.assert_called_once()
+        mock_session.delete.assert_not_called()
         mock_session.commit.assert_called_once()
+        statement = mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect())
+        assert "DELETE FROM posts" in str(statement) and "INSERT INTO post_counters" in str(statement)
+        assert "DELETE FROM timeline_entries" in str(statement)
+        assert statement.params['creator_id_1'] == 1
         
         assert response.success == True
         assert "deleted successfully" in response.message
     
+    def test_writes_record_outbox_events(self, servicer, mock_session, mock_context):
+        mock_post = MagicMock(id=1, title="Post", description="Text", creator_id=1, is_private=False, tags=[],
+                              created_at=datetime.now(), updated_at=datetime.now())
+        mock_session.execute.return_value.first.return_value = mock_post
+
+        def statement_sql():
+            return str(mock_session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+
+        # Без брокера события не пишутся
+        servicer.CreatePost(post_service_pb2.CreatePostRequest(title="Post", creator_id=1), mock_context)
+        assert "outbox_events" not in statement_sql()
+
+        with patch('outbox.RECORD_EVENTS', True):
+            servicer.CreatePost(post_service_pb2.CreatePostRequest(title="Post", creator_id=1), mock_context)
+            assert "INSERT INTO outbox_events" in statement_sql() and "'post_created'" in statement_sql()
+            servicer.UpdatePost(post_service_pb2.UpdatePostRequest(post_id=1, user_id=1, title="New"), mock_context)
+            assert "'post_updated'" in statement_sql()
+            servicer.DeletePost(post_service_pb2.DeletePostRequest(post_id=1, user_id=1), mock_context)
+            assert "'post_deleted'" in statement_sql()
+
+        # Событие - часть той же команды, отдельного обращения к базе нет
+        assert mock_session.execute.call_count == 4
+        mock_context.set_code.assert_not_called()
+    
+    def test_delete_post_of_other_user(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.first.side_effect = [None, (2,)]
+        
+        response = servicer.DeletePost(post_service_pb2.DeletePostRequest(post_id=1, user_id=1), mock_context)
+        
+        mock_session.commit.assert_not_called()
+        mock_context.set_code.assert_called_with(grpc.StatusCode.PERMISSION_DENIED)
+        assert response.success == False
+    
     def test_list_posts(self, servicer, mock_session, mock_context):
         request = post_service_pb2.ListPostsRequest(
             page=1,
@@ -221,9 +281,9 @@ class TestPostServicer:
         
         mock_query = MagicMock()
         mock_query.filter.return_value = mock_query
-        mock_query.count.return_value = len(mock_posts)
-        mock_query.order_by.return_value.offset.return_value.limit.return_value.all.return_value = mock_posts
+        mock_query.all.return_value = [("public", 2, 7), ("private:1", 1, 3)]
         mock_session.query.return_value = mock_query
+        mock_session.execute.return_value.scalars.return_value.all.return_value = mock_posts
         
         response = servicer.ListPosts(request, mock_context)
         
@@ -231,7 +291,499 @@ class TestPostServicer:
         assert response.total == 3
         assert response.page == 1
         assert response.per_page == 10
+        assert response.version == "7.3"
+        mock_query.with_entities.assert_not_called()
         
         first_post = response.posts[0]
         assert first_post.id == 1
         assert first_post.title == "Post 1"
+        assert response.next_page_token == ""
+    
+    def test_list_posts_with_page_token(self, servicer, mock_session, mock_context):
+        created_at = datetime(2024, 1, 1, 12, 0, 0)
+        request = post_service_pb2.ListPostsRequest(
+            per_page=2,
+            user_id=1,
+            page_token=encode_page_token(created_at, 10)
+        )
+        
+        mock_posts = []
+        for i in range(3):
+            mock_post = MagicMock()
+            mock_post.id = 9 - i
+            mock_post.title = f"Post {9 - i}"
+            mock_post.description = "Description"
+            mock_post.creator_id = 1
+            mock_post.created_at = created_at
+            mock_post.updated_at = created_at
+            mock_post.is_private = False
+            mock_post.tags = []
+            mock_posts.append(mock_post)
+        
+        mock_query = MagicMock()
+        mock_query.filter.return_value = mock_query
+        mock_query.all.return_value = [("public", 20, 1)]
+        mock_session.query.return_value = mock_query
+        mock_session.execute.return_value.scalars.return_value.all.return_value = mock_posts
+        
+        response = servicer.ListPosts(request, mock_context)
+        
+        assert [post.id for post in response.posts] == [9, 8]
+        assert decode_page_token(response.next_page_token) == (created_at, 8)
+        statement = mock_session.execute.call_args.args[0]
+        assert statement._limit == 3
+        assert statement._offset is None
+    
+    def test_list_posts_without_total(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.ListPostsRequest(
+            per_page=10,
+            user_id=1,
+            total_mode=post_service_pb2.TOTAL_NONE
+        )
+        mock_query = MagicMock()
+        mock_query.filter.return_value = mock_query
+        mock_session.query.return_value = mock_query
+        mock_session.execute.return_value.scalars.return_value.all.return_value = []
+        
+        response = servicer.ListPosts(request, mock_context)
+        
+        assert response.total == 0
+        assert response.version == ""
+        assert response.total_mode == post_service_pb2.TOTAL_NONE
+        mock_query.all.assert_not_called()
+    
+    def test_list_posts_invalid_page_token(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.ListPostsRequest(per_page=2, user_id=1, page_token="not-a-token")
+        
+        servicer.ListPosts(request, mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.INVALID_ARGUMENT)
+        mock_session.query.assert_not_called()
+
+    
+    def test_get_post_version(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.GetPostRequest(post_id=1, user_id=1)
+        updated_at = datetime.now()
+        
+        mock_row = MagicMock()
+        mock_row.id = 1
+        mock_row.creator_id = 2
+        mock_row.is_private = False
+        mock_row.updated_at = updated_at
+        mock_session.query.return_value.filter.return_value.first.return_value = mock_row
+        
+        response = servicer.GetPostVersion(request, mock_context)
+        
+        assert response.post_id == 1
+        assert response.updated_at == updated_at.isoformat()
+        mock_context.set_code.assert_not_called()
+    
+    def test_get_post_version_private_denied(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.GetPostRequest(post_id=1, user_id=1)
+        
+        mock_row = MagicMock()
+        mock_row.id = 1
+        mock_row.creator_id = 2
+        mock_row.is_private = True
+        mock_session.query.return_value.filter.return_value.first.return_value = mock_row
+        
+        servicer.GetPostVersion(request, mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.PERMISSION_DENIED)
+    
+    def test_get_listing_version(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.ListPostsRequest(page=1, per_page=10, user_id=1)
+        mock_session.query.return_value.filter.return_value.all.return_value = [("public", 5, 9)]
+        
+        response = servicer.GetListingVersion(request, mock_context)
+        
+        assert response.version == "9.0"
+    
+    def test_list_posts_by_tag(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.ListPostsByTagRequest(
+            tags=["python", "grpc"],
+            match=post_service_pb2.TAG_MATCH_ALL,
+            per_page=1,
+            user_id=1
+        )
+        
+        mock_posts = []
+        for i in range(2):
+            mock_post = MagicMock()
+            mock_post.id = 2 - i
+            mock_post.title = f"Post {2 - i}"
+            mock_post.description = "Description"
+            mock_post.creator_id = 1
+            mock_post.created_at = datetime(2024, 1, 1)
+            mock_post.updated_at = datetime(2024, 1, 1)
+            mock_post.is_private = False
+            mock_post.tags = ["grpc", "python"]
+            mock_posts.append(mock_post)
+        mock_session.execute.return_value.scalars.return_value.all.return_value = mock_posts
+        
+        response = servicer.ListPostsByTag(request, mock_context)
+        
+        assert [post.id for post in response.posts] == [2]
+        assert decode_page_token(response.next_page_token) == (datetime(2024, 1, 1), 2)
+        assert response.total_mode == post_service_pb2.TOTAL_NONE
+        statement = str(mock_session.execute.call_args.args[0])
+        assert "posts.tags @> CAST(ARRAY[" in statement
+        mock_context.set_code.assert_not_called()
+    
+    def test_list_posts_by_tag_any_uses_overlap(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.ListPostsByTagRequest(tags=["python"], per_page=10, user_id=1)
+        mock_session.execute.return_value.scalars.return_value.all.return_value = []
+        
+        servicer.ListPostsByTag(request, mock_context)
+        
+        assert "posts.tags && CAST(ARRAY[" in str(mock_session.execute.call_args.args[0])
+    
+    def test_list_posts_by_tag_requires_tags(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.ListPostsByTagRequest(tags=[], per_page=10, user_id=1)
+        
+        servicer.ListPostsByTag(request, mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.INVALID_ARGUMENT)
+        mock_session.execute.assert_not_called()
+    
+    def test_search_posts(self, servicer, mock_session, mock_context, monkeypatch):
+        from search import SqliteSearchBackend
+        backend = SqliteSearchBackend()
+        monkeypatch.setattr('post_service.search_backend', backend)
+        
+        mock_posts = []
+        for i, title in enumerate(["Python tips", "Python news", "Cooking"]):
+            mock_post = MagicMock()
+            mock_post.id = i + 1
+            mock_post.title = title
+            mock_post.description = "Description"
+            mock_post.creator_id = 1
+            mock_post.created_at = datetime.now()
+            mock_post.updated_at = datetime.now()
+            mock_post.is_private = False
+            mock_post.tags = []
+            mock_posts.append(mock_post)
+            backend.index_post(mock_post)
+        mock_session.query.return_value.filter.return_value.all.return_value = mock_posts[:2]
+        
+        request = post_service_pb2.SearchPostsRequest(query="python", per_page=1, user_id=1)
+        response = servicer.SearchPosts(request, mock_context)
+        
+        assert len(response.posts) == 1
+        assert response.posts[0].title.startswith("Python")
+        assert response.next_page_token != ""
+        mock_context.set_code.assert_not_called()
+    
+    def test_search_posts_requires_query(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.SearchPostsRequest(query="  !! ", per_page=10, user_id=1)
+        
+        servicer.SearchPosts(request, mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.INVALID_ARGUMENT)
+        mock_session.query.assert_not_called()
+    
+    def test_create_post_updates_search_index(self, servicer, mock_session, mock_context, monkeypatch):
+        backend = MagicMock()
+        monkeypatch.setattr('post_service.search_backend', backend)
+        request = post_service_pb2.CreatePostRequest(title="Post", description="Text", creator_id=1)
+        
+        mock_post = MagicMock(id=1, title="Post", description="Text", creator_id=1, is_private=False, tags=[])
+        mock_post.created_at = mock_post.updated_at = datetime.now()
+        mock_session.execute.return_value.first.return_value = mock_post
+        
+        servicer.CreatePost(request, mock_context)
+        
+        backend.index_post.assert_called_once()
+        assert backend.index_post.call_args.args[0].title == "Post"
+    
+    def test_batch_get_posts(self, servicer, mock_session, mock_context):
+        mock_posts = []
+        for post_id, creator_id, is_private in [(1, 1, False), (2, 2, True), (3, 2, False)]:
+            mock_post = MagicMock()
+            mock_post.id = post_id
+            mock_post.title = f"Post {post_id}"
+            mock_post.description = "Description"
+            mock_post.creator_id = creator_id
+            mock_post.created_at = datetime.now()
+            mock_post.updated_at = datetime.now()
+            mock_post.is_private = is_private
+            mock_post.tags = []
+            mock_posts.append(mock_post)
+        mock_session.query.return_value.filter.return_value.all.return_value = mock_posts
+        
+        request = post_service_pb2.BatchGetPostsRequest(post_ids=[3, 2, 4, 3, 1], user_id=1)
+        response = servicer.BatchGetPosts(request, mock_context)
+        
+        assert [result.post_id for result in response.results] == [3, 2, 4, 1]
+        assert [result.status for result in response.results] == [
+            post_service_pb2.POST_OK,
+            post_service_pb2.POST_PERMISSION_DENIED,
+            post_service_pb2.POST_NOT_FOUND,
+            post_service_pb2.POST_OK
+        ]
+        assert response.results[0].post.title == "Post 3"
+        assert not response.results[1].HasField('post')
+        # Все id читаются одним запросом
+        mock_session.query.assert_called_once()
+        mock_context.set_code.assert_not_called()
+    
+    def test_batch_get_posts_limits_ids(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.BatchGetPostsRequest(post_ids=range(1, 102), user_id=1)
+        
+        servicer.BatchGetPosts(request, mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.INVALID_ARGUMENT)
+        mock_session.query.assert_not_called()
+    
+    def test_stream_posts(self, servicer, mock_session, mock_context):
+        mock_posts = []
+        for i in range(3):
+            mock_post = MagicMock()
+            mock_post.id = i + 1
+            mock_post.title = f"Post {i + 1}"
+            mock_post.description = "Description"
+            mock_post.creator_id = 1
+            mock_post.created_at = datetime.now()
+            mock_post.updated_at = datetime.now()
+            mock_post.is_private = False
+            mock_post.tags = []
+            mock_posts.append(mock_post)
+        mock_session.execute.return_value.scalars.return_value = iter(mock_posts)
+        mock_context.is_active.return_value = True
+        
+        request = post_service_pb2.StreamPostsRequest(
+            user_id=1, creator_id=1, created_after="2024-01-01T00:00:00", tags=["python"], after_id=10
+        )
+        posts = list(servicer.StreamPosts(request, mock_context))
+        
+        assert [post.id for post in posts] == [1, 2, 3]
+        query = mock_session.execute.call_args.args[0]
+        assert query.get_execution_options()['stream_results'] is True
+        assert query.get_execution_options()['yield_per'] > 0
+        mock_session.query.assert_not_called()
+        mock_session.close.assert_called_once()
+        mock_context.set_code.assert_not_called()
+    
+    def test_stream_posts_stops_when_client_disconnects(self, servicer, mock_session, mock_context):
+        mock_post = MagicMock()
+        mock_post.id = 1
+        mock_post.created_at = datetime.now()
+        mock_post.updated_at = datetime.now()
+        mock_post.title = "Post"
+        mock_post.description = "Description"
+        mock_post.creator_id = 1
+        mock_post.is_private = False
+        mock_post.tags = []
+        mock_session.execute.return_value.scalars.return_value = iter([mock_post, mock_post])
+        mock_context.is_active.side_effect = [True, False]
+        
+        posts = list(servicer.StreamPosts(post_service_pb2.StreamPostsRequest(user_id=1), mock_context))
+        
+        assert len(posts) == 1
+        mock_session.close.assert_called_once()
+    
+    def test_stream_posts_invalid_time_range(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.StreamPostsRequest(user_id=1, created_before="yesterday")
+        
+        posts = list(servicer.StreamPosts(request, mock_context))
+        
+        assert posts == []
+        mock_context.set_code.assert_called_with(grpc.StatusCode.INVALID_ARGUMENT)
+        mock_session.execute.assert_not_called()
+
+    def test_get_post_served_from_cache(self, servicer, mock_session, mock_context):
+        mock_post = MagicMock(id=1, title="Cached", description="Text", creator_id=2, is_private=False, tags=[])
+        mock_post.created_at = mock_post.updated_at = datetime.now()
+        mock_session.query.return_value.filter.return_value.first.return_value = mock_post
+        
+        first = servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=1), mock_context)
+        second = servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=3), mock_context)
+        
+        assert first == second
+        assert second.title == "Cached"
+        mock_session.query.assert_called_once()
+    
+    def test_get_private_post_from_cache_checks_owner(self, servicer, mock_session, mock_context):
+        mock_post = MagicMock(id=1, title="Secret", description="Text", creator_id=2, is_private=True, tags=[])
+        mock_post.created_at = mock_post.updated_at = datetime.now()
+        mock_session.query.return_value.filter.return_value.first.return_value = mock_post
+        
+        assert servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=2), mock_context).title == "Secret"
+        servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=1), mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.PERMISSION_DENIED)
+        mock_session.query.assert_called_once()
+    
+    def test_get_missing_post_cached(self, servicer, mock_session, mock_context):
+        mock_session.query.return_value.filter.return_value.first.return_value = None
+        
+        for _ in range(2):
+            servicer.GetPost(post_service_pb2.GetPostRequest(post_id=999, user_id=1), mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.NOT_FOUND)
+        mock_session.query.assert_called_once()
+    
+    def test_cache_fills_read_from_primary(self, servicer, mock_session, mock_context, monkeypatch):
+        replica = MagicMock()
+        monkeypatch.setattr('post_service.replicas.engine_for', lambda user_id: replica)
+        mock_session.query.return_value.filter.return_value.first.return_value = None
+        
+        # Промах кеша читается с основной базы: строка с отстающей реплики осталась бы в кеше на весь TTL
+        servicer.GetPost(post_service_pb2.GetPostRequest(post_id=999, user_id=1), mock_context)
+        assert post_service.Session.call_args.kwargs == {}
+        
+        monkeypatch.setattr('post_service.post_cache', None)
+        servicer.GetPost(post_service_pb2.GetPostRequest(post_id=999, user_id=1), mock_context)
+        assert post_service.Session.call_args.kwargs == {'bind': replica}
+    
+    def test_update_and_delete_refresh_cache(self, servicer, mock_session, mock_context):
+        mock_post = MagicMock(id=1, title="Old", description="Text", creator_id=1, is_private=False, tags=[])
+        mock_post.created_at = mock_post.updated_at = datetime.now()
+        mock_session.query.return_value.filter.return_value.first.return_value = mock_post
+        servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=1), mock_context)
+        
+        updated = MagicMock(id=1, title="New", description="Text", creator_id=1, is_private=False, tags=[])
+        updated.created_at = updated.updated_at = datetime.now()
+        mock_session.execute.return_value.first.return_value = updated
+        servicer.UpdatePost(post_service_pb2.UpdatePostRequest(post_id=1, user_id=1, title="New"), mock_context)
+        assert servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=1), mock_context).title == "New"
+        
+        servicer.DeletePost(post_service_pb2.DeletePostRequest(post_id=1, user_id=1), mock_context)
+        servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=1), mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.NOT_FOUND)
+        mock_session.query.assert_called_once()
+    
+    def test_get_cache_stats(self, servicer, mock_session, mock_context):
+        mock_session.query.return_value.filter.return_value.first.return_value = None
+        servicer.GetPost(post_service_pb2.GetPostRequest(post_id=999, user_id=1), mock_context)
+        servicer.GetPost(post_service_pb2.GetPostRequest(post_id=999, user_id=1), mock_context)
+        
+        stats = servicer.GetCacheStats(post_service_pb2.CacheStatsRequest(), mock_context)
+        
+        assert stats.enabled
+        assert (stats.misses, stats.negative_hits, stats.entries) == (1, 1, 1)
+        assert stats.hit_ratio == 0.5
+        assert stats.memory_bytes > 0
+    
+    def test_list_posts_with_read_mask(self, servicer, mock_session, mock_context):
+        mock_post = MagicMock(id=1, title="Post", creator_id=1, is_private=False)
+        mock_post.created_at = datetime(2024, 1, 1)
+        mock_session.execute.return_value.scalars.return_value.all.return_value = [mock_post]
+        request = post_service_pb2.ListPostsRequest(
+            per_page=10, user_id=1, total_mode=post_service_pb2.TOTAL_NONE, read_mask={'paths': ['title']}
+        )
+        
+        response = servicer.ListPosts(request, mock_context)
+        
+        # description и остальные поля вне маски не выбираются из базы
+        sql = str(mock_session.execute.call_args.args[0])
+        assert "posts.title" in sql and "description" not in sql and "tags" not in sql
+        post = response.posts[0]
+        assert (post.id, post.title, post.creator_id) == (1, "Post", 1)
+        assert post.description == "" and post.created_at == ""
+        mock_context.set_code.assert_not_called()
+    
+    def test_listings_do_not_select_search_vector(self, servicer, mock_session, mock_context):
+        mock_session.execute.return_value.scalars.return_value.all.return_value = []
+        
+        servicer.ListPosts(post_service_pb2.ListPostsRequest(per_page=10, user_id=1, total_mode=post_service_pb2.TOTAL_NONE), mock_context)
+        list_sql = str(mock_session.execute.call_args.args[0])
+        servicer.ListPostsByTag(post_service_pb2.ListPostsByTagRequest(tags=["python"], per_page=10, user_id=1), mock_context)
+        tag_sql = str(mock_session.execute.call_args.args[0])
+        
+        # tsvector нужен только поиску, в ветки UNION ALL он не попадает
+        for sql in (list_sql, tag_sql):
+            assert "UNION ALL" in sql and "posts.description" in sql and "search_vector" not in sql
+        mock_context.set_code.assert_not_called()
+    
+    def test_get_post_with_read_mask(self, servicer, mock_session, mock_context):
+        mock_post = MagicMock(id=1, title="Post", description="Long text", creator_id=2, is_private=False, tags=["a"])
+        mock_post.created_at = mock_post.updated_at = datetime(2024, 1, 1)
+        mock_session.query.return_value.filter.return_value.first.return_value = mock_post
+        request = post_service_pb2.GetPostRequest(post_id=1, user_id=1, read_mask={'paths': ['title', 'updated_at']})
+        
+        response = servicer.GetPost(request, mock_context)
+        
+        assert response.title == "Post"
+        assert response.updated_at == "2024-01-01T00:00:00"
+        assert response.description == "" and list(response.tags) == []
+        # Кеш хранит полный пост: следующий запрос без маски получит и описание
+        full = servicer.GetPost(post_service_pb2.GetPostRequest(post_id=1, user_id=1), mock_context)
+        assert full.description == "Long text"
+        mock_session.query.assert_called_once()
+    
+    def test_get_post_with_read_mask_without_cache(self, servicer, mock_session, mock_context, monkeypatch):
+        monkeypatch.setattr('post_service.post_cache', None)
+        request = post_service_pb2.GetPostRequest(post_id=1, user_id=1, read_mask={'paths': ['title']})
+        
+        servicer.GetPost(request, mock_context)
+        
+        options = mock_session.query.return_value.filter.return_value.options
+        options.assert_called_once()
+    
+    def test_invalid_read_mask(self, servicer, mock_session, mock_context):
+        request = post_service_pb2.GetPostRequest(post_id=1, user_id=1, read_mask={'paths': ['title', 'password']})
+        
+        servicer.GetPost(request, mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.INVALID_ARGUMENT)
+        mock_session.query.assert_not_called()
+    
+    def test_follow(self, servicer, mock_session, mock_context):
+        with patch('post_service.timeline.follow', return_value=True) as follow:
+            response = servicer.Follow(post_service_pb2.FollowRequest(follower_id=1, followee_id=2), mock_context)
+        
+        follow.assert_called_once_with(mock_session, 1, 2)
+        mock_session.commit.assert_called_once()
+        assert response.changed
+        mock_context.set_code.assert_not_called()
+    
+    def test_follow_self_rejected(self, servicer, mock_session, mock_context):
+        servicer.Follow(post_service_pb2.FollowRequest(follower_id=1, followee_id=1), mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.INVALID_ARGUMENT)
+        mock_session.execute.assert_not_called()
+    
+    def test_unfollow_error_rolls_back(self, servicer, mock_session, mock_context):
+        with patch('post_service.timeline.unfollow', side_effect=RuntimeError("db down")):
+            response = servicer.Unfollow(post_service_pb2.FollowRequest(follower_id=1, followee_id=2), mock_context)
+        
+        mock_session.rollback.assert_called_once()
+        mock_session.commit.assert_not_called()
+        mock_context.set_code.assert_called_with(grpc.StatusCode.INTERNAL)
+        assert not response.changed
+    
+    def test_list_followers(self, servicer, mock_session, mock_context):
+        rows = [MagicMock(user_id=user_id, created_at=datetime(2024, 1, user_id)) for user_id in (3, 2, 1)]
+        mock_session.execute.return_value.all.return_value = rows
+        
+        response = servicer.ListFollowers(post_service_pb2.ListFollowsRequest(user_id=9, per_page=2), mock_context)
+        
+        sql = str(mock_session.execute.call_args.args[0])
+        assert "follows.followee_id = " in sql
+        assert [entry.user_id for entry in response.follows] == [3, 2]
+        assert decode_page_token(response.next_page_token) == (datetime(2024, 1, 2), 2)
+    
+    def test_home_timeline(self, servicer, mock_session, mock_context):
+        posts = []
+        for post_id in (3, 2, 1):
+            post = MagicMock(id=post_id, title=f"Post {post_id}", description="Text", creator_id=2, is_private=False, tags=[])
+            post.created_at = post.updated_at = datetime(2024, 1, post_id)
+            posts.append(post)
+        mock_session.execute.return_value.scalars.return_value.all.return_value = posts
+        
+        response = servicer.HomeTimeline(post_service_pb2.HomeTimelineRequest(user_id=1, per_page=2), mock_context)
+        
+        # Разосланные записи и посты pulled-авторов читаются одним запросом
+        sql = str(mock_session.execute.call_args.args[0])
+        assert "timeline_entries" in sql and "follows.pulled" in sql
+        assert [post.id for post in response.posts] == [3, 2]
+        assert decode_page_token(response.next_page_token) == (datetime(2024, 1, 2), 2)
+        mock_context.set_code.assert_not_called()
+    
+    def test_home_timeline_invalid_page_token(self, servicer, mock_session, mock_context):
+        servicer.HomeTimeline(post_service_pb2.HomeTimelineRequest(user_id=1, page_token="broken"), mock_context)
+        
+        mock_context.set_code.assert_called_with(grpc.StatusCode.INVALID_ARGUMENT)
+        mock_session.execute.assert_not_called()
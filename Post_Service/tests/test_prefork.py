@@ -0,0 +1,98 @@
+import pytest
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import subprocess
+from prefork import Supervisor, worker_pool_size, engines_per_server, check_search_backend, check_post_cache, shared_writer_store
+
+def test_worker_pools_fit_into_max_connections():
+    assert worker_pool_size(4, 90) == 22
+    assert worker_pool_size(1, 90) == 90
+
+    with pytest.raises(ValueError):
+        worker_pool_size(8, 4)
+
+def test_async_workers_split_budget_between_both_pools():
+    pool_size = worker_pool_size(4, 90, engines_per_server('async'))
+
+    assert pool_size == 11
+    assert 4 * engines_per_server('async') * pool_size <= 90
+    assert engines_per_server('sync') == 1
+    with pytest.raises(ValueError):
+        worker_pool_size(4, 6, engines_per_server('async'))
+
+def test_in_memory_search_index_is_rejected_with_several_workers():
+    with pytest.raises(ValueError):
+        check_search_backend('sqlite://', 2)
+
+    check_search_backend('sqlite://', 1)
+    check_search_backend('sqlite:////var/lib/posts/search.db', 2)
+    check_search_backend('postgres', 2)
+
+def test_in_process_post_cache_is_rejected_with_several_workers():
+    with pytest.raises(ValueError):
+        check_post_cache('lru', 2)
+
+    check_post_cache('lru', 1)
+    check_post_cache('redis://cache:6379/1', 2)
+    check_post_cache('none', 2)
+
+def test_recent_writers_are_shared_between_workers():
+    assert shared_writer_store('memory', 4, '/run/posts') == 'sqlite:////run/posts/recent_writers.db'
+    assert shared_writer_store('memory', 1, '/run/posts') == 'memory'
+    assert shared_writer_store('redis://cache:6379/2', 4, '/run/posts') == 'redis://cache:6379/2'
+
+def make_spawn():
+    spawned = []
+
+    def spawn(index, env):
+        process = MagicMock()
+        process.poll.return_value = None
+        spawned.append((index, env, process))
+        return process
+    return spawn, spawned
+
+def test_supervisor_starts_workers_with_env():
+    spawn, spawned = make_spawn()
+    supervisor = Supervisor(3, {'DB_POOL_SIZE': '30'}, spawn=spawn)
+
+    supervisor.start()
+
+    assert [index for index, _, _ in spawned] == [0, 1, 2]
+    assert all(env['DB_POOL_SIZE'] == '30' for _, env, _ in spawned)
+
+def test_supervisor_restarts_crashed_worker():
+    spawn, spawned = make_spawn()
+    supervisor = Supervisor(2, {}, spawn=spawn)
+    supervisor.start()
+    spawned[1][2].poll.return_value = -9
+
+    with patch('prefork.time.sleep') as sleep:
+        supervisor.check()
+
+    assert [index for index, _, _ in spawned] == [0, 1, 1]
+    assert supervisor.processes[1] is spawned[2][2]
+    # Воркер умер сразу после старта: перезапуск с паузой
+    sleep.assert_called_once()
+
+def test_supervisor_stop_drains_then_kills():
+    spawn, spawned = make_spawn()
+    supervisor = Supervisor(2, {}, spawn=spawn)
+    supervisor.start()
+    drained, stuck = spawned[0][2], spawned[1][2]
+    stuck.wait.side_effect = [subprocess.TimeoutExpired('post_service.py', 1), 0]
+
+    supervisor.stop(grace=0)
+
+    drained.terminate.assert_called_once()
+    stuck.terminate.assert_called_once()
+    drained.kill.assert_not_called()
+    stuck.kill.assert_called_once()
+
+    # Во время остановки вышедшие воркеры не перезапускаются
+    drained.poll.return_value = 0
+    supervisor.check()
+    assert len(spawned) == 2
@@ -0,0 +1,111 @@
+import json
+import pytest
+import sys
+import os
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select, text, cast, func, literal_column, String, Integer, any_, bindparam
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from database import Base, Post, ensure_indexes
+from queries import visible_posts, export_posts, home_timeline
+
+# Планы проверяются только на настоящем PostgreSQL; таблица posts в этой базе пересоздаётся
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    ensure_indexes(engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO posts (title, description, creator_id, created_at, updated_at, is_private, tags) "
+            "SELECT 'Post ' || i, 'Description', i % 500, "
+            "now() - make_interval(secs => i), now() - make_interval(secs => i), i % 10 = 0, "
+            "ARRAY['tag' || (i % 1000)] "
+            "FROM generate_series(1, 50000) AS i"
+        ))
+    # VACUUM переносит строки из pending list GIN-индексов в сам индекс, как это сделал бы autovacuum
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text("VACUUM ANALYZE posts"))
+    yield engine
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+def plan_nodes(engine, query):
+    sql = query.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+    with engine.connect() as connection:
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    nodes = []
+    pending = [plan[0]['Plan']]
+    while pending:
+        node = pending.pop()
+        nodes.append(node)
+        pending.extend(node.get('Plans', []))
+    return nodes
+
+def used_indexes(nodes):
+    return {node['Index Name'] for node in nodes if 'Index Name' in node}
+
+def assert_no_seq_scan(nodes):
+    assert not [node for node in nodes if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') == 'posts']
+
+def test_first_page_uses_both_visibility_indexes(engine):
+    nodes = plan_nodes(engine, visible_posts(user_id=7, limit=21))
+
+    assert_no_seq_scan(nodes)
+    assert {'ix_posts_public_created_at', 'ix_posts_creator_created_at'} <= used_indexes(nodes)
+    # Ветки уже упорядочены индексами и сливаются без сортировки
+    assert 'Merge Append' in {node['Node Type'] for node in nodes}
+    assert 'Sort' not in {node['Node Type'] for node in nodes}
+
+def test_cursor_page_seeks_through_indexes(engine):
+    nodes = plan_nodes(engine, visible_posts(user_id=7, limit=21, cursor=(datetime(2020, 1, 1), 1000)))
+
+    assert_no_seq_scan(nodes)
+    assert {'ix_posts_public_created_at', 'ix_posts_creator_created_at'} <= used_indexes(nodes)
+
+def test_tag_lookup_uses_gin_index(engine):
+    nodes = plan_nodes(engine, select(Post).where(Post.tags.contains(cast(array(['tag42']), ARRAY(String)))))
+
+    assert_no_seq_scan(nodes)
+    assert 'ix_posts_tags' in used_indexes(nodes)
+
+def test_search_uses_gin_index(engine):
+    query = select(Post.id).where(Post.search_vector.op('@@')(func.websearch_to_tsquery(literal_column("'simple'::regconfig"), '12345')))
+
+    nodes = plan_nodes(engine, query)
+
+    assert_no_seq_scan(nodes)
+    assert 'ix_posts_search' in used_indexes(nodes)
+
+def test_batch_lookup_uses_primary_key(engine):
+    query = select(Post).where(Post.id == any_(bindparam('post_ids', [5, 500, 5000], type_=ARRAY(Integer))))
+
+    nodes = plan_nodes(engine, query)
+
+    assert_no_seq_scan(nodes)
+    assert 'posts_pkey' in used_indexes(nodes)
+
+def test_export_walks_primary_key(engine):
+    nodes = plan_nodes(engine, export_posts(user_id=7, after_id=1000))
+
+    assert_no_seq_scan(nodes)
+    assert 'posts_pkey' in used_indexes(nodes)
+    assert 'Sort' not in {node['Node Type'] for node in nodes}
+
+def test_home_timeline_reads_only_page_sized_ranges(engine):
+    nodes = plan_nodes(engine, home_timeline(user_id=7, limit=21))
+
+    assert_no_seq_scan(nodes)
+    # Свои посты - по индексу автора, посты из ленты - по первичному ключу
+    assert {'ix_posts_creator_created_at', 'posts_pkey'} <= used_indexes(nodes)
@@ -0,0 +1,135 @@
+import pytest
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import post_service_pb2
+from database import ReplicaSet
+from recent_writers import SqliteWriterStore, KeyValueWriterStore, create_writer_store
+from post_cache import MemoryKeyValue
+
+def make_replica(name):
+    replica = MagicMock()
+    replica.url.host = name
+    return replica
+
+@pytest.fixture
+def lags(monkeypatch):
+    lags = {}
+
+    def replica_lag(replica):
+        lag = lags[replica.url.host]
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+    monkeypatch.setattr('database.replica_lag', replica_lag)
+    return lags
+
+def test_reads_go_to_primary_before_first_check():
+    replicas = ReplicaSet([make_replica('replica1')])
+
+    assert replicas.engine_for(1) is None
+
+def test_reads_are_spread_over_healthy_replicas(lags):
+    first, second = make_replica('replica1'), make_replica('replica2')
+    lags.update(replica1=0.1, replica2=0.0)
+    replicas = ReplicaSet([first, second], max_lag=5)
+
+    replicas.refresh()
+
+    assert {replicas.engine_for(1), replicas.engine_for(1)} == {first, second}
+
+def test_lagging_or_unavailable_replica_is_skipped(lags):
+    lagging, broken, healthy = make_replica('replica1'), make_replica('replica2'), make_replica('replica3')
+    lags.update(replica1=30.0, replica2=ConnectionError("refused"), replica3=1.0)
+    replicas = ReplicaSet([lagging, broken, healthy], max_lag=5)
+
+    replicas.refresh()
+
+    assert [replicas.engine_for(1) for _ in range(3)] == [healthy] * 3
+
+    lags['replica3'] = 30.0
+    replicas.refresh()
+
+    assert replicas.engine_for(1) is None
+
+def test_recent_writer_reads_from_primary(lags):
+    replica = make_replica('replica1')
+    lags['replica1'] = 0.0
+    replicas = ReplicaSet([replica], read_your_writes_window=10)
+    replicas.refresh()
+
+    with patch('recent_writers.time.monotonic', return_value=100.0):
+        replicas.note_write(7)
+        assert replicas.engine_for(7) is None
+        assert replicas.engine_for(8) is replica
+
+    with patch('recent_writers.time.monotonic', return_value=111.0):
+        assert replicas.engine_for(7) is replica
+
+@pytest.mark.parametrize('store', ['sqlite', 'kv'])
+def test_recent_writer_is_shared_between_workers(lags, tmp_path, store):
+    # Два ReplicaSet - два воркера: запись в одном, следующее чтение того же автора в другом
+    replica = make_replica('replica1')
+    lags['replica1'] = 0.0
+    if store == 'sqlite':
+        stores = [SqliteWriterStore(str(tmp_path / 'writers.db')) for _ in range(2)]
+    else:
+        client = MemoryKeyValue()
+        stores = [KeyValueWriterStore(client) for _ in range(2)]
+    writer, reader = [ReplicaSet([replica], read_your_writes_window=10, writers=writers) for writers in stores]
+    reader.refresh()
+
+    writer.note_write(7)
+
+    assert reader.engine_for(7) is None
+    assert reader.engine_for(8) is replica
+
+def test_create_writer_store(tmp_path):
+    assert isinstance(create_writer_store(f'sqlite:///{tmp_path}/writers.db'), SqliteWriterStore)
+    assert create_writer_store('memory').contains(1) is False
+    with pytest.raises(ValueError):
+        create_writer_store('memcached://localhost')
+
+# Маршрутизация на двух настоящих базах: вторая база не связана с первой репликацией,
+# поэтому по тому, видна ли запись, понятно, куда ушло чтение. Таблицы в обеих базах пересоздаются
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+TEST_READ_DATABASE_URL = os.environ.get('TEST_READ_DATABASE_URL')
+
+@pytest.mark.skipif(not (TEST_DATABASE_URL and TEST_READ_DATABASE_URL),
+                    reason="TEST_DATABASE_URL and TEST_READ_DATABASE_URL are not set")
+def test_routing_between_two_databases(monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from post_service import PostServicer
+
+    primary = create_engine(TEST_DATABASE_URL)
+    replica = create_engine(TEST_READ_DATABASE_URL)
+    for bind in (primary, replica):
+        Base.metadata.drop_all(bind)
+        Base.metadata.create_all(bind)
+    replicas = ReplicaSet([replica], max_lag=5, read_your_writes_window=10)
+    replicas.refresh()
+    monkeypatch.setattr('post_service.Session', sessionmaker(bind=primary))
+    monkeypatch.setattr('post_service.replicas', replicas)
+    # Кеш постов ответил бы на второе чтение без базы
+    monkeypatch.setattr('post_service.post_cache', None)
+    servicer = PostServicer()
+    context = MagicMock()
+
+    try:
+        post = servicer.CreatePost(post_service_pb2.CreatePostRequest(title="Post", description="Text", creator_id=1), context)
+
+        # Автор только что писал и читает с primary
+        assert servicer.GetPost(post_service_pb2.GetPostRequest(post_id=post.id, user_id=1), context).title == "Post"
+        # Остальные читают с реплики, где этой записи нет
+        other = MagicMock()
+        servicer.GetPost(post_service_pb2.GetPostRequest(post_id=post.id, user_id=2), other)
+        other.set_code.assert_called_once()
+    finally:
+        for bind in (primary, replica):
+            Base.metadata.drop_all(bind)
+            bind.dispose()
@@ -0,0 +1,74 @@
+import pytest
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SqliteSearchBackend, create_search_backend, PostgresSearchBackend, query_terms
+
+def make_post(post_id, title, description, creator_id=1, is_private=False):
+    return SimpleNamespace(id=post_id, title=title, description=description, creator_id=creator_id, is_private=is_private)
+
+@pytest.fixture
+def backend():
+    backend = SqliteSearchBackend()
+    backend.index_post(make_post(1, "Python tips", "Writing gRPC services"))
+    backend.index_post(make_post(2, "Cooking", "Pasta with python-shaped noodles"))
+    backend.index_post(make_post(3, "Secret python", "Private notes", creator_id=2, is_private=True))
+    backend.index_post(make_post(4, "Привет", "Пост на русском"))
+    return backend
+
+def ids(hits):
+    return [post_id for post_id, _ in hits]
+
+def test_title_matches_rank_first(backend):
+    assert ids(backend.search(None, 1, "python", 10)) == [1, 2]
+
+def test_private_posts_only_for_creator(backend):
+    assert 3 in ids(backend.search(None, 2, "python", 10))
+    assert 3 not in ids(backend.search(None, 1, "secret", 10))
+
+def test_all_terms_must_match(backend):
+    assert ids(backend.search(None, 1, "python grpc", 10)) == [1]
+
+def test_unicode_terms(backend):
+    assert ids(backend.search(None, 1, "русском", 10)) == [4]
+
+def test_fts_syntax_in_query_is_treated_as_text(backend):
+    # OR - обычное слово, которого нет ни в одном посте
+    assert backend.search(None, 1, 'python" OR "cooking', 10) == []
+    assert ids(backend.search(None, 1, 'pasta"', 10)) == [2]
+    assert backend.search(None, 1, '"*', 10) == []
+
+def test_cursor_pagination(backend):
+    for post_id in range(10, 20):
+        backend.index_post(make_post(post_id, "same", "same text"))
+
+    seen = []
+    cursor = None
+    while True:
+        hits = backend.search(None, 1, "same", 3, cursor)
+        seen += ids(hits)
+        if len(hits) < 3:
+            break
+        cursor = (hits[-1][1], hits[-1][0])
+
+    assert seen == list(range(19, 9, -1))
+
+def test_update_and_remove(backend):
+    backend.index_post(make_post(2, "Baking", "Bread"))
+    backend.remove_post(1)
+
+    assert ids(backend.search(None, 1, "python", 10)) == []
+    assert ids(backend.search(None, 1, "bread", 10)) == [2]
+
+def test_query_terms():
+    assert query_terms("Hello, world! C++") == ["hello", "world", "c"]
+    assert query_terms("  ...  ") == []
+
+def test_create_search_backend():
+    assert isinstance(create_search_backend('postgres'), PostgresSearchBackend)
+    assert isinstance(create_search_backend('sqlite://'), SqliteSearchBackend)
+    with pytest.raises(ValueError):
+        create_search_backend('elastic')
@@ -0,0 +1,68 @@
+import sys
+import os
+from unittest.mock import MagicMock, patch
+from sqlalchemy.dialects import postgresql
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timeline
+
+def make_session(added=True, count=1, pulled=False):
+    session = MagicMock()
+    session.execute.return_value.first.side_effect = [(2,) if added else None, (count, pulled)]
+    return session
+
+def statements(session):
+    return [str(call.args[0].compile(dialect=postgresql.dialect())) for call in session.execute.call_args_list]
+
+def test_follow_existing_is_noop():
+    session = make_session(added=False)
+
+    assert timeline.follow(session, 1, 2) is False
+    session.execute.assert_called_once()
+
+def test_follow_backfills_recent_posts():
+    session = make_session(count=5)
+
+    assert timeline.follow(session, 1, 2) is True
+
+    sql = statements(session)
+    assert "INSERT INTO follows" in sql[0] and "INSERT INTO follower_counts" in sql[1]
+    # Лента нового подписчика сразу получает последние посты автора
+    assert "INSERT INTO timeline_entries" in sql[2] and "ON CONFLICT DO NOTHING" in sql[2]
+
+def test_follow_promotes_author_at_limit():
+    session = make_session(count=3)
+
+    with patch('timeline.FANOUT_MAX_FOLLOWERS', 3):
+        timeline.follow(session, 1, 2)
+
+    sql = statements(session)
+    assert "UPDATE follows SET pulled" in sql[2] and "UPDATE follower_counts SET pulled" in sql[3]
+    assert not any("timeline_entries" in statement for statement in sql)
+
+def test_follow_pulled_author_marks_follow_only():
+    session = make_session(count=50000, pulled=True)
+
+    timeline.follow(session, 1, 2)
+
+    sql = statements(session)
+    assert len(sql) == 3
+    assert "UPDATE follows SET pulled" in sql[2] and "follows.follower_id" in sql[2]
+
+def test_unfollow_removes_author_from_timeline():
+    session = MagicMock()
+    session.execute.return_value.first.return_value = (2,)
+
+    assert timeline.unfollow(session, 1, 2) is True
+
+    sql = statements(session)
+    assert "DELETE FROM follows" in sql[0] and "UPDATE follower_counts" in sql[1]
+    assert "DELETE FROM timeline_entries" in sql[2] and "timeline_entries.author_id" in sql[2]
+
+def test_unfollow_missing_is_noop():
+    session = MagicMock()
+    session.execute.return_value.first.return_value = None
+
+    assert timeline.unfollow(session, 1, 2) is False
+    session.execute.assert_called_once()
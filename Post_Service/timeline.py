@@ -0,0 +1,102 @@
+import os
+from datetime import datetime
+from sqlalchemy import select, update, delete, literal, tuple_, text, Integer
+from sqlalchemy.dialects.postgresql import insert
+from database import Follow, FollowerCount, Post, TimelineEntry
+
+# С этим числом подписчиков автор становится pulled: его посты больше не рассылаются по лентам,
+# а читаются в HomeTimeline. Ограничивает работу одного CreatePost
+FANOUT_MAX_FOLLOWERS = int(os.environ.get('TIMELINE_FANOUT_MAX_FOLLOWERS', '10000'))
+# Сколько последних постов автора попадает в ленту нового подписчика
+FOLLOW_BACKFILL = int(os.environ.get('TIMELINE_FOLLOW_BACKFILL', '20'))
+
+# Строка счётчика автора заблокирована до коммита: новая подписка и перевод автора в pulled не перемешиваются
+COUNT_FOLLOWER = text(
+    "INSERT INTO follower_counts (user_id, count, pulled) VALUES (:user_id, 1, false) "
+    "ON CONFLICT (user_id) DO UPDATE SET count = follower_counts.count + 1 RETURNING count, pulled"
+)
+
+
+def publish_statement(posts, condition):
+    # posts - CTE изменённых постов в команде записи: рассылка идёт в той же команде, что и сам пост.
+    # Подписчикам pulled-автора пост не пишется, его прочитает HomeTimeline. Проверка через
+    # follower_counts идёт первой: подписчики такого автора не перебираются вовсе.
+    # Текстом по той же причине, что и counters.adjust_statement
+    return text(
+        "INSERT INTO timeline_entries (user_id, created_at, post_id, author_id) "
+        f"SELECT f.follower_id, p.created_at, p.id, p.creator_id FROM {posts.name} p "
+        "JOIN follower_counts c ON c.user_id = p.creator_id AND NOT c.pulled "
+        f"JOIN follows f ON f.followee_id = p.creator_id WHERE {condition}"
+    ).columns().cte('published')
+
+
+def unpublish_statement(posts, condition):
+    return text(
+        f"DELETE FROM timeline_entries t USING {posts.name} p WHERE t.post_id = p.id AND {condition}"
+    ).columns().cte('unpublished')
+
+
+def backfill_statement(follower_id, followee_id):
+    recent = select(
+        literal(follower_id, Integer), Post.created_at, Post.id, Post.creator_id
+    ).where(
+        Post.creator_id == followee_id, Post.is_private == False
+    ).order_by(Post.created_at.desc(), Post.id.desc()).limit(FOLLOW_BACKFILL)
+    return insert(TimelineEntry).from_select(
+        ['user_id', 'created_at', 'post_id', 'author_id'], recent
+    ).on_conflict_do_nothing()
+
+
+def promote(session, user_id):
+    # Один раз на автора: подписки помечаются, чтобы HomeTimeline находила его по ix_follows_pulled.
+    # Уже разосланные посты остаются в лентах, повторы убирает чтение
+    session.execute(update(Follow).where(Follow.followee_id == user_id).values(pulled=True))
+    session.execute(update(FollowerCount).where(FollowerCount.user_id == user_id).values(pulled=True))
+
+
+def follow(session, follower_id, followee_id):
+    # False - подписка уже была. Коммитит вызывающий
+    added = session.execute(
+        insert(Follow).values(
+            follower_id=follower_id, followee_id=followee_id, created_at=datetime.utcnow(), pulled=False
+        ).on_conflict_do_nothing().returning(Follow.followee_id)
+    ).first()
+    if added is None:
+        return False
+
+    count, pulled = session.execute(COUNT_FOLLOWER, {'user_id': followee_id}).first()
+    if pulled:
+        session.execute(update(Follow).where(
+            Follow.follower_id == follower_id, Follow.followee_id == followee_id
+        ).values(pulled=True))
+    elif count >= FANOUT_MAX_FOLLOWERS:
+        promote(session, followee_id)
+    else:
+        # Иначе лента нового подписчика до первого поста автора осталась бы без него
+        session.execute(backfill_statement(follower_id, followee_id))
+    return True
+
+
+def unfollow(session, follower_id, followee_id):
+    removed = session.execute(
+        delete(Follow).where(Follow.follower_id == follower_id, Follow.followee_id == followee_id)
+        .returning(Follow.followee_id)
+    ).first()
+    if removed is None:
+        return False
+
+    session.execute(update(FollowerCount).where(FollowerCount.user_id == followee_id).values(count=FollowerCount.count - 1))
+    session.execute(delete(TimelineEntry).where(TimelineEntry.user_id == follower_id, TimelineEntry.author_id == followee_id))
+    return True
+
+
+def follows_page(user_id, limit, cursor=None, followers=False):
+    # Подписки пользователя или его подписчики, сначала новые; курсор - (created_at, user_id)
+    if followers:
+        owner, other = Follow.followee_id, Follow.follower_id
+    else:
+        owner, other = Follow.follower_id, Follow.followee_id
+    query = select(other.label('user_id'), Follow.created_at).where(owner == user_id)
+    if cursor is not None:
+        query = query.where(tuple_(Follow.created_at, other) < cursor)
+    return query.order_by(Follow.created_at.desc(), other.desc()).limit(limit)